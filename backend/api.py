@@ -1,26 +1,222 @@
+# Harus paling awal: di mode eventlet (default) concurrency menjalankan monkey_patch()
+from concurrency import SERVER_MODE, spawn, sleep, WorkQueue, QueueEmpty, imap_pool
 import os
-import eventlet
-eventlet.monkey_patch()
 import time
 import re
 import uuid
 import traceback
 import secrets
+import json
+import base64
+import sqlite3
+import atexit
+import wave
+import hashlib
+import zlib
+import unicodedata
+import threading
+from collections import OrderedDict, deque
 from threading import Event
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
-from flask import Flask, render_template, request, jsonify, g, abort, redirect, url_for
+from flask import Flask, render_template, request, jsonify, g, abort, redirect, url_for, Response
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit
 from flask_sqlalchemy import SQLAlchemy
-from groq import Groq
 from dotenv import load_dotenv
 from werkzeug.exceptions import HTTPException
-from supabase import create_client, Client
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Subsistem di modul sendiri membaca konfigurasi env saat import, jadi di-import setelah load_dotenv()
+from metrics import METRICS_ENABLED, TOKENS_PER_SEC_BUCKETS, metrics
+from llm import (
+    LLM_EXPECTED_COMPLETION_TOKENS, LLM_HEDGE_COMPLETE_MS, LLM_HEDGE_MAX, LLM_HEDGE_TTFT_MS, LLM_ROUTES,
+    LLMGatewayBusy, LLMRoute, LLMRouter, _chunk_content, _close_stream, _is_rate_limit_error,
+    _retry_after_seconds, llm_gateway,
+)
+from outbox import SAVE_OUTBOX_ENABLED, SaveOutbox
+from search_index import (
+    SEARCH_BACKFILL_BATCH, SEARCH_BACKFILL_ON_START, SEARCH_INDEX_ENABLED, SEARCH_MAX_PAGE_SIZE,
+    SEARCH_PAGE_SIZE, SEARCH_RECONCILE_SECONDS, SearchIndex,
+)
+from audio import (
+    AUDIO_MAX_SAMPLE_RATE, AUDIO_MIN_SAMPLE_RATE, AudioSegment, TranscriptionPool, VoiceActivitySegmenter,
+    create_transcriber, parse_sample_rate, wav_to_pcm16,
+)
+
+# =========================
+# Lazy components (warmup & readiness)
+# =========================
+# Klien eksternal (JWKS, Supabase, Groq) dan DB share token tidak dibuat saat import: proses langsung
+# bisa menerima koneksi, tiap komponen dibuat saat pertama dipakai atau dipanaskan bersamaan di
+# background (components.start()). Komponen yang gagal dicoba lagi dengan backoff.
+# /healthz = liveness (proses hidup), /readyz = status warmup tiap komponen.
+COMPONENT_RETRY_SECONDS = float(os.getenv("COMPONENT_RETRY_SECONDS", "5"))
+COMPONENT_RETRY_MAX_SECONDS = float(os.getenv("COMPONENT_RETRY_MAX_SECONDS", "60"))
+# Komponen yang boleh belum siap tanpa membuat /readyz 503, mis. READYZ_OPTIONAL="supabase,jwks"
+READYZ_OPTIONAL = {c.strip() for c in os.getenv("READYZ_OPTIONAL", "").split(",") if c.strip()}
+PROCESS_STARTED_AT = time.time()
+
+class ComponentUnavailable(Exception):
+    """Komponen wajib (mis. DB share token) tidak bisa dibuat; dipetakan ke HTTP 503."""
+
+class LazyComponent:
+    """Resource yang dibuat sekali (single-flight) saat pertama dipakai, plus probe opsional saat warmup.
+
+    Atribut diteruskan ke objek aslinya sehingga `supabase.table(...)` tetap jalan. bool() hanya melihat
+    konfigurasi dan status, tidak pernah memicu inisialisasi (aman dipanggil dari event loop ASGI).
+    """
+
+    def __init__(self, name: str, factory, probe=None, configured: bool = True):
+        self.name = name
+        self.configured = configured
+        self.state = "cold" if configured else "disabled"  # cold | warming | initialized | ready | failed | disabled
+        self.error = None
+        self.attempts = 0
+        self.init_seconds = None
+        self.warm_seconds = None
+        self.ready_at = None
+        self._factory = factory
+        self._probe = probe
+        self._value = None
+        self._created = False
+        self._retry_at = 0.0
+        self._warm_started = None
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        return self.configured and (self._created or self.state != "failed")
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.require(), name)
+
+    def get(self):
+        """Objek aslinya (dibuat bila belum); None jika tidak dikonfigurasi atau pembuatan gagal."""
+        if self._created or not self.configured:
+            return self._value
+        with self._lock:
+            if not self._created and time.time() >= self._retry_at:
+                self._create()
+        return self._value
+
+    def require(self):
+        value = self.get()
+        if value is None:
+            raise ComponentUnavailable(f"{self.name}_unavailable: {self.error or 'not configured'}")
+        return value
+
+    def _create(self):
+        started = time.perf_counter()
+        try:
+            value = self._factory()
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            self.state = "failed"
+            self._retry_at = time.time() + COMPONENT_RETRY_SECONDS
+            print(f"[ERROR] {self.name} init failed: {e}")
+            return
+        self._value = value
+        self._created = True
+        self.error = None
+        self.init_seconds = time.perf_counter() - started
+        if self.state in ("cold", "failed"):
+            # dipakai sebelum warmup: tanpa probe langsung siap, dengan probe tunggu warm()
+            if self._probe is None:
+                self._mark_ready()
+            else:
+                self.state = "initialized"
+
+    def _mark_ready(self):
+        self.state = "ready"
+        if self.ready_at is None:
+            self.ready_at = time.time()
+
+    def warm(self) -> bool:
+        """Buat komponen lalu jalankan probe-nya; True jika siap."""
+        if not self.configured or self.state == "ready":
+            return True
+        started = time.perf_counter()
+        self.attempts += 1
+        self._warm_started = time.time()
+        self.state = "warming"
+        value = self.get()
+        if value is None:
+            self.state = "failed"
+            return False
+        if self._probe is not None:
+            try:
+                self._probe(value)
+            except Exception as e:
+                self.error = f"{type(e).__name__}: {e}"
+                self.state = "failed"
+                print(f"[ERROR] {self.name} warmup failed: {e}")
+                return False
+        self.error = None
+        self.warm_seconds = time.perf_counter() - started
+        self._mark_ready()
+        component_warm_seconds.observe(self.warm_seconds, component=self.name)
+        return True
+
+    def run_warmup(self):
+        delay = COMPONENT_RETRY_SECONDS
+        while not self.warm():
+            sleep(delay)
+            delay = min(delay * 2, COMPONENT_RETRY_MAX_SECONDS)
+
+    def stats(self) -> dict:
+        warming_for = None
+        if self.state == "warming" and self._warm_started:
+            warming_for = round(time.time() - self._warm_started, 3)
+        return {
+            "state": self.state,
+            "required": self.name not in READYZ_OPTIONAL,
+            "warm_seconds": round(self.warm_seconds, 3) if self.warm_seconds is not None else None,
+            "init_seconds": round(self.init_seconds, 3) if self.init_seconds is not None else None,
+            "warming_for_seconds": warming_for,
+            "attempts": self.attempts,
+            "error": self.error,
+        }
+
+class ComponentRegistry:
+    def __init__(self):
+        self.components = OrderedDict()
+        self._started = False
+
+    def add(self, name: str, factory, probe=None, configured: bool = True) -> LazyComponent:
+        component = self.components[name] = LazyComponent(name, factory, probe, configured)
+        return component
+
+    def start(self):
+        """Panaskan semua komponen bersamaan di background; tidak menunggu hasilnya."""
+        if self._started:
+            return
+        self._started = True
+        for component in self.components.values():
+            if component.configured:
+                spawn(component.run_warmup)
+
+    def not_ready(self) -> list:
+        return [c.name for c in self.components.values()
+                if c.state not in ("ready", "disabled") and c.name not in READYZ_OPTIONAL]
+
+    def readiness(self) -> dict:
+        pending = self.not_ready()
+        ready_times = [c.ready_at for c in self.components.values() if c.ready_at is not None]
+        return {
+            "ready": not pending,
+            "not_ready": pending,
+            "uptime_seconds": round(time.time() - PROCESS_STARTED_AT, 3),
+            # waktu dari start proses sampai komponen terakhir siap
+            "ready_after_seconds": round(max(ready_times) - PROCESS_STARTED_AT, 3) if not pending and ready_times else None,
+            "components": {name: c.stats() for name, c in self.components.items()},
+        }
+
+components = ComponentRegistry()
+
 # =========================
 # Supabase JWT verification (HS256 or RS256)
 # =========================
@@ -43,15 +239,70 @@ if SUPABASE_URL:
 else:
     print("[WARN] SUPABASE_URL is NOT set in environment variables")
 
-# Initialize JWKS client only if SUPABASE_URL is set
-_jwks_client = None
-if SUPABASE_URL and JWKS_URL:
+# JWKS client hanya jika SUPABASE_URL diset; dibuat lazy, warmup = fetch kunci pertama
+def _warm_jwks(_client):
+    _schedule_jwks_refresh()
+    _jwks_refresh_done.wait()
+    if not _jwks_keys:
+        raise Exception("jwks_empty: no signing keys fetched")
+
+_jwks_client = components.add("jwks", lambda: PyJWKClient(JWKS_URL), probe=_warm_jwks,
+                              configured=bool(SUPABASE_URL and JWKS_URL))
+
+# JWKS di-prefetch dan di-refresh di background; verifikasi hanya membaca dict lokal ini.
+JWKS_REFRESH_SECONDS = float(os.getenv("JWKS_REFRESH_SECONDS", "600"))
+JWKS_MISS_WAIT = float(os.getenv("JWKS_MISS_WAIT", "1.0"))
+_jwks_keys = {}                  # {kid: public key}
+_jwks_refresh_done = Event()     # di-set setiap kali refresh selesai
+_jwks_refresh_lock = threading.Lock()
+_jwks_refreshing = False
+_jwks_last_refresh = 0.0
+
+def _refresh_jwks():
+    global _jwks_keys, _jwks_refreshing, _jwks_last_refresh
     try:
-        _jwks_client = PyJWKClient(JWKS_URL)
+        keys = _jwks_client.get_signing_keys(refresh=True)
+        _jwks_keys = {k.key_id: k.key for k in keys if k.key_id}
+        _jwks_last_refresh = time.time()
     except Exception as e:
-        print(f"[WARN] Failed to initialize JWKS client: {e}")
+        print(f"[WARN] JWKS refresh failed: {e}")
+    finally:
+        with _jwks_refresh_lock:
+            _jwks_refreshing = False
+        _jwks_refresh_done.set()
 
-def verify_supabase_jwt(token: str):
+def _schedule_jwks_refresh():
+    """Mulai satu refresh JWKS di background (single-flight)."""
+    global _jwks_refreshing
+    with _jwks_refresh_lock:
+        if _jwks_refreshing:
+            return
+        _jwks_refreshing = True
+        _jwks_refresh_done.clear()
+    spawn(_refresh_jwks)
+
+def _jwks_refresh_loop():
+    # fetch pertama dilakukan warmup komponen "jwks"
+    while True:
+        sleep(JWKS_REFRESH_SECONDS)
+        _schedule_jwks_refresh()
+
+def _jwks_signing_key(kid: str):
+    key = _jwks_keys.get(kid)
+    if key is not None:
+        return key
+    # kid belum dikenal (rotasi kunci / awal start): minta refresh, tunggu sebentar saja
+    _schedule_jwks_refresh()
+    _jwks_refresh_done.wait(JWKS_MISS_WAIT)
+    key = _jwks_keys.get(kid)
+    if key is None:
+        raise Exception(f"signing_key_unavailable: kid={kid}")
+    return key
+
+if _jwks_client:
+    spawn(_jwks_refresh_loop)
+
+def _verify_supabase_jwt_uncached(token: str):
     """
     Deteksi algoritma dari header token:
     - RS256  -> verifikasi dengan JWKS publik
@@ -68,7 +319,7 @@ def verify_supabase_jwt(token: str):
         if not _jwks_client:
             raise Exception("RS256_not_available: SUPABASE_URL not set or JWKS client not initialized")
         try:
-            key = _jwks_client.get_signing_key_from_jwt(token).key
+            key = _jwks_signing_key(header.get("kid"))
             return jwt.decode(
                 token,
                 key,
@@ -103,6 +354,68 @@ def verify_supabase_jwt(token: str):
         raise Exception(f"unsupported_jwt_alg:{alg or 'unknown'}")
 
 
+# Cache klaim yang sudah terverifikasi: {sha256(token): (exp, claims)}, dibuang saat exp.
+JWT_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", "2048"))
+_jwt_cache = OrderedDict()
+_jwt_cache_lock = threading.Lock()
+jwt_stats = {
+    "cache_hits": 0,
+    "cache_misses": 0,
+    "cache_evictions": 0,
+    "verify_failures": 0,
+    "verify_count": 0,
+    "verify_seconds_total": 0.0,
+    "verify_seconds_max": 0.0,
+}
+
+def verify_supabase_jwt(token: str):
+    digest = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    now = time.time()
+    with _jwt_cache_lock:
+        item = _jwt_cache.get(digest)
+        if item is not None:
+            if item[0] > now:
+                _jwt_cache.move_to_end(digest)
+                jwt_stats["cache_hits"] += 1
+                return dict(item[1])
+            del _jwt_cache[digest]
+            jwt_stats["cache_evictions"] += 1
+        jwt_stats["cache_misses"] += 1
+
+    started = time.perf_counter()
+    try:
+        claims = _verify_supabase_jwt_uncached(token)
+    except Exception:
+        with _jwt_cache_lock:
+            jwt_stats["verify_failures"] += 1
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        with _jwt_cache_lock:
+            jwt_stats["verify_count"] += 1
+            jwt_stats["verify_seconds_total"] += elapsed
+            jwt_stats["verify_seconds_max"] = max(jwt_stats["verify_seconds_max"], elapsed)
+
+    exp = claims.get("exp")
+    if isinstance(exp, (int, float)) and exp > now:
+        with _jwt_cache_lock:
+            _jwt_cache[digest] = (float(exp), dict(claims))
+            _jwt_cache.move_to_end(digest)
+            while len(_jwt_cache) > JWT_CACHE_SIZE:
+                _jwt_cache.popitem(last=False)
+                jwt_stats["cache_evictions"] += 1
+    return claims
+
+def jwt_cache_stats():
+    with _jwt_cache_lock:
+        stats = dict(jwt_stats, entries=len(_jwt_cache), max_entries=JWT_CACHE_SIZE)
+    count = stats["verify_count"]
+    stats["verify_seconds_avg"] = stats["verify_seconds_total"] / count if count else 0.0
+    stats["jwks_keys"] = len(_jwks_keys)
+    stats["jwks_last_refresh"] = datetime.utcfromtimestamp(_jwks_last_refresh).isoformat() + "Z" if _jwks_last_refresh else None
+    return stats
+
+
 def require_auth(fn):
     from functools import wraps
     @wraps(fn)
@@ -126,30 +439,488 @@ def require_auth(fn):
         return fn(*args, **kwargs)
     return wrapper
 
+# User (email atau sub) yang boleh membaca endpoint operasional /api/.../stats, dipisah koma.
+# Kosong = tidak ada yang boleh; angka yang sama tetap tersedia lewat /metrics.
+ADMIN_USERS = {u.strip().lower() for u in os.getenv("ADMIN_USERS", "").split(",") if u.strip()}
+
+def require_admin(fn):
+    """Seperti require_auth, tetapi user juga harus tercantum di ADMIN_USERS (selain itu 403)."""
+    from functools import wraps
+    @wraps(fn)
+    @require_auth
+    def wrapper(*args, **kwargs):
+        if os.getenv("DEV_BYPASS_AUTH") != "1":
+            identities = {str(g.user.get(k) or "").lower() for k in ("sub", "email")}
+            if not ADMIN_USERS & identities:
+                abort(403)
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+
+# =========================
+# Shared state (multi-worker)
+# =========================
+# Tanpa REDIS_URL semua state tetap di memori proses (satu worker). Dengan REDIS_URL, sesi socket,
+# mode ringkasan, hitungan view share, sinyal stop, dan invalidasi cache shared dibagi lewat Redis
+# (atau server kompatibel: Valkey, KeyDB, ...) sehingga beberapa worker eventlet bisa berjalan berdampingan.
+REDIS_URL = os.getenv("REDIS_URL", "")
+SOCKETIO_MESSAGE_QUEUE = os.getenv("SOCKETIO_MESSAGE_QUEUE", REDIS_URL) or None
+STATE_KEY_PREFIX = os.getenv("STATE_KEY_PREFIX", "notaku")
+
+STATE_ORIGIN = uuid.uuid4().hex  # id proses ini; pesan pub/sub miliknya sendiri diabaikan subscriber
+
+class MemoryStateStore:
+    """State per proses; pub/sub hanya memanggil subscriber lokal."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}         # {(ns, key): (expires_at | None, value)}
+        self._lists = {}        # {ns: deque}
+        self._subscribers = {}  # {channel: [handler]}
+        self._next_purge = 0.0
+
+    def get(self, ns: str, key: str, default=None):
+        with self._lock:
+            item = self._data.get((ns, key))
+            if item is None:
+                return default
+            if item[0] is not None and item[0] <= time.time():
+                del self._data[(ns, key)]
+                return default
+            return item[1]
+
+    def set(self, ns: str, key: str, value, ttl: float = None):
+        with self._lock:
+            self._purge_locked()
+            self._data[(ns, key)] = (time.time() + ttl if ttl else None, value)
+
+    def set_default(self, ns: str, key: str, value, ttl: float = None):
+        """Set hanya jika key belum ada (SET NX); kembalikan nilai yang berlaku."""
+        now = time.time()
+        with self._lock:
+            item = self._data.get((ns, key))
+            if item is not None and (item[0] is None or item[0] > now):
+                return item[1]
+            self._purge_locked()
+            self._data[(ns, key)] = (now + ttl if ttl else None, value)
+            return value
+
+    def incr(self, ns: str, key: str, amount: int = 1, ttl: float = None) -> int:
+        now = time.time()
+        with self._lock:
+            item = self._data.get((ns, key))
+            value = item[1] if item is not None and (item[0] is None or item[0] > now) else 0
+            value += amount
+            self._data[(ns, key)] = (now + ttl if ttl else None, value)
+            return value
+
+    def _purge_locked(self):
+        # Entri ber-TTL yang tidak pernah dibaca lagi dibuang berkala
+        now = time.time()
+        if now < self._next_purge:
+            return
+        self._next_purge = now + 60
+        for k in [k for k, (exp, _) in self._data.items() if exp is not None and exp <= now]:
+            del self._data[k]
+
+    def delete(self, ns: str, key: str):
+        with self._lock:
+            item = self._data.pop((ns, key), None)
+        return item[1] if item else None
+
+    def keys(self, ns: str):
+        now = time.time()
+        with self._lock:
+            return [k for (n, k), (exp, _) in self._data.items() if n == ns and (exp is None or exp > now)]
+
+    def push(self, ns: str, value, max_len: int = 1000):
+        with self._lock:
+            self._lists.setdefault(ns, deque(maxlen=max_len)).appendleft(value)
+
+    def items(self, ns: str):
+        with self._lock:
+            return list(self._lists.get(ns, ()))
+
+    def publish(self, channel: str, message: dict):
+        for handler in list(self._subscribers.get(channel, ())):
+            handler(message)
+
+    def subscribe(self, channel: str, handler):
+        self._subscribers.setdefault(channel, []).append(handler)
+
+class RedisStateStore:
+    """State bersama antar worker di Redis; nilai disimpan sebagai JSON di key `<prefix>:<ns>:<key>`."""
+
+    def __init__(self, url: str, prefix: str = "notaku"):
+        import redis  # opsional, hanya diperlukan untuk mode multi-worker
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+
+    def _key(self, ns: str, key: str = None) -> str:
+        return f"{self.prefix}:{ns}" if key is None else f"{self.prefix}:{ns}:{key}"
+
+    def get(self, ns: str, key: str, default=None):
+        raw = self.redis.get(self._key(ns, key))
+        return default if raw is None else json.loads(raw)
+
+    def set(self, ns: str, key: str, value, ttl: float = None):
+        self.redis.set(self._key(ns, key), json.dumps(value), ex=max(1, int(ttl)) if ttl else None)
+
+    def set_default(self, ns: str, key: str, value, ttl: float = None):
+        pipe = self.redis.pipeline()
+        pipe.set(self._key(ns, key), json.dumps(value), ex=max(1, int(ttl)) if ttl else None, nx=True)
+        pipe.get(self._key(ns, key))
+        _, raw = pipe.execute()
+        return value if raw is None else json.loads(raw)
+
+    def incr(self, ns: str, key: str, amount: int = 1, ttl: float = None) -> int:
+        pipe = self.redis.pipeline()
+        pipe.incrby(self._key(ns, key), amount)
+        if ttl:
+            pipe.expire(self._key(ns, key), max(1, int(ttl)))
+        return int(pipe.execute()[0])
+
+    def delete(self, ns: str, key: str):
+        pipe = self.redis.pipeline()
+        pipe.get(self._key(ns, key))
+        pipe.delete(self._key(ns, key))
+        raw, _ = pipe.execute()
+        return None if raw is None else json.loads(raw)
+
+    def keys(self, ns: str):
+        start = len(self._key(ns, ""))
+        return [k[start:] for k in self.redis.scan_iter(match=self._key(ns, "*"), count=500)]
+
+    def push(self, ns: str, value, max_len: int = 1000):
+        pipe = self.redis.pipeline()
+        pipe.lpush(self._key(ns), json.dumps(value))
+        pipe.ltrim(self._key(ns), 0, max_len - 1)
+        pipe.execute()
+
+    def items(self, ns: str):
+        return [json.loads(v) for v in self.redis.lrange(self._key(ns), 0, -1)]
+
+    def publish(self, channel: str, message: dict):
+        self.redis.publish(self._key("channel", channel), json.dumps(message))
+
+    def subscribe(self, channel: str, handler):
+        def listen():
+            while True:
+                try:
+                    pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                    pubsub.subscribe(self._key("channel", channel))
+                    for msg in pubsub.listen():
+                        handler(json.loads(msg["data"]))
+                except Exception as e:
+                    print(f"[WARN] state subscribe {channel} terputus: {e}")
+                    sleep(1)
+
+        spawn(listen)
+
+class SharedList:
+    def __init__(self, store, ns: str, max_len: int = 1000):
+        self.store = store
+        self.ns = ns
+        self.max_len = max_len
+
+    def append(self, value):
+        self.store.push(self.ns, value, self.max_len)
+
+    def __iter__(self):
+        return iter(self.store.items(self.ns))
+
+    def __len__(self):
+        return len(self.store.items(self.ns))
+
+def _create_state_store():
+    if REDIS_URL:
+        try:
+            store = RedisStateStore(REDIS_URL, STATE_KEY_PREFIX)
+            store.redis.ping()
+            print("[OK] Shared state memakai Redis.")
+            return store
+        except Exception as e:
+            print(f"[WARN] Redis state store tidak tersedia ({e}); pakai state in-memory (satu worker).")
+    return MemoryStateStore()
+
+state_store = _create_state_store()
+
+
+# =========================
+# Socket session registry
+# =========================
+# Satu record kecil (slots) per socket: klaim yang dipakai handler (sub, email, exp) plus Event stop
+# untuk stream yang sedang berjalan. Record dibuang saat token exp, setelah idle, atau saat kapasitas
+# penuh (LRU), jadi memori proses yang berjalan lama tidak terus tumbuh.
+SOCKET_SESSION_MAX = int(os.getenv("SOCKET_SESSION_MAX", "10000"))
+SOCKET_SESSION_IDLE_SECONDS = float(os.getenv("SOCKET_SESSION_IDLE_SECONDS", str(6 * 3600)))
+SOCKET_STREAM_MAX_SECONDS = float(os.getenv("SOCKET_STREAM_MAX_SECONDS", "900"))
+SOCKET_SESSION_SWEEP_SECONDS = float(os.getenv("SOCKET_SESSION_SWEEP_SECONDS", "30"))
+DEV_SOCKET_CLAIMS = {"sub": "dev-user", "email": "dev@example.com"}
+
+class SocketSession:
+    __slots__ = ("sub", "email", "exp", "last_seen", "synced_at", "stop", "stream_started")
+
+    def __init__(self, sub=None, email=None, exp=None):
+        self.sub = sub
+        self.email = email
+        self.exp = exp
+        self.last_seen = time.time()
+        self.synced_at = 0.0
+        self.stop = None
+        self.stream_started = 0.0
+
+    def is_authed(self, now: float = None) -> bool:
+        return self.sub is not None and (self.exp is None or self.exp > (now or time.time()))
+
+    def claims(self) -> dict:
+        return {"sub": self.sub, "email": self.email, "exp": self.exp}
+
+class SocketSessionRegistry:
+    """
+    Registry sesi socket per worker. Dengan state store bersama (Redis), klaim juga ditulis ke store
+    dengan TTL = min(sisa umur token, idle) agar terlihat oleh worker lain dan kedaluwarsa sendiri.
+    """
+
+    def __init__(self, store, max_sessions: int, idle_seconds: float, stream_max_seconds: float):
+        self.store = store
+        self.shared = not isinstance(store, MemoryStateStore)
+        self.max_sessions = max(1, max_sessions)
+        self.idle_seconds = idle_seconds
+        self.stream_max_seconds = stream_max_seconds
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()  # {sid: SocketSession}, paling lama tidak aktif di depan
+        self.evicted_expired = 0
+        self.evicted_idle = 0
+        self.evicted_capacity = 0
+        self.stale_streams = 0
+        self.on_evict = None  # on_evict(sids): buang state per-socket lain (rolling, audio) milik sesi yang disapu
+
+    def _ttl(self, session: SocketSession, now: float) -> float:
+        ttl = self.idle_seconds
+        if session.exp is not None:
+            ttl = min(ttl, session.exp - now)
+        return ttl
+
+    def _sync(self, sid, session: SocketSession, now: float):
+        if not self.shared:
+            return
+        ttl = self._ttl(session, now)
+        try:
+            if ttl > 0:
+                self.store.set("socket_sessions", sid, session.claims(), ttl=ttl)
+            else:
+                self.store.delete("socket_sessions", sid)
+            session.synced_at = now
+        except Exception as e:
+            print(f"[WARN] socket session sync gagal: {e}")
+
+    def _evict_for_capacity_locked(self):
+        while len(self._sessions) >= self.max_sessions:
+            # Utamakan membuang sesi tanpa stream aktif
+            victim = next((sid for sid, s in self._sessions.items() if s.stop is None), None)
+            if victim is None:
+                victim = next(iter(self._sessions))
+            session = self._sessions.pop(victim)
+            if session.stop is not None:
+                session.stop.set()
+            self.evicted_capacity += 1
+
+    def _session_locked(self, sid, now: float) -> SocketSession:
+        session = self._sessions.get(sid)
+        if session is None:
+            self._evict_for_capacity_locked()
+            session = self._sessions[sid] = SocketSession()
+        else:
+            self._sessions.move_to_end(sid)
+        session.last_seen = now
+        return session
+
+    def authenticate(self, sid, claims: dict) -> SocketSession:
+        """Simpan hanya klaim yang dipakai handler socket (bukan seluruh payload JWT)."""
+        now = time.time()
+        exp = claims.get("exp")
+        with self._lock:
+            session = self._session_locked(sid, now)
+            session.sub = claims.get("sub")
+            session.email = claims.get("email")
+            session.exp = float(exp) if exp is not None else None
+        self._sync(sid, session, now)
+        return session
+
+    def get(self, sid):
+        """Sesi terautentikasi untuk sid, atau None (token kedaluwarsa dianggap tidak login)."""
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(sid)
+            if session is not None:
+                if not session.is_authed(now):
+                    return None
+                self._sessions.move_to_end(sid)
+                session.last_seen = now
+        if session is None:
+            if not self.shared:
+                return None
+            try:
+                claims = self.store.get("socket_sessions", sid)
+            except Exception:
+                claims = None
+            if not claims:
+                return None
+            session = self.authenticate(sid, claims)
+            return session if session.is_authed(now) else None
+        if self.shared and now - session.synced_at > self.idle_seconds / 2:
+            self._sync(sid, session, now)
+        return session
+
+    def is_authed(self, sid) -> bool:
+        return self.get(sid) is not None
+
+    def touch(self, sid):
+        """Tandai aktif tanpa cek token (mis. potongan audio) agar sweep tidak menganggapnya idle."""
+        with self._lock:
+            session = self._sessions.get(sid)
+            if session is not None:
+                self._sessions.move_to_end(sid)
+                session.last_seen = time.time()
+
+    def start_stream(self, sid) -> Event:
+        now = time.time()
+        stop_evt = Event()
+        with self._lock:
+            session = self._session_locked(sid, now)
+            if session.stop is not None:
+                session.stop.set()  # stream lama untuk socket yang sama dihentikan
+            session.stop = stop_evt
+            session.stream_started = now
+        return stop_evt
+
+    def end_stream(self, sid, stop_evt: Event):
+        with self._lock:
+            session = self._sessions.get(sid)
+            if session is not None and session.stop is stop_evt:
+                session.stop = None
+
+    def stop_event(self, sid):
+        with self._lock:
+            session = self._sessions.get(sid)
+            return session.stop if session is not None else None
+
+    def remove(self, sid):
+        with self._lock:
+            session = self._sessions.pop(sid, None)
+        if session is not None and session.stop is not None:
+            session.stop.set()
+        if self.shared:
+            try:
+                self.store.delete("socket_sessions", sid)
+            except Exception:
+                pass
+
+    def sweep(self) -> int:
+        """Buang sesi kedaluwarsa/idle dan hentikan stream yang berjalan melewati batas."""
+        now = time.time()
+        removed = []
+        with self._lock:
+            for sid, session in list(self._sessions.items()):
+                if session.stop is not None:
+                    if now - session.stream_started > self.stream_max_seconds:
+                        session.stop.set()
+                        session.stop = None
+                        self.stale_streams += 1
+                    else:
+                        continue
+                if session.sub is not None and not session.is_authed(now):
+                    del self._sessions[sid]
+                    self.evicted_expired += 1
+                    removed.append(sid)
+                elif now - session.last_seen > self.idle_seconds:
+                    del self._sessions[sid]
+                    self.evicted_idle += 1
+                    removed.append(sid)
+        if removed and self.on_evict is not None:
+            self.on_evict(removed)
+        return len(removed)
+
+    def run(self):
+        while True:
+            sleep(SOCKET_SESSION_SWEEP_SECONDS)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"[WARN] socket session sweep gagal: {e}")
+
+    def stats(self):
+        with self._lock:
+            now = time.time()
+            sessions = list(self._sessions.values())
+        return {
+            "sessions": len(sessions),
+            "authed": sum(1 for s in sessions if s.is_authed(now)),
+            "streams": sum(1 for s in sessions if s.stop is not None),
+            "max_sessions": self.max_sessions,
+            "idle_seconds": self.idle_seconds,
+            "shared": self.shared,
+            "evicted_expired": self.evicted_expired,
+            "evicted_idle": self.evicted_idle,
+            "evicted_capacity": self.evicted_capacity,
+            "stale_streams_stopped": self.stale_streams,
+        }
+
+socket_sessions = SocketSessionRegistry(
+    state_store, SOCKET_SESSION_MAX, SOCKET_SESSION_IDLE_SECONDS, SOCKET_STREAM_MAX_SECONDS)
+spawn(socket_sessions.run)
 
 
 # =========================
 # Helpers & Store
 # =========================
-history_store = []        # in-memory history
-authed_sids = {}          # {sid: jwt_payload}
-stop_flags = {}           # {sid: Event}
-current_summary_mode = "rapat"  # default
+history_store = SharedList(state_store, "history")  # history
+rolling_states = {}       # {sid: RollingTranscript} - lokal di worker pemilik socket
+DEFAULT_SUMMARY_MODE = "rapat"
+
+def get_current_summary_mode() -> str:
+    return state_store.get("settings", "summary_mode", DEFAULT_SUMMARY_MODE)
+
+def request_stop(sid) -> bool:
+    """Hentikan stream milik sid, termasuk bila stream berjalan di worker lain."""
+    evt = socket_sessions.stop_event(sid)
+    if evt is not None:
+        evt.set()
+        return True
+    state_store.publish("stop", {"sid": sid})
+    return False
+
+def _on_remote_stop(message):
+    evt = socket_sessions.stop_event((message or {}).get("sid"))
+    if evt is not None:
+        evt.set()
+
+state_store.subscribe("stop", _on_remote_stop)
 
 def _now_iso():
     return datetime.utcnow().isoformat() + "Z"
 
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def parse_timestamp(value):
+    """
+    Timestamp ISO dari /save ("...Z") maupun Supabase ("...+00:00", presisi pecahan detik berbeda) sebagai
+    datetime UTC yang bisa dibandingkan; naive dianggap UTC. None jika kosong atau tidak valid.
+    """
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt.astimezone(timezone.utc)
+
 def strip_think(text: str) -> str:
     return re.sub(r"<think>.*?</think>", "", text, flags=re.DOTALL | re.IGNORECASE).strip()
 
-def build_prompt(text: str, mode: str = "rapat") -> str:
-    mode = (mode or "rapat").lower()
-    return f"""
-Anda adalah seorang notulis rapat yang berpengalaman.
-Langsung berikan notulensi final saja, tanpa proses berpikir.
-Ikuti format:
-
-**Notulensi Rapat**
+NOTULENSI_FORMAT = """**Notulensi Rapat**
 
 **Topik Pembahasan:**
 - ...
@@ -171,7 +942,16 @@ Ikuti format:
 - ...
 
 **Catatan Tambahan:**
-- ...
+- ..."""
+
+def build_prompt(text: str, mode: str = "rapat") -> str:
+    mode = (mode or "rapat").lower()
+    return f"""
+Anda adalah seorang notulis rapat yang berpengalaman.
+Langsung berikan notulensi final saja, tanpa proses berpikir.
+Ikuti format:
+
+{NOTULENSI_FORMAT}
 
 Aturan ketat:
 - Hanya ekstrak fakta yang ada pada teks sumber (transkripsi rapat).
@@ -186,139 +966,1541 @@ Teks sumber (transkripsi rapat):
 Notulensi:
 """
 
-def _parse_retry_after_seconds(message: str):
-    try:
-        m = re.search(r"in\s+(?:(\d+)m)?(\d+(?:\.\d+)?)s", message)
-        if not m:
-            return None
-        minutes = float(m.group(1)) if m.group(1) else 0.0
-        seconds = float(m.group(2))
-        return minutes * 60.0 + seconds
-    except Exception:
-        return None
+# =========================
+# Metrics (Prometheus)
+# =========================
+# Registry dan tipe metric di metrics.py; di sini metric HTTP, panggilan LLM, dan gauge state proses.
+http_request_seconds = metrics.histogram(
+    "notaku_http_request_duration_seconds", "Latency request HTTP per route.", ("method", "route", "status"))
+llm_ttft_seconds = metrics.histogram(
+    "notaku_llm_time_to_first_token_seconds",
+    "Waktu dari request ke Groq sampai token pertama (non-streaming: sampai respons lengkap).", ("endpoint",))
+llm_generation_seconds = metrics.histogram(
+    "notaku_llm_generation_seconds", "Total waktu generate Groq sampai token terakhir.", ("endpoint",))
+llm_tokens_per_second = metrics.histogram(
+    "notaku_llm_tokens_per_second", "Kecepatan output Groq (completion tokens per detik).", ("endpoint",),
+    buckets=TOKENS_PER_SEC_BUCKETS)
+llm_completion_tokens = metrics.counter(
+    "notaku_llm_completion_tokens_total", "Jumlah completion token dari Groq.", ("endpoint",))
+llm_requests = metrics.counter(
+    "notaku_llm_requests_total", "Panggilan ke Groq per hasil (ok, error, cancelled).", ("endpoint", "outcome"))
+llm_retries = metrics.counter(
+    "notaku_llm_retries_total", "Retry di loop _chat_complete per alasan.", ("endpoint", "reason"))
+llm_rate_limited = metrics.counter(
+    "notaku_llm_rate_limited_total", "Respons rate limit dari Groq (termasuk yang di-retry).", ("endpoint",))
+stream_frames = metrics.counter(
+    "notaku_stream_frames_total", "Frame token summary_stream yang dikirim ke klien.", ("endpoint",))
+share_db_seconds = metrics.histogram(
+    "notaku_share_token_db_seconds", "Durasi query ke database share token per operasi.", ("operation",))
+metrics.gauge("notaku_active_streams", "Stream ringkasan yang sedang berjalan.", lambda: socket_sessions.stats()["streams"])
+metrics.gauge("notaku_authed_sockets", "Socket yang sudah terautentikasi.", lambda: socket_sessions.stats()["authed"])
+metrics.gauge("notaku_socket_sessions", "Record sesi socket di registry worker ini.", lambda: socket_sessions.stats()["sessions"])
+metrics.gauge("notaku_rolling_transcripts", "State transkrip rolling yang aktif.", lambda: len(rolling_states))
+metrics.gauge("notaku_llm_gateway_active", "Slot LLM gateway yang sedang dipakai.", lambda: llm_gateway.stats()["active"])
+metrics.gauge("notaku_llm_gateway_waiting", "Request yang menunggu di antrian LLM gateway.", lambda: llm_gateway.stats()["waiting"])
+
+def observe_llm_call(endpoint: str, started: float, first_token_at: float = None, completion_tokens: int = 0):
+    """Catat TTFT, total waktu generate, dan tokens/detik untuk satu panggilan Groq yang selesai."""
+    ended = time.perf_counter()
+    total = ended - started
+    first_token_at = ended if first_token_at is None else first_token_at
+    llm_ttft_seconds.observe(first_token_at - started, endpoint=endpoint)
+    llm_generation_seconds.observe(total, endpoint=endpoint)
+    llm_requests.inc(endpoint=endpoint, outcome="ok")
+    if completion_tokens:
+        llm_completion_tokens.inc(completion_tokens, endpoint=endpoint)
+        # Streaming: kecepatan decode setelah token pertama; non-streaming: seluruh durasi
+        decode = ended - first_token_at if ended - first_token_at > 0.001 else total
+        if decode > 0:
+            llm_tokens_per_second.observe(completion_tokens / decode, endpoint=endpoint)
 
 
 # =========================
-# Config & Init
+# LLM calls (gateway + router)
 # =========================
+# Gateway, rate limiter, dan router ada di llm.py; di sini panggilan non-streaming yang dipakai
+# endpoint (summarize, map, reduce, rolling_segment) beserta retry dan metrics-nya.
+def _chat_complete(prompt: str, user_id: str = None, stop_evt=None, endpoint: str = "summarize") -> str:
+    """
+    Panggilan non-streaming ke Groq lewat gateway, dengan retry singkat untuk rate limit / koneksi.
+    endpoint hanya dipakai sebagai label metrics (summarize, map, reduce, rolling_segment).
+    """
+    return _chat_complete_routed(prompt, user_id, stop_evt, endpoint)[1]
 
-# Tambahkan koneksi Supabase
-from supabase import create_client, Client
-SUPABASE_URL = os.getenv("SUPABASE_URL", "").rstrip("/")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY", "")
-supabase: Client | None = None
-if SUPABASE_URL and SUPABASE_KEY:
-    try:
-        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-        # Tes koneksi singkat ke tabel "documents"
+def _chat_complete_routed(prompt: str, user_id: str = None, stop_evt=None, endpoint: str = "summarize"):
+    """Seperti _chat_complete, tetapi kembalikan (model yang menjawab, teks); model None jika dihentikan."""
+    # Kurangi retry agar tidak menunggu terlalu lama
+    max_retries, base_sleep, attempt = 1, 1.5, 0
+    while True:
         try:
-            res = supabase.table("documents").select("*").limit(1).execute()
-            print("[OK] Koneksi Supabase berhasil.")
+            with llm_gateway.slot(user_id, stop_evt=stop_evt):
+                started = time.perf_counter()
+                route, resp = llm_router.complete(prompt, stop_evt=stop_evt)
+            if resp is None:
+                return None, ""  # dihentikan sebelum ada jawaban
+            usage = getattr(resp, "usage", None)
+            observe_llm_call(endpoint, started, completion_tokens=getattr(usage, "completion_tokens", 0) or 0)
+            return route.model, strip_think((resp.choices[0].message.content or "").strip())
+        except LLMGatewayBusy:
+            raise
         except Exception as e:
-            print(f"[ERROR] Gagal konek Supabase: {e}")
-    except Exception as e:
-        print(f"[ERROR] Supabase init failed: {e}")
-else:
-    print("Supabase credentials not set; supabase client disabled")
-
-GROQ_API_KEY = os.environ.get("GROQ_API_KEY", "")
-# Pakai model yang lebih cepat secara default
-MODEL = os.environ.get("GROQ_MODEL", "llama-3.1-8b-instant")
-client = Groq(api_key=GROQ_API_KEY) if GROQ_API_KEY else None
+            msg = str(e).lower()
+            is_rate = _is_rate_limit_error(e)
+            is_conn = any(k in msg for k in ["connection", "timeout", "temporarily"])
+            retry_after = _retry_after_seconds(e) or base_sleep
+            attempt += 1
+            if is_rate:
+                llm_rate_limited.inc(endpoint=endpoint)
+            if (is_rate or is_conn) and attempt <= max_retries:
+                llm_retries.inc(endpoint=endpoint, reason="rate_limit" if is_rate else "connection")
+                # Tunggu kooperatif di luar slot gateway agar request lain tetap jalan
+                sleep(retry_after * (2 ** (attempt - 1)))
+                continue
+            llm_requests.inc(endpoint=endpoint, outcome="error")
+            raise
 
-app = Flask(__name__, static_folder="static", template_folder="templates")
-CORS(app, supports_credentials=True)
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode="eventlet", logger=True, engineio_logger=False)
-CORS(app, resources={r"/api/*": {"origins": "*"}})
+def estimate_request_tokens(prompt: str) -> int:
+    """Perkiraan token satu request (prompt + completion) untuk rate limiter route."""
+    return count_tokens(prompt) + LLM_EXPECTED_COMPLETION_TOKENS
 
-# Database configuration
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///share_tokens.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
 
 # =========================
-# Database Models
+# Transcript preprocessing (token budget)
 # =========================
-class ShareToken(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    token = db.Column(db.String(32), unique=True, nullable=False, index=True)
-    document_id = db.Column(db.String(255), nullable=False)  # Changed to String to match your app
-    created_by = db.Column(db.String(255), nullable=False)  # Changed to String to match user ID format
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    expires_at = db.Column(db.DateTime, nullable=True)
-    max_views = db.Column(db.Integer, nullable=True)
-    view_count = db.Column(db.Integer, default=0)
-    is_active = db.Column(db.Boolean, default=True)
-    
-    def is_expired(self):
-        if self.expires_at is None:
-            return False
-        return datetime.utcnow() > self.expires_at
-    
-    def is_view_limit_reached(self):
-        if self.max_views is None:
-            return False
-        return self.view_count >= self.max_views
-    
-    def can_access(self):
-        return self.is_active and not self.is_expired() and not self.is_view_limit_reached()
-    
-    def increment_view_count(self):
-        self.view_count += 1
-        db.session.commit()
+# Transkrip speech-recognition dibersihkan sebelum masuk prompt: normalisasi spasi/tanda baca,
+# buang pengulangan frasa akibat recognizer restart dan kata gagap ("jadi jadi"), serta filler
+# ("eh", "hmm"). Panjang input diukur dalam token (tiktoken bila terpasang, selain itu estimasi).
+TRANSCRIPT_PREPROCESS = [
+    s.strip() for s in os.getenv("TRANSCRIPT_PREPROCESS", "normalize,dedupe,fillers").lower().split(",")
+    if s.strip() and s.strip() not in ("0", "off", "false")
+]
+TRANSCRIPT_FILLERS = {
+    w.strip().lower() for w in os.getenv("TRANSCRIPT_FILLERS", "anu").split(",") if w.strip()
+}
+TRANSCRIPT_STUTTER_WORDS = {
+    w.strip().lower() for w in os.getenv(
+        "TRANSCRIPT_STUTTER_WORDS",
+        "jadi,saya,kita,kami,yang,itu,ini,dan,di,ke,dari,untuk,apa,ya,nah,terus,kalau,tapi,dengan,akan",
+    ).split(",") if w.strip()
+}
+# Frasa pendek yang diulang ("satu dua tiga satu dua tiga") sering memang diucapkan dua kali
+TRANSCRIPT_REPEAT_MIN_WORDS = int(os.getenv("TRANSCRIPT_REPEAT_MIN_WORDS", "4"))
+TRANSCRIPT_REPEAT_MAX_WORDS = int(os.getenv("TRANSCRIPT_REPEAT_MAX_WORDS", "40"))
+TRANSCRIPT_TOKENIZER = os.getenv("TRANSCRIPT_TOKENIZER", "cl100k_base")  # "heuristic" = tanpa tiktoken
+SUMMARY_INPUT_TOKENS = int(os.getenv("SUMMARY_INPUT_TOKENS", "1000"))
 
+# Variasi panjang filler: eh, ehm, emm, eee, hmm, mmm, uh, um, aah. "e" dan "mm" (satuan) bukan filler.
+_FILLER_PATTERN = re.compile(r"^(?:e+h+m*|e+m+|e{3,}|h+m+|m{3,}|u+h+m*|u+m+|a+h+)$")
+_WORD_STRIP = ".,!?;:\"'()[]…-"
+_TOKEN_PIECE = re.compile(r"\w+|[^\w\s]")
 
-# =========================
-# Error handler
-# =========================
-@app.errorhandler(Exception)
-def handle_exception(e):
-    code = 500
-    msg = str(e)
-    if isinstance(e, HTTPException):
-        code = e.code or 500
-        msg = e.description
-    return jsonify({"error": msg}), code
+transcript_tokens = metrics.counter(
+    "notaku_transcript_tokens_total", "Token transkrip sebelum/sesudah preprocessing.", ("stage",))
+transcript_tokens_saved = metrics.counter(
+    "notaku_transcript_tokens_saved_total", "Token input yang dihemat oleh preprocessing transkrip.")
 
+_tokenizer = None
+_tokenizer_loaded = False
 
-# =========================
-# Pages
-# =========================
-@app.route("/")
-def base_page():
-    return render_template("base.html")
+def _get_tokenizer():
+    global _tokenizer, _tokenizer_loaded
+    if not _tokenizer_loaded:
+        _tokenizer_loaded = True
+        if TRANSCRIPT_TOKENIZER != "heuristic":
+            try:
+                import tiktoken  # opsional
+                _tokenizer = tiktoken.get_encoding(TRANSCRIPT_TOKENIZER)
+            except ImportError:
+                pass
+            except Exception as e:
+                print(f"[WARN] Tokenizer {TRANSCRIPT_TOKENIZER} tidak tersedia ({e}); pakai estimasi.")
+    return _tokenizer
 
-@app.route("/dashboard")
-def dashboard_page():
-    return render_template("dashboard.html")
+def count_tokens(text: str) -> int:
+    """Jumlah token teks; tanpa tiktoken diestimasi ~1 token per 4 huruf per kata."""
+    if not text:
+        return 0
+    enc = _get_tokenizer()
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    return sum(1 + (len(piece) - 1) // 4 for piece in _TOKEN_PIECE.findall(text))
 
-@app.route("/voice")
-def voice_page():
-    return render_template("index.html")
+def fit_token_budget(text: str, budget: int) -> str:
+    """Bagian akhir teks yang muat dalam budget token, dipotong di awal kata."""
+    if budget <= 0 or count_tokens(text) <= budget:
+        return text
+    enc = _get_tokenizer()
+    if enc is not None:
+        tail = enc.decode(enc.encode(text, disallowed_special=())[-budget:])
+        ws = tail.find(" ")
+        return tail[ws + 1:] if 0 <= ws < len(tail) // 2 else tail
+    words = text.split()
+    used, start = 0, len(words)
+    while start > 0:
+        cost = count_tokens(words[start - 1])
+        if used + cost > budget:
+            break
+        used += cost
+        start -= 1
+    return " ".join(words[start:])
 
-@app.route("/history")
-@require_auth
-def history_page():
-    return render_template("history.html", history=history_store)
+def normalize_transcript(text: str) -> str:
+    text = unicodedata.normalize("NFC", text)
+    text = re.sub(r"[ \t\r\f\v\u00a0\u200b]+", " ", text)
+    text = re.sub(r" ?\n[ \n]*", "\n", text)
+    text = re.sub(r" +([,.!?;:])", r"\1", text)
+    text = re.sub(r"([,!?;:])\1+", r"\1", text)
+    text = re.sub(r"\.{2,}", ".", text)
+    return text.strip()
 
-@app.route("/settings")
-def settings_page():
+def _word_core(word: str) -> str:
+    return word.strip(_WORD_STRIP).lower()
+
+def _has_digit(core: str) -> bool:
+    return any(c.isdigit() for c in core)
+
+def _is_filler(core: str) -> bool:
+    return bool(core) and (core in TRANSCRIPT_FILLERS or bool(_FILLER_PATTERN.match(core)))
+
+def strip_fillers(words):
+    """Buang kata filler; tanda akhir kalimat pada filler dipindah ke kata sebelumnya."""
+    out = []
+    for word in words:
+        if _is_filler(_word_core(word)):
+            end = word[-1] if word[-1] in ".!?" else ""
+            if end and out and out[-1][-1] not in ".!?,":
+                out[-1] += end
+            continue
+        out.append(word)
+    return out
+
+def dedupe_words(words):
+    """
+    Hapus kata gagap ("jadi jadi" -> "jadi"; kata lain maksimal dua kali berturut-turut) dan
+    frasa >= TRANSCRIPT_REPEAT_MIN_WORDS kata yang langsung diulang tepat setelah salinannya
+    (recognizer restart). Kata dan frasa yang memuat angka tidak pernah dibuang ("10 10 10 juta").
+    """
+    stuttered, prev, run = [], None, 0
+    for word in words:
+        core = _word_core(word)
+        run = run + 1 if core and core == prev else 1
+        prev = core
+        if run > 1 and not _has_digit(core) and (core in TRANSCRIPT_STUTTER_WORDS or run > 2):
+            continue
+        stuttered.append(word)
+
+    cores = [_word_core(w) for w in stuttered]
+    out, out_cores, i = [], [], 0
+    min_n = max(1, TRANSCRIPT_REPEAT_MIN_WORDS)
+    max_n = max(min_n, TRANSCRIPT_REPEAT_MAX_WORDS)
+    recent = {}  # {core: deque posisi di out dalam max_n kata terakhir}
+    while i < len(stuttered):
+        core, size, repeat = cores[i], len(out_cores), 0
+        positions = recent.get(core)
+        if positions:
+            while positions and positions[0] < size - max_n:
+                positions.popleft()
+            # Kandidat frasa: salinan yang berakhir tepat sebelum kata ini, dimulai di kemunculan kata ini
+            # sebelumnya, terpanjang dulu
+            last, remaining = out_cores[-1], len(stuttered) - i
+            for pos in positions:
+                n = size - pos
+                if n < min_n:
+                    break
+                if n <= remaining and cores[i + n - 1] == last and out_cores[pos:] == cores[i:i + n]:
+                    if not any(_has_digit(c) for c in out_cores[pos:]):
+                        repeat = n
+                    break
+        if repeat:
+            i += repeat
+            continue
+        out.append(stuttered[i])
+        out_cores.append(core)
+        recent.setdefault(core, deque()).append(size)
+        i += 1
+    return out
+
+class PreparedTranscript:
+    __slots__ = ("text", "tokens_before", "tokens_after", "removed_words")
+
+    def __init__(self, text: str, tokens_before: int, tokens_after: int, removed_words: dict):
+        self.text = text
+        self.tokens_before = tokens_before
+        self.tokens_after = tokens_after
+        self.removed_words = removed_words
+
+    def report(self) -> dict:
+        return {
+            "tokens_before": self.tokens_before,
+            "tokens_after": self.tokens_after,
+            "tokens_saved": self.tokens_before - self.tokens_after,
+            "removed_words": dict(self.removed_words),
+        }
+
+def preprocess_transcript(text: str, steps=None) -> PreparedTranscript:
+    """Jalankan langkah preprocessing (default TRANSCRIPT_PREPROCESS) dan hitung token yang dihemat."""
+    steps = TRANSCRIPT_PREPROCESS if steps is None else steps
+    tokens_before = count_tokens(text)
+    removed = {}
+    if "normalize" in steps:
+        text = normalize_transcript(text)
+    if "fillers" in steps or "dedupe" in steps:
+        lines = []
+        for line in text.split("\n"):
+            words = line.split()
+            before = len(words)
+            if "fillers" in steps:
+                words = strip_fillers(words)
+                removed["fillers"] = removed.get("fillers", 0) + before - len(words)
+                before = len(words)
+            if "dedupe" in steps:
+                words = dedupe_words(words)
+                removed["dedupe"] = removed.get("dedupe", 0) + before - len(words)
+            if words:
+                lines.append(" ".join(words))
+        text = "\n".join(lines)
+    tokens_after = count_tokens(text)
+    transcript_tokens.inc(tokens_before, stage="before")
+    transcript_tokens.inc(tokens_after, stage="after")
+    transcript_tokens_saved.inc(max(0, tokens_before - tokens_after))
+    return PreparedTranscript(text, tokens_before, tokens_after, removed)
+
+
+# =========================
+# Map-reduce summarization (transkrip panjang)
+# =========================
+# Transkrip panjang dipecah menjadi potongan yang saling tumpang tindih,
+# tiap potongan diringkas paralel (map), lalu hasilnya digabung (reduce).
+SUMMARY_MAP_REDUCE = os.getenv("SUMMARY_MAP_REDUCE", "true").strip().lower() == "true"
+SUMMARY_CHUNK_CHARS = int(os.getenv("SUMMARY_CHUNK_CHARS", "4000"))
+SUMMARY_CHUNK_OVERLAP = int(os.getenv("SUMMARY_CHUNK_OVERLAP", "300"))
+SUMMARY_MAP_CONCURRENCY = int(os.getenv("SUMMARY_MAP_CONCURRENCY", "4"))
+SUMMARY_REDUCE_MAX_CHARS = int(os.getenv("SUMMARY_REDUCE_MAX_CHARS", "12000"))
+# Content-defined chunking: batas potongan ditentukan isi teks (rolling hash atas beberapa kata terakhir),
+# bukan posisi, sehingga edit lokal hanya mengubah potongan di sekitarnya dan ringkasan potongan lain
+# dipakai ulang dari chunk_summary_cache. Ukuran tetap (tidak diturunkan dari teks) agar batas stabil.
+SUMMARY_CDC = os.getenv("SUMMARY_CDC", "true").strip().lower() == "true"
+SUMMARY_CDC_MAX_CHARS = int(os.getenv("SUMMARY_CDC_MAX_CHARS", str(SUMMARY_INPUT_TOKENS * 4)))
+SUMMARY_CDC_AVG_CHARS = int(os.getenv("SUMMARY_CDC_AVG_CHARS", str(SUMMARY_CDC_MAX_CHARS * 3 // 4)))
+SUMMARY_CDC_MIN_CHARS = int(os.getenv("SUMMARY_CDC_MIN_CHARS", str(SUMMARY_CDC_MAX_CHARS // 2)))
+SUMMARY_CDC_WINDOW_WORDS = int(os.getenv("SUMMARY_CDC_WINDOW_WORDS", "8"))
+# Kelompok reduce juga dibatasi isi: potong setelah parsial yang hash-nya jatuh di batas (rata-rata
+# SUMMARY_REDUCE_GROUP parsial per kelompok), bukan menurut panjang kumulatif, agar parsial yang berubah
+# panjang tidak menggeser semua kelompok sesudahnya.
+SUMMARY_REDUCE_GROUP = int(os.getenv("SUMMARY_REDUCE_GROUP", "4"))
+
+summary_chunks = metrics.counter(
+    "notaku_summary_chunks_total", "Potongan tahap map per hasil (hit = ringkasan dipakai ulang, miss = LLM).", ("result",))
+
+_SENTENCE_END = re.compile(r"[.!?\n]\s")
+
+def find_chunk_cut(text: str, start: int, size: int) -> int:
+    """Posisi potong untuk jendela text[start:start+size]: akhir kalimat, lalu spasi."""
+    end = min(start + size, len(text))
+    # Cari akhir kalimat di 25% terakhir jendela, fallback ke spasi
+    window_start = start + (size * 3) // 4
+    cut = None
+    for m in _SENTENCE_END.finditer(text, window_start, end):
+        cut = m.start() + 1
+    if cut is None:
+        ws = text.rfind(" ", window_start, end)
+        cut = ws if ws > start else None
+    return cut or end
+
+def split_transcript(text: str, size: int = None, overlap: int = None):
+    """
+    Pecah teks menjadi potongan <= size karakter dengan overlap antar potongan.
+    Batas potongan diusahakan jatuh di akhir kalimat, lalu di spasi.
+    """
+    size = size or SUMMARY_CHUNK_CHARS
+    overlap = SUMMARY_CHUNK_OVERLAP if overlap is None else overlap
+    overlap = max(0, min(overlap, size // 2))
+    if len(text) <= size:
+        return [text]
+
+    chunks = []
+    start = 0
+    n = len(text)
+    while start < n:
+        end = min(start + size, n)
+        if end < n:
+            end = find_chunk_cut(text, start, size)
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= n:
+            break
+        # Mulai potongan berikutnya dengan overlap, sejajarkan ke awal kata
+        next_start = max(end - overlap, start + 1)
+        ws = text.find(" ", next_start, end)
+        start = ws + 1 if ws != -1 else next_start
+    return chunks
+
+_CDC_WORD = re.compile(r"\S+")
+_CDC_BASE = 1000003
+_CDC_MOD = (1 << 61) - 1
+
+def content_defined_chunks(text: str, min_chars: int = None, avg_chars: int = None, max_chars: int = None,
+                           window: int = None):
+    """
+    Pecah teks di batas kata yang dipilih rolling hash atas `window` kata terakhir (bukan posisi).
+    Setelah potongan mencapai min_chars, kata menjadi batas jika hash % (avg - min) < jumlah karakter
+    yang dilewati kata itu, jadi rata-rata potongan ~avg_chars; max_chars memaksa potong.
+    Edit di satu tempat hanya menggeser batas di dekatnya, potongan sisanya tetap identik.
+    """
+    max_chars = max(1, max_chars or SUMMARY_CDC_MAX_CHARS)
+    min_chars = max(0, min(min_chars if min_chars is not None else SUMMARY_CDC_MIN_CHARS, max_chars // 2))
+    avg_chars = min(max(avg_chars or SUMMARY_CDC_AVG_CHARS, min_chars + 1), max_chars)
+    window = max(1, window or SUMMARY_CDC_WINDOW_WORDS)
+    if len(text) <= max_chars:
+        return [text.strip()] if text.strip() else []
+
+    divisor = max(1, avg_chars - min_chars)
+    drop = pow(_CDC_BASE, window - 1, _CDC_MOD)
+    recent = deque()
+    h = 0
+    chunks = []
+    start = prev_end = 0
+    for m in _CDC_WORD.finditer(text):
+        word_hash = zlib.crc32(m.group().encode("utf-8"))
+        if len(recent) == window:
+            h = (h - recent.popleft() * drop) % _CDC_MOD
+        recent.append(word_hash)
+        h = (h * _CDC_BASE + word_hash) % _CDC_MOD
+        end = m.end()
+        size = end - start
+        step, prev_end = end - prev_end, end
+        if size >= max_chars or (size >= min_chars and h % divisor < step):
+            chunk = text[start:end].strip()
+            if chunk:
+                chunks.append(chunk)
+            start = end
+    tail = text[start:].strip()
+    if tail:
+        chunks.append(tail)
+    return chunks
+
+def build_chunk_prompt(text: str, index: int, total: int = None) -> str:
+    part = f"BAGIAN {index} dari {total}" if total else f"BAGIAN {index}"
+    label = f"{index}/{total}" if total else f"{index}"
+    return f"""
+Anda adalah seorang notulis rapat yang berpengalaman.
+Berikut adalah {part} transkripsi sebuah rapat yang panjang.
+Buat notulensi parsial HANYA untuk bagian ini, tanpa proses berpikir.
+Gunakan format yang sama:
+
+{NOTULENSI_FORMAT}
+
+Aturan ketat:
+- Hanya ekstrak fakta yang ada pada bagian teks ini.
+- Pertahankan nama orang, tanggal, angka, dan informasi penting persis seperti tertulis.
+- Jika sebuah bagian format tidak memiliki isi, tulis "- (tidak ada)".
+- Jangan menyimpulkan hal yang mungkin dibahas di bagian lain.
+
+Teks sumber (bagian {label}):
+{text}
+
+Notulensi parsial:
+"""
+
+def build_reduce_prompt(partials) -> str:
+    joined = "\n\n".join(
+        f"--- Notulensi parsial {i} ---\n{p}" for i, p in enumerate(partials, start=1)
+    )
+    return f"""
+Anda adalah seorang notulis rapat yang berpengalaman.
+Berikut adalah beberapa notulensi parsial dari bagian-bagian berurutan satu rapat yang sama.
+Gabungkan menjadi SATU notulensi final, tanpa proses berpikir.
+Ikuti format:
+
+{NOTULENSI_FORMAT}
+
+Aturan ketat:
+- Gabungkan poin yang sama atau berulang (bagian-bagian saling tumpang tindih).
+- Pertahankan urutan kronologis pembahasan.
+- Pertahankan nama orang, tanggal, angka, dan informasi penting persis seperti tertulis.
+- Jangan menambah fakta yang tidak ada di notulensi parsial.
+- Abaikan isian "(tidak ada)" jika bagian lain memiliki isi.
+- Identifikasi action items dengan jelas (siapa, apa, kapan).
+
+Notulensi parsial:
+{joined}
+
+Notulensi:
+"""
+
+def summarize_chunks(chunks, mode: str = "rapat", on_progress=None, stop_evt=None, user_id: str = None):
+    """
+    Tahap map: ringkas setiap potongan secara paralel di pool (green-thread / thread) yang dibatasi.
+    Potongan yang ringkasannya sudah ada di chunk_summary_cache tidak dikirim ke LLM; potongan kembar
+    cukup diringkas sekali. on_progress(done, total) dipanggil setiap satu potongan selesai.
+    """
+    total = len(chunks)
+    partials = [None] * total
+    pending = OrderedDict()  # {kunci: [index potongan]} yang belum ada ringkasannya
+    done = 0
+    for idx, chunk in enumerate(chunks):
+        key = chunk_summary_key(chunk, mode)
+        cached = None if key in pending else chunk_summary_cache.get_any(chunk_summary_keys(chunk, mode))
+        if cached is not None:
+            partials[idx] = cached
+            done += 1
+        else:
+            pending.setdefault(key, []).append(idx)
+    if done:
+        summary_chunks.inc(done, result="hit")
+        if on_progress:
+            on_progress(done, total)
+
+    def run(key):
+        indexes = pending[key]
+        if stop_evt is not None and stop_evt.is_set():
+            return indexes, ""
+        model, partial = _chat_complete_routed(build_chunk_prompt(chunks[indexes[0]], indexes[0] + 1, total),
+                                               user_id, stop_evt, endpoint="map")
+        if model and (stop_evt is None or not stop_evt.is_set()):
+            chunk_summary_cache.put(chunk_summary_key(chunks[indexes[0]], mode, model=model), partial)
+        return indexes, partial
+
+    for indexes, partial in imap_pool(run, list(pending), SUMMARY_MAP_CONCURRENCY):
+        summary_chunks.inc(result="miss")
+        for idx in indexes:
+            partials[idx] = partial
+            done += 1
+            if on_progress:
+                on_progress(done, total)
+    return partials
+
+def reduce_groups(partials, avg: int = None, max_chars: int = None):
+    """
+    Kelompok reduce dengan batas berbasis isi: potong setelah parsial yang hash-nya jatuh di batas
+    (minimal 2, maksimal 2*avg parsial per kelompok). Batas panjang max_chars hanya memotong lebih awal
+    di dalam kelompok yang kepanjangan; kelompok lain tidak ikut bergeser.
+    """
+    avg = max(2, avg or SUMMARY_REDUCE_GROUP)
+    max_chars = max_chars or SUMMARY_REDUCE_MAX_CHARS
+    groups, current, current_len = [], [], 0
+    for p in partials:
+        if current and current_len + len(p) > max_chars:
+            groups.append(current)
+            current, current_len = [], 0
+        current.append(p)
+        current_len += len(p)
+        digest = int.from_bytes(hashlib.blake2b(p.encode("utf-8"), digest_size=4).digest(), "big")
+        if len(current) >= 2 and (digest % avg == 0 or len(current) >= 2 * avg):
+            groups.append(current)
+            current, current_len = [], 0
+    if current:
+        groups.append(current)
+    return groups
+
+def compact_partials(partials, mode: str = "rapat", stop_evt=None, user_id: str = None):
+    """
+    Kecilkan daftar notulensi parsial sampai muat dalam satu prompt reduce.
+    Jika terlalu banyak, gabungkan bertahap per kelompok (reduce_groups, juga paralel).
+    """
+    partials = [p for p in partials if p]
+    while len(partials) > 1 and sum(len(p) for p in partials) > SUMMARY_REDUCE_MAX_CHARS:
+        if stop_evt is not None and stop_evt.is_set():
+            break
+        groups = reduce_groups(partials)
+        if len(groups) == len(partials):
+            # Tiap parsial sudah terlalu besar untuk digabung per kelompok
+            break
+        partials = list(imap_pool(
+            lambda grp: grp[0] if len(grp) == 1 else _merge_partials(grp, mode, stop_evt, user_id),
+            groups, SUMMARY_MAP_CONCURRENCY,
+        ))
+    return partials
+
+def _merge_partials(group, mode: str, stop_evt=None, user_id: str = None) -> str:
+    """Reduce satu kelompok parsial; hasilnya disimpan per isi kelompok agar edit kecil tidak mengulang semua."""
+    joined = "\x00".join(group)
+    merged = chunk_summary_cache.get_any(chunk_summary_keys(joined, mode, kind="reduce"))
+    if merged is None:
+        model, merged = _chat_complete_routed(build_reduce_prompt(group), user_id, stop_evt, endpoint="reduce")
+        if model and (stop_evt is None or not stop_evt.is_set()):
+            chunk_summary_cache.put(chunk_summary_key(joined, mode, kind="reduce", model=model), merged)
+    return merged
+
+def reduce_partials(partials, mode: str = "rapat", stop_evt=None, user_id: str = None) -> str:
+    """Prompt reduce final (belum dipanggil ke LLM) dari daftar notulensi parsial."""
+    return build_reduce_prompt(compact_partials(partials, mode, stop_evt=stop_evt, user_id=user_id))
+
+def prepare_summary_prompt(text: str, mode: str = "rapat", on_progress=None, stop_evt=None, user_id: str = None,
+                           on_preprocess=None) -> str:
+    """
+    Bangun prompt final untuk ringkasan. Transkrip dibersihkan dulu (preprocess_transcript);
+    jika muat dalam SUMMARY_INPUT_TOKENS langsung memakai build_prompt, selain itu melewati
+    tahap map (paralel) lalu prompt reduce yang dikembalikan. on_preprocess(report) menerima
+    laporan token sebelum/sesudah preprocessing.
+    """
+    prepared = preprocess_transcript(text)
+    if on_preprocess:
+        on_preprocess(prepared.report())
+    text, tokens = prepared.text, prepared.tokens_after
+    if tokens <= SUMMARY_INPUT_TOKENS:
+        return build_prompt(text, mode)
+    if not SUMMARY_MAP_REDUCE:
+        # Mode lama: hanya bagian akhir transkrip yang muat dalam budget token
+        return build_prompt(fit_token_budget(text, SUMMARY_INPUT_TOKENS), mode)
+    if SUMMARY_CDC:
+        chunks = content_defined_chunks(text)
+    else:
+        # Ukuran potongan mengikuti budget token (rasio karakter/token dari teks ini)
+        chunk_chars = max(500, int(SUMMARY_INPUT_TOKENS * len(text) / max(1, tokens)))
+        chunks = split_transcript(text, size=chunk_chars)
+    partials = summarize_chunks(chunks, mode, on_progress=on_progress, stop_evt=stop_evt, user_id=user_id)
+    return reduce_partials(partials, mode, stop_evt=stop_evt, user_id=user_id)
+
+
+# =========================
+# Rolling summarization (transkrip live)
+# =========================
+# Klien mengirim potongan transkrip baru lewat `transcript_append`. Server menyimpan
+# ringkasan segmen yang sudah final + ekor teks yang belum diringkas. LLM hanya dipanggil
+# saat ekor melewati ROLLING_SEGMENT_CHARS, sehingga biaya per update tetap datar.
+ROLLING_SEGMENT_CHARS = int(os.getenv("ROLLING_SEGMENT_CHARS", "3000"))
+ROLLING_MAX_SEGMENTS_CHARS = int(os.getenv("ROLLING_MAX_SEGMENTS_CHARS", str(SUMMARY_REDUCE_MAX_CHARS)))
+
+class RollingTranscript:
+    def __init__(self, mode: str = "rapat", user_id: str = None):
+        self.mode = mode
+        self.user_id = user_id
+        self.segments = []      # ringkasan segmen yang sudah final (urut kronologis)
+        self.tail = ""          # teks yang belum diringkas
+        self.segment_count = 0  # jumlah segmen transkrip yang sudah diringkas
+        self.total_chars = 0
+        self.pending = False    # ada ringkasan segmen yang sedang berjalan
+        self.pending_text = ""  # teks segmen yang sedang diringkas (sudah keluar dari ekor)
+        self.lock = threading.Lock()
+
+    def append(self, text: str):
+        with self.lock:
+            sep = " " if self.tail and not self.tail.endswith((" ", "\n")) else ""
+            self.tail += sep + text
+            self.total_chars += len(text)
+
+    def take_segment(self):
+        """Ambil satu segmen dari depan ekor jika sudah melewati ambang (dan tidak ada yang pending)."""
+        with self.lock:
+            if self.pending or len(self.tail) < ROLLING_SEGMENT_CHARS:
+                return None
+            cut = find_chunk_cut(self.tail, 0, ROLLING_SEGMENT_CHARS)
+            segment, self.tail = self.tail[:cut].strip(), self.tail[cut:].lstrip()
+            self.pending = True
+            self.pending_text = segment
+            self.segment_count += 1
+            return self.segment_count, segment
+
+    def finish_segment(self, summary: str, failed_segment: str = None):
+        with self.lock:
+            if summary:
+                self.segments.append(summary)
+            elif failed_segment:
+                # Gagal diringkas: kembalikan ke depan ekor agar tidak hilang
+                self.tail = failed_segment + " " + self.tail
+                self.segment_count -= 1
+            self.pending = False
+            self.pending_text = ""
+
+    def snapshot(self):
+        """(ringkasan segmen, teks mentah) — segmen yang masih diringkas ikut sebagai teks mentah."""
+        with self.lock:
+            tail = f"{self.pending_text} {self.tail}" if self.pending_text else self.tail
+            return list(self.segments), tail
+
+    def has_text(self) -> bool:
+        with self.lock:
+            return bool(self.segments or self.pending_text or self.tail.strip())
+
+    def replace_segments(self, old_count: int, compacted):
+        """Ganti old_count segmen pertama dengan hasil pemadatan (segmen baru tetap dipertahankan)."""
+        with self.lock:
+            self.segments = list(compacted) + self.segments[old_count:]
+
+    def state(self):
+        with self.lock:
+            return {
+                "segments": len(self.segments),
+                "segment_chars": sum(len(x) for x in self.segments),
+                "tail_chars": len(self.tail),
+                "total_chars": self.total_chars,
+                "pending": self.pending,
+            }
+
+def build_rolling_prompt(segments, tail: str, mode: str = "rapat") -> str:
+    """Prompt notulensi dari state ringkas: ringkasan segmen + ekor transkrip mentah."""
+    tail = preprocess_transcript(tail).text
+    if not segments:
+        return build_prompt(tail, mode)
+    partials = list(segments)
+    if tail.strip():
+        partials.append(f"(Transkripsi terbaru, belum diringkas)\n{tail.strip()}")
+    return build_reduce_prompt(partials)
+
+def advance_rolling(state: RollingTranscript, on_segment=None):
+    """Ringkas segmen-segmen yang sudah melewati ambang, satu per satu (dipanggil di background)."""
+    while True:
+        taken = state.take_segment()
+        if not taken:
+            return
+        index, segment = taken
+        summary = None
+        try:
+            prompt = build_chunk_prompt(preprocess_transcript(segment).text, index, None)
+            summary = _chat_complete(prompt, state.user_id, endpoint="rolling_segment")
+        except Exception as e:
+            print(f"[rolling] segment {index} failed: {e}")
+            state.finish_segment(None, failed_segment=segment)
+            return
+        state.finish_segment(summary)
+        if on_segment:
+            on_segment(index)
+
+
+# =========================
+# Config & Init
+# =========================
+
+component_warm_seconds = metrics.histogram(
+    "notaku_component_warm_seconds", "Waktu warmup komponen saat start (init + probe)", ("component",))
+metrics.gauge("notaku_components_not_ready", "Komponen wajib yang belum siap (/readyz)",
+              lambda: len(components.not_ready()))
+
+# Koneksi Supabase (lazy; SDK ikut di-import saat komponen dibuat)
+SUPABASE_URL = os.getenv("SUPABASE_URL", "").rstrip("/")
+SUPABASE_KEY = os.getenv("SUPABASE_KEY", "")
+
+def _create_supabase():
+    from supabase import create_client
+    return create_client(SUPABASE_URL, SUPABASE_KEY)
+
+def _probe_supabase(sb):
+    # Tes koneksi singkat ke tabel "documents"
+    sb.table("documents").select("id").limit(1).execute()
+    print("[OK] Koneksi Supabase berhasil.")
+
+supabase = components.add("supabase", _create_supabase, probe=_probe_supabase,
+                          configured=bool(SUPABASE_URL and SUPABASE_KEY))
+if not supabase:
+    print("Supabase credentials not set; supabase client disabled")
+
+GROQ_API_KEY = os.environ.get("GROQ_API_KEY", "")
+# Pakai model yang lebih cepat secara default
+MODEL = os.environ.get("GROQ_MODEL", "llama-3.1-8b-instant")
+# Opsional: arahkan ke endpoint lain yang kompatibel (mis. bench/fake_groq.py)
+GROQ_BASE_URL = os.environ.get("GROQ_BASE_URL") or None
+
+def _groq_factory(base_url):
+    def create():
+        from groq import Groq
+        return Groq(api_key=GROQ_API_KEY, base_url=base_url)
+    return create
+
+client = components.add("groq", _groq_factory(GROQ_BASE_URL), configured=bool(GROQ_API_KEY))
+
+app = Flask(__name__, static_folder="static", template_folder="templates")
+CORS(app, supports_credentials=True)
+# Dengan message queue (Redis), emit dari worker mana pun sampai ke klien di worker lain.
+# Di mode ASGI server Socket.IO yang melayani klien adalah AsyncServer milik asgi.py (yang juga
+# memegang message queue); instance ini hanya menjaga dekorator handler di bawah tetap valid.
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode="threading" if SERVER_MODE == "asgi" else "eventlet",
+                    logger=True, engineio_logger=False,
+                    message_queue=SOCKETIO_MESSAGE_QUEUE if SERVER_MODE != "asgi" else None)
+
+# eventlet.wsgi menahan output streaming sampai 4 KB per write; frame SSE harus langsung terkirim.
+# Diset di environ asli karena middleware Socket.IO menyalin environ sebelum request masuk Flask.
+_socketio_wsgi_app = app.wsgi_app
+
+def _unbuffered_wsgi_app(environ, start_response):
+    environ["eventlet.minimum_write_chunk_size"] = 0
+    return _socketio_wsgi_app(environ, start_response)
+
+app.wsgi_app = _unbuffered_wsgi_app
+CORS(app, resources={r"/api/*": {"origins": "*"}})
+
+# Database configuration
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///share_tokens.db')
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# SQLite: WAL agar pembaca (/shared, validate) tidak menunggu penulis (generate, flush view, sweeper),
+# dan busy timeout agar penulis yang bertabrakan menunggu sebentar alih-alih "database is locked".
+SHARE_DB_BUSY_TIMEOUT_MS = int(os.getenv("SHARE_DB_BUSY_TIMEOUT_MS", "5000"))
+SHARE_DB_WAL = os.getenv("SHARE_DB_WAL", "true").strip().lower() == "true"
+if app.config['SQLALCHEMY_DATABASE_URI'].startswith("sqlite"):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {"connect_args": {"timeout": SHARE_DB_BUSY_TIMEOUT_MS / 1000.0}}
+db = SQLAlchemy(app)
+
+# =========================
+# LLM router (multi-model + hedging)
+# =========================
+# Kebijakan routing/hedging ada di llm.py; di sini route dibuat dari klien Groq yang dikonfigurasi.
+# LLM_ROUTES berisi daftar model/endpoint berurutan, mis. "llama-3.1-8b-instant,llama-3.3-70b-versatile@https://...".
+def _build_llm_routes():
+    routes = []
+    for entry in [e.strip() for e in (LLM_ROUTES or MODEL).split(",") if e.strip()]:
+        model, _, base_url = entry.partition("@")
+        if base_url:
+            route_client = components.add(f"groq:{entry}", _groq_factory(base_url), configured=bool(GROQ_API_KEY))
+        else:
+            route_client = client
+        if route_client:
+            routes.append(LLMRoute(entry, model, route_client))
+    return routes
+
+llm_router = LLMRouter(_build_llm_routes(), LLM_HEDGE_TTFT_MS, LLM_HEDGE_COMPLETE_MS, LLM_HEDGE_MAX,
+                       llm_gateway, estimate_request_tokens)
+
+# =========================
+# Database Models
+# =========================
+class ShareToken(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    token = db.Column(db.String(32), unique=True, nullable=False, index=True)
+    document_id = db.Column(db.String(255), nullable=False)  # Changed to String to match your app
+    created_by = db.Column(db.String(255), nullable=False)  # Changed to String to match user ID format
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=True)
+    max_views = db.Column(db.Integer, nullable=True)
+    view_count = db.Column(db.Integer, default=0)
+    is_active = db.Column(db.Boolean, default=True)
+
+    __table_args__ = (
+        # /api/share/list: filter created_by, urut created_at (keyset dengan id)
+        db.Index("ix_share_token_created_by_created_at", "created_by", "created_at"),
+        # Sweeper: token yang sudah lewat expires_at
+        db.Index("ix_share_token_expires_at", "expires_at"),
+    )
+    
+    def is_expired(self):
+        if self.expires_at is None:
+            return False
+        return datetime.utcnow() > self.expires_at
+    
+    def current_view_count(self):
+        # Termasuk view yang masih di buffer write-behind
+        return view_counter.current(self)
+    
+    def is_view_limit_reached(self):
+        if self.max_views is None:
+            return False
+        return self.current_view_count() >= self.max_views
+    
+    def can_access(self):
+        return self.is_active and not self.is_expired() and not self.is_view_limit_reached()
+    
+    def increment_view_count(self):
+        """Catat satu view; False jika max_views sudah tercapai (cek + tambah atomik)."""
+        return view_counter.record(self)
+
+class ShareTokenArchive(db.Model):
+    """Token yang dipindahkan sweeper dari tabel aktif (SHARE_SWEEP_MODE=archive)."""
+    __tablename__ = "share_token_archive"
+    id = db.Column(db.Integer, primary_key=True)
+    token_id = db.Column(db.Integer, nullable=False)  # id asli ShareToken (SQLite bisa memakai ulang id)
+    token = db.Column(db.String(64), nullable=False)
+    document_id = db.Column(db.String(255), nullable=False)
+    created_by = db.Column(db.String(255), nullable=False)
+    created_at = db.Column(db.DateTime)
+    expires_at = db.Column(db.DateTime, nullable=True)
+    max_views = db.Column(db.Integer, nullable=True)
+    view_count = db.Column(db.Integer, default=0)
+    is_active = db.Column(db.Boolean, default=True)
+    reason = db.Column(db.String(16), nullable=False)  # expired | revoked | view_limit
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+# Durasi setiap statement SQLAlchemy (share token DB) untuk metrics, per jenis operasi
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+@event.listens_for(Engine, "connect")
+def _sqlite_pragmas(dbapi_conn, connection_record):
+    if not isinstance(dbapi_conn, sqlite3.Connection):
+        return
+    cur = dbapi_conn.cursor()
+    cur.execute(f"PRAGMA busy_timeout={SHARE_DB_BUSY_TIMEOUT_MS}")
+    if SHARE_DB_WAL:
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("PRAGMA synchronous=NORMAL")
+    cur.close()
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _db_timer_start(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _db_timer_stop(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("metrics_started")
+    if started:
+        operation = (statement.split(None, 1) or ["other"])[0].lower()
+        share_db_seconds.observe(time.perf_counter() - started.pop(), operation=operation)
+
+@event.listens_for(Engine, "handle_error")
+def _db_timer_error(exception_context):
+    started = exception_context.connection.info.get("metrics_started") if exception_context.connection else None
+    if started:
+        share_db_seconds.observe(time.perf_counter() - started.pop(), operation="error")
+
+
+# =========================
+# View counter (write-behind)
+# =========================
+# Hitungan view efektif (DB + buffer semua worker) disimpan di state_store (INCR atomik di Redis)
+# sehingga max_views berlaku lintas worker. Tambahan per proses ditulis ke DB secara batch dengan
+# UPDATE ... SET view_count = view_count + n, bukan commit per page view.
+from sqlalchemy import bindparam
+
+VIEW_FLUSH_SECONDS = float(os.getenv("VIEW_FLUSH_SECONDS", "2"))
+VIEW_FLUSH_BATCH = int(os.getenv("VIEW_FLUSH_BATCH", "500"))
+VIEW_COUNT_TTL = float(os.getenv("VIEW_COUNT_TTL", "3600"))  # hitungan di state_store, diperpanjang tiap view
+
+class ViewCounter:
+    def __init__(self, store, flush_seconds: float, flush_batch: int, ttl: float):
+        self.store = store
+        self.flush_seconds = flush_seconds
+        self.flush_batch = max(1, flush_batch)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._pending = {}            # {token_id: tambahan proses ini yang belum ditulis}
+        self._pending_total = 0
+        self._flush_requested = Event()
+        self.flushes = 0
+        self.flushed_views = 0
+        self.flush_errors = 0
+        self.rejected = 0
+
+    def _seed(self, token) -> int:
+        # Hanya worker pertama yang mengisi dari DB; sesudahnya semua worker memakai hitungan bersama
+        return self.store.set_default("share_views", str(token.id), token.view_count or 0, ttl=self.ttl)
+
+    def current(self, token) -> int:
+        count = self.store.get("share_views", str(token.id))
+        return self._seed(token) if count is None else count
+
+    def record(self, token) -> bool:
+        key = str(token.id)
+        self._seed(token)
+        count = self.store.incr("share_views", key, 1, ttl=self.ttl)
+        if token.max_views is not None and count > token.max_views:
+            # Worker lain sudah memakai kuota terakhir: kembalikan tambahan ini
+            self.store.incr("share_views", key, -1, ttl=self.ttl)
+            with self._lock:
+                self.rejected += 1
+            return False
+        with self._lock:
+            self._pending[token.id] = self._pending.get(token.id, 0) + 1
+            self._pending_total += 1
+            if self._pending_total >= self.flush_batch:
+                self._flush_requested.set()
+        return True
+
+    def forget(self, token_id):
+        """Hapus hitungan bersama (mis. token dihapus); tambahan tertunda tetap di-flush."""
+        self.store.delete("share_views", str(token_id))
+
+    def flush(self):
+        with self._lock:
+            batch, self._pending, self._pending_total = self._pending, {}, 0
+        if not batch:
+            return 0
+        table = ShareToken.__table__
+        stmt = (
+            table.update()
+            .where(table.c.id == bindparam("token_id"))
+            .values(view_count=db.func.coalesce(table.c.view_count, 0) + bindparam("n"))
+        )
+        try:
+            with app.app_context():
+                db.session.execute(stmt, [{"token_id": k, "n": n} for k, n in batch.items()])
+                db.session.commit()
+        except Exception as e:
+            print(f"[WARN] View count flush failed: {e}")
+            with self._lock:
+                for k, n in batch.items():
+                    self._pending[k] = self._pending.get(k, 0) + n
+                    self._pending_total += n
+                self.flush_errors += 1
+            try:
+                with app.app_context():
+                    db.session.rollback()
+            except Exception:
+                pass
+            return 0
+        flushed = sum(batch.values())
+        with self._lock:
+            self.flushes += 1
+            self.flushed_views += flushed
+        return flushed
+
+    def run(self):
+        while True:
+            self._flush_requested.wait(self.flush_seconds)
+            self._flush_requested.clear()
+            self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "tracked_tokens": len(self.store.keys("share_views")),
+                "pending_views": self._pending_total,
+                "rejected_views": self.rejected,
+                "flushes": self.flushes,
+                "flushed_views": self.flushed_views,
+                "flush_errors": self.flush_errors,
+            }
+
+view_counter = ViewCounter(state_store, VIEW_FLUSH_SECONDS, VIEW_FLUSH_BATCH, VIEW_COUNT_TTL)
+
+
+# =========================
+# Shared document cache
+# =========================
+# Cache hasil resolve /shared/<identifier>: token -> snapshot token, document_id -> dokumen,
+# identifier -> halaman shared.html yang sudah dirender. Dibatasi jumlah entri dan total byte.
+SHARED_CACHE_TTL = float(os.getenv("SHARED_CACHE_TTL", "60"))
+SHARED_CACHE_SIZE = int(os.getenv("SHARED_CACHE_SIZE", "512"))
+SHARED_CACHE_MAX_BYTES = int(os.getenv("SHARED_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+class ShareTokenSnapshot:
+    """Salinan ringan baris ShareToken agar cache tidak menyimpan objek ORM."""
+    __slots__ = ("id", "token", "document_id", "expires_at", "max_views", "view_count", "is_active")
+
+    def __init__(self, share_token):
+        for name in self.__slots__:
+            setattr(self, name, getattr(share_token, name))
+
+    is_expired = ShareToken.is_expired
+    current_view_count = ShareToken.current_view_count
+    is_view_limit_reached = ShareToken.is_view_limit_reached
+    can_access = ShareToken.can_access
+    increment_view_count = ShareToken.increment_view_count
+
+class SharedDocumentCache:
+    def __init__(self, ttl: float, max_entries: int, max_bytes: int):
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._tokens = OrderedDict()  # {identifier: (expires, ShareTokenSnapshot)}
+        self._docs = OrderedDict()    # {document_id: (expires, doc, size)}
+        self._pages = OrderedDict()   # {identifier: (expires, document_id, html)}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _get_locked(self, store, key):
+        item = store.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        if item[0] <= time.time():
+            self._drop_locked(store, key)
+            self.misses += 1
+            return None
+        store.move_to_end(key)
+        self.hits += 1
+        return item
+
+    def _drop_locked(self, store, key):
+        item = store.pop(key, None)
+        if item is None:
+            return
+        if store is self._docs:
+            self._bytes -= item[2]
+        elif store is self._pages:
+            self._bytes -= len(item[2])
+
+    def _trim_locked(self):
+        for store in (self._pages, self._docs, self._tokens):
+            while store and (len(store) > self.max_entries or self._bytes > self.max_bytes):
+                self._drop_locked(store, next(iter(store)))
+                self.evictions += 1
+
+    def _expiry(self, share_token=None):
+        expires = time.time() + self.ttl
+        if share_token is not None and share_token.expires_at is not None:
+            token_exp = (share_token.expires_at - datetime.utcnow()).total_seconds()
+            expires = min(expires, time.time() + max(0.0, token_exp))
+        return expires
+
+    def get_token(self, identifier):
+        with self._lock:
+            item = self._get_locked(self._tokens, identifier)
+            return item[1] if item else None
+
+    def put_token(self, identifier, share_token):
+        snapshot = ShareTokenSnapshot(share_token)
+        with self._lock:
+            self._tokens[identifier] = (self._expiry(share_token), snapshot)
+            self._trim_locked()
+        return snapshot
+
+    def get_doc(self, document_id):
+        with self._lock:
+            item = self._get_locked(self._docs, document_id)
+            return item[1] if item else None
+
+    def put_doc(self, document_id, doc):
+        size = len(str(doc.get("text") or "")) + 512
+        with self._lock:
+            self._drop_locked(self._docs, document_id)
+            self._docs[document_id] = (self._expiry(), doc, size)
+            self._bytes += size
+            self._trim_locked()
+
+    def get_page(self, identifier):
+        with self._lock:
+            item = self._get_locked(self._pages, identifier)
+            return item[2] if item else None
+
+    def put_page(self, identifier, share_token, html):
+        with self._lock:
+            self._drop_locked(self._pages, identifier)
+            self._pages[identifier] = (self._expiry(share_token), share_token.document_id, html)
+            self._bytes += len(html)
+            self._trim_locked()
+
+    def invalidate_token(self, identifier):
+        with self._lock:
+            self._drop_locked(self._tokens, identifier)
+            self._drop_locked(self._pages, identifier)
+            self.invalidations += 1
+
+    def invalidate_document(self, document_id):
+        with self._lock:
+            self._drop_locked(self._docs, document_id)
+            for key in [k for k, v in self._pages.items() if v[1] == document_id]:
+                self._drop_locked(self._pages, key)
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "tokens": len(self._tokens),
+                "documents": len(self._docs),
+                "pages": len(self._pages),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+shared_cache = SharedDocumentCache(SHARED_CACHE_TTL, SHARED_CACHE_SIZE, SHARED_CACHE_MAX_BYTES)
+
+def invalidate_shared_token(identifier):
+    """Buang token/halaman ter-cache di proses ini dan di worker lain (lewat state_store, seperti stop)."""
+    shared_cache.invalidate_token(identifier)
+    state_store.publish("shared_invalidate", {"origin": STATE_ORIGIN, "token": identifier})
+
+def invalidate_shared_document(document_id):
+    shared_cache.invalidate_document(document_id)
+    state_store.publish("shared_invalidate", {"origin": STATE_ORIGIN, "document_id": document_id})
+
+def _on_remote_shared_invalidate(message):
+    message = message or {}
+    if message.get("origin") == STATE_ORIGIN:
+        return
+    if message.get("token"):
+        shared_cache.invalidate_token(message["token"])
+    if message.get("document_id"):
+        shared_cache.invalidate_document(message["document_id"])
+
+state_store.subscribe("shared_invalidate", _on_remote_shared_invalidate)
+
+def _fetch_shared_doc(document_id):
+    """Dokumen untuk halaman shared, dari cache, outbox (belum terkirim), atau Supabase (None jika tidak ada)."""
+    doc = shared_cache.get_doc(document_id)
+    if doc is not None:
+        return doc
+    # share_url dari /save langsung bisa dibuka walau flusher belum mengirim barisnya
+    pending = save_outbox.get(str(document_id)) if save_outbox else None
+    if pending is not None:
+        return pending
+    res = supabase.table("documents").select("*").eq("id", document_id).limit(1).execute()
+    if not res or not getattr(res, "data", None):
+        return None
+    doc = res.data[0]
+    shared_cache.put_doc(document_id, doc)
+    return doc
+
+
+# =========================
+# Share token sweeper
+# =========================
+# Token yang sudah tidak bisa dipakai (kedaluwarsa, dicabut, atau max_views tercapai) dipindah dari
+# tabel aktif secara periodik, per batch kecil agar tidak menahan lock SQLite lama. Masa tenggang
+# SHARE_SWEEP_GRACE_DAYS membuat token mati masih terlihat sebentar di /api/share/list.
+SHARE_SWEEP_SECONDS = float(os.getenv("SHARE_SWEEP_SECONDS", "600"))  # 0 = sweeper mati
+SHARE_SWEEP_MODE = os.getenv("SHARE_SWEEP_MODE", "archive").strip().lower()  # archive | purge
+SHARE_SWEEP_GRACE_DAYS = float(os.getenv("SHARE_SWEEP_GRACE_DAYS", "7"))
+SHARE_SWEEP_BATCH = int(os.getenv("SHARE_SWEEP_BATCH", "500"))
+SHARE_SWEEP_MAX_BATCHES = int(os.getenv("SHARE_SWEEP_MAX_BATCHES", "20"))  # per putaran
+SHARE_ARCHIVE_RETENTION_DAYS = float(os.getenv("SHARE_ARCHIVE_RETENTION_DAYS", "90"))  # 0 = simpan selamanya
+
+share_tokens_swept = metrics.counter(
+    "notaku_share_tokens_swept_total", "Share token yang dipindah/dihapus sweeper.", ("reason", "action"))
+
+class ShareTokenSweeper:
+    def __init__(self, interval: float, mode: str, grace_days: float, batch: int, max_batches: int,
+                 archive_retention_days: float):
+        self.interval = interval
+        self.archive = mode != "purge"
+        self.grace = timedelta(days=max(0.0, grace_days))
+        self.batch = max(1, batch)
+        self.max_batches = max(1, max_batches)
+        self.archive_retention = timedelta(days=archive_retention_days) if archive_retention_days > 0 else None
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.swept = {"expired": 0, "revoked": 0, "view_limit": 0}
+        self.archive_purged = 0
+        self.errors = 0
+        self.last_run_at = None
+        self.last_run_seconds = 0.0
+
+    def _criteria(self, cutoff):
+        table = ShareToken.__table__.c
+        return (
+            ("expired", table.expires_at < cutoff),
+            # Waktu pencabutan tidak disimpan; created_at + tenggang sebagai batas bawah
+            ("revoked", db.and_(table.is_active.is_(False), table.created_at < cutoff)),
+            ("view_limit", db.and_(table.max_views.isnot(None), table.view_count >= table.max_views,
+                                   table.created_at < cutoff)),
+        )
+
+    def _sweep_batch(self, reason: str, condition) -> int:
+        table = ShareToken.__table__
+        rows = db.session.execute(
+            db.select(table).where(condition).order_by(table.c.id).limit(self.batch)
+        ).mappings().all()
+        if not rows:
+            return 0
+        ids = [row["id"] for row in rows]
+        if self.archive:
+            db.session.execute(ShareTokenArchive.__table__.insert(), [
+                {col: row[col] for col in row.keys() if col != "id"}
+                | {"token_id": row["id"], "reason": reason, "archived_at": datetime.utcnow()}
+                for row in rows
+            ])
+        db.session.execute(table.delete().where(table.c.id.in_(ids)))
+        db.session.commit()
+        for row in rows:
+            view_counter.forget(row["id"])
+            invalidate_shared_token(row["token"])
+        share_tokens_swept.inc(len(rows), reason=reason, action="archive" if self.archive else "purge")
+        return len(rows)
+
+    def sweep(self) -> int:
+        """Satu putaran: maksimal max_batches batch per kriteria. Kembalikan jumlah token yang dipindah."""
+        started = time.perf_counter()
+        if not share_db.get():
+            return 0
+        view_counter.flush()  # view yang masih di buffer ikut menentukan max_views
+        cutoff = datetime.utcnow() - self.grace
+        total = 0
+        try:
+            with app.app_context():
+                for reason, condition in self._criteria(cutoff):
+                    for _ in range(self.max_batches):
+                        n = self._sweep_batch(reason, condition)
+                        with self._lock:
+                            self.swept[reason] += n
+                        total += n
+                        if n < self.batch:
+                            break
+                        sleep(0)  # beri giliran ke request lain di antara batch
+                if self.archive_retention is not None:
+                    archive = ShareTokenArchive.__table__
+                    purged = db.session.execute(
+                        archive.delete().where(archive.c.archived_at < datetime.utcnow() - self.archive_retention)
+                    ).rowcount or 0
+                    db.session.commit()
+                    with self._lock:
+                        self.archive_purged += purged
+        except Exception as e:
+            print(f"[WARN] Share token sweep failed: {e}")
+            with self._lock:
+                self.errors += 1
+            try:
+                with app.app_context():
+                    db.session.rollback()
+            except Exception:
+                pass
+        with self._lock:
+            self.runs += 1
+            self.last_run_at = time.time()
+            self.last_run_seconds = time.perf_counter() - started
+        return total
+
+    def run(self):
+        while True:
+            sleep(self.interval)
+            self.sweep()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "interval_seconds": self.interval,
+                "mode": "archive" if self.archive else "purge",
+                "grace_days": self.grace.total_seconds() / 86400,
+                "runs": self.runs,
+                "swept": dict(self.swept),
+                "archive_purged": self.archive_purged,
+                "errors": self.errors,
+                "last_run_at": datetime.utcfromtimestamp(self.last_run_at).isoformat() + "Z" if self.last_run_at else None,
+                "last_run_seconds": round(self.last_run_seconds, 3),
+            }
+
+share_sweeper = ShareTokenSweeper(SHARE_SWEEP_SECONDS, SHARE_SWEEP_MODE, SHARE_SWEEP_GRACE_DAYS, SHARE_SWEEP_BATCH,
+                                  SHARE_SWEEP_MAX_BATCHES, SHARE_ARCHIVE_RETENTION_DAYS)
+
+
+# =========================
+# Summary cache (LRU + TTL, opsional SQLite)
+# =========================
+
+SUMMARY_CACHE_SIZE = int(os.getenv("SUMMARY_CACHE_SIZE", "256"))
+SUMMARY_CACHE_TTL = float(os.getenv("SUMMARY_CACHE_TTL", str(24 * 3600)))
+SUMMARY_CACHE_PERSIST = os.getenv("SUMMARY_CACHE_PERSIST", "false").strip().lower() == "true"
+
+def summary_cache_key(text: str, mode: str, model: str = None) -> str:
+    """Hash konten: teks dinormalisasi (spasi dirapikan) + mode + model yang menjawab (default MODEL)."""
+    normalized = " ".join((text or "").split())
+    raw = f"{model or MODEL}\x00{(mode or 'rapat').lower()}\x00{normalized}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def summary_cache_models():
+    """Model yang mungkin menjawab (urutan route); ringkasan dari route cadangan disimpan dengan modelnya sendiri."""
+    return list(dict.fromkeys(r.model for r in llm_router.routes)) or [MODEL]
+
+def summary_cache_keys(text: str, mode: str):
+    return [summary_cache_key(text, mode, model) for model in summary_cache_models()]
+
+class SummaryCache:
+    """
+    Cache ringkasan dua tingkat:
+    - LRU in-process dengan TTL
+    - SQLite opsional (di samping share_tokens.db) agar bertahan saat restart
+    """
+
+    def __init__(self, max_entries: int, ttl: float, db_path: str = None, table: str = "summary_cache"):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.table = table
+        self._entries = OrderedDict()  # {key: (expires_at, summary)}
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.persistent_hits = 0
+        if db_path:
+            try:
+                self._db = sqlite3.connect(db_path, check_same_thread=False)
+                self._db.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table} ("
+                    "key TEXT PRIMARY KEY, summary TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+                self._db.commit()
+            except Exception as e:
+                print(f"[WARN] Summary cache SQLite disabled: {e}")
+                self._db = None
+
+    def get(self, key: str):
+        return self.get_any([key])
+
+    def get_any(self, keys):
+        """Nilai pertama yang ada untuk salah satu kunci (mis. satu kunci per model route); satu hit/miss."""
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                item = self._entries.get(key)
+                if item is None:
+                    continue
+                expires_at, summary = item
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return summary
+                del self._entries[key]
+                self.evictions += 1
+            if self._db is not None:
+                for key in keys:
+                    try:
+                        row = self._db.execute(
+                            f"SELECT summary, expires_at FROM {self.table} WHERE key = ?", (key,)
+                        ).fetchone()
+                    except Exception:
+                        row = None
+                    if row and row[1] > now:
+                        self._store_locked(key, row[0], row[1])
+                        self.hits += 1
+                        self.persistent_hits += 1
+                        return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, summary: str):
+        if not summary:
+            return
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store_locked(key, summary, expires_at)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        f"INSERT OR REPLACE INTO {self.table} (key, summary, expires_at) VALUES (?, ?, ?)",
+                        (key, summary, expires_at),
+                    )
+                    self._db.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (time.time(),))
+                    self._db.commit()
+                except Exception as e:
+                    app.logger.debug("Summary cache SQLite write failed: %s", e)
+
+    def _store_locked(self, key, summary, expires_at):
+        self._entries[key] = (expires_at, summary)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "persistent": self._db is not None,
+                "hits": self.hits,
+                "persistent_hits": self.persistent_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            }
+
+def _summary_cache_db_path():
+    if not SUMMARY_CACHE_PERSIST:
+        return None
+    path = os.getenv("SUMMARY_CACHE_DB") or os.path.join(app.instance_path, "summary_cache.db")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    return path
+
+summary_cache = SummaryCache(SUMMARY_CACHE_SIZE, SUMMARY_CACHE_TTL, _summary_cache_db_path())
+
+# Store ringkasan per potongan (map) dan per kelompok reduce untuk re-summarize inkremental.
+# Kunci hanya isi potongan + mode + model, jadi transkrip yang diedit sedikit memakai ulang sebagian besar.
+# Label posisi "BAGIAN i dari n" di prompt map sengaja tidak ikut kunci: potongan yang bergeser posisi
+# (mis. setelah sisipan di awal) tetap memakai ringkasan lama yang labelnya sudah tidak persis sama.
+CHUNK_SUMMARY_CACHE_SIZE = int(os.getenv("CHUNK_SUMMARY_CACHE_SIZE", "4096"))
+CHUNK_SUMMARY_CACHE_TTL = float(os.getenv("CHUNK_SUMMARY_CACHE_TTL", str(7 * 24 * 3600)))
+
+def chunk_summary_key(text: str, mode: str, kind: str = "map", model: str = None) -> str:
+    return summary_cache_key(f"{kind}\x00{text}", mode, model)
+
+def chunk_summary_keys(text: str, mode: str, kind: str = "map"):
+    return summary_cache_keys(f"{kind}\x00{text}", mode)
+
+chunk_summary_cache = SummaryCache(CHUNK_SUMMARY_CACHE_SIZE, CHUNK_SUMMARY_CACHE_TTL, _summary_cache_db_path(),
+                                   table="chunk_summary_cache")
+
+def cached_summary_frames(summary: str, piece_size: int = None):
+    """Frame token lalu final untuk ringkasan dari cache, agar protokol klien sama dengan stream biasa."""
+    piece_size = piece_size or max(1, STREAM_FLUSH_BYTES)
+    for i in range(0, len(summary), piece_size):
+        yield {"token": summary[i:i + piece_size]}
+    yield {"final": summary, "end": True, "cached": True}
+
+def _replay_cached_summary(send, summary: str, piece_size: int = None):
+    for frame in cached_summary_frames(summary, piece_size):
+        send(frame)
+        socketio.sleep(0)
+
+
+# =========================
+# Error handler
+# =========================
+@app.errorhandler(Exception)
+def handle_exception(e):
+    code = 500
+    msg = str(e)
+    if isinstance(e, HTTPException):
+        code = e.code or 500
+        msg = e.description
+    elif isinstance(e, ComponentUnavailable):
+        code = 503
+    return jsonify({"error": msg}), code
+
+# Latency per route untuk /metrics (pakai pola route, bukan path asli, agar label tidak meledak)
+@app.before_request
+def _metrics_start_timer():
+    g.metrics_started = time.perf_counter()
+
+@app.after_request
+def _metrics_observe_request(response):
+    started = g.pop("metrics_started", None)
+    if METRICS_ENABLED and started is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        http_request_seconds.observe(
+            time.perf_counter() - started, method=request.method, route=route, status=response.status_code)
+    return response
+
+
+# =========================
+# Pages
+# =========================
+@app.route("/")
+def base_page():
+    return render_template("base.html")
+
+@app.route("/dashboard")
+def dashboard_page():
+    return render_template("dashboard.html")
+
+@app.route("/voice")
+def voice_page():
+    return render_template("index.html")
+
+@app.route("/history")
+@require_auth
+def history_page():
+    return render_template("history.html", history=list(history_store))
+
+@app.route("/settings")
+def settings_page():
     return render_template("settings.html")
 
-@app.route("/shared/<identifier>", methods=["GET"])
-def shared_document(identifier):
+def resolve_share_token(identifier):
+    """Snapshot ShareToken untuk identifier dari cache atau database (None jika tidak ada)."""
+    share_token = shared_cache.get_token(identifier)
+    if share_token is None:
+        share_db.require()  # DB share token mati: ComponentUnavailable (503), bukan "tidak ditemukan"
+        try:
+            row = ShareToken.query.filter_by(token=identifier).first()
+        except Exception:
+            row = None
+        if row is not None:
+            share_token = shared_cache.put_token(identifier, row)
+    return share_token
+
+def shared_document_result(identifier, fetch_doc, render):
     """
-    Safe handler: jika identifier valid UUID -> ambil dokumen langsung.
-    Jika bukan UUID -> anggap sebagai share token dan fallback.
+    Logika GET /shared/<identifier> untuk route Flask dan asgi.shared_document: ("json" | "html", status, body).
+    Jika identifier valid UUID -> ambil dokumen langsung. Jika bukan UUID -> anggap sebagai share token.
+    fetch_doc(document_id) dan render(template, **context) disediakan front end; ComponentUnavailable
+    (DB share token mati) diteruskan agar menjadi 503.
     """
     try:
-        # 1) Jika identifier adalah UUID yang valid, coba query dokumen langsung
-        if supabase:
+        # 1) Jika identifier adalah UUID yang valid, coba query dokumen langsung (termasuk outbox)
+        if supabase or save_outbox:
             try:
                 uuid.UUID(identifier)  # raises ValueError jika bukan UUID
-                res = supabase.table("documents").select("*").eq("id", identifier).limit(1).execute()
-                if res and getattr(res, "data", None):
-                    return jsonify(res.data[0])
+                doc = fetch_doc(identifier)
+                if doc is not None:
+                    return "json", 200, doc
             except ValueError:
                 # bukan UUID -> lanjut ke pengecekan token
                 pass
@@ -326,37 +2508,41 @@ def shared_document(identifier):
                 app.logger.debug("Supabase direct id query failed: %s", e)
 
         # 2) Fallback: treat identifier as share token
-        share_token = None
-        try:
-            share_token = ShareToken.query.filter_by(token=identifier).first()
-        except Exception:
-            share_token = None
+        share_token = resolve_share_token(identifier)
 
         if not share_token:
-            return render_template("shared.html", error="Document not found"), 404
+            return "html", 404, render("shared.html", error="Document not found")
 
         if not share_token.can_access():
-            return render_template("shared.html", error="Share token expired or revoked"), 410
+            return "html", 410, render("shared.html", error="Share token expired or revoked")
 
-        # Ambil dokumen dari Supabase berdasarkan document_id pada token
-        try:
-            doc_res = supabase.table("documents").select("*").eq("id", share_token.document_id).limit(1).execute()
-            if not doc_res or not getattr(doc_res, "data", None):
-                return render_template("shared.html", error="Document not found"), 404
-            doc = doc_res.data[0]
-        except Exception as e:
-            return render_template("shared.html", error=f"Failed to fetch document: {e}"), 500
+        html = shared_cache.get_page(identifier)
+        if html is None:
+            # Ambil dokumen dari Supabase berdasarkan document_id pada token
+            try:
+                doc = fetch_doc(share_token.document_id)
+                if doc is None:
+                    return "html", 404, render("shared.html", error="Document not found")
+            except Exception as e:
+                return "html", 500, render("shared.html", error=f"Failed to fetch document: {e}")
+            html = render("shared.html", doc=doc, token=identifier)
+            shared_cache.put_page(identifier, share_token, html)
 
         # Increment view count and render
-        try:
-            share_token.increment_view_count()
-        except Exception:
-            app.logger.debug("Failed to increment share token view count")
+        if not share_token.increment_view_count():
+            return "html", 410, render("shared.html", error="Share token expired or revoked")
 
-        return render_template("shared.html", doc=doc, token=identifier)
+        return "html", 200, html
+    except ComponentUnavailable:
+        raise
     except Exception as e:
         app.logger.exception("shared_document error")
-        return jsonify({"error": str(e)}), 500
+        return "json", 500, {"error": str(e)}
+
+@app.route("/shared/<identifier>", methods=["GET"])
+def shared_document(identifier):
+    kind, status, body = shared_document_result(identifier, _fetch_shared_doc, render_template)
+    return (jsonify(body) if kind == "json" else body), status  # ComponentUnavailable -> handle_exception (503)
 
 @app.route("/s/<identifier>")
 def s_short_redirect(identifier):
@@ -370,122 +2556,711 @@ def init_db():
     """Initialize the database tables"""
     with app.app_context():
         db.create_all()
+        # create_all tidak menambah index ke tabel yang sudah ada (DB lama)
+        for index in ShareToken.__table__.indexes:
+            index.create(bind=db.engine, checkfirst=True)
         print("Database tables created successfully!")
+    return db
+
+# Tabel dibuat saat warmup atau saat share token pertama kali diakses (share_db.require())
+share_db = components.add("share_db", init_db)
+spawn(view_counter.run)
+atexit.register(view_counter.flush)
+if SHARE_SWEEP_SECONDS > 0:
+    spawn(share_sweeper.run)
+# Semua komponen sudah terdaftar: mulai warmup bersamaan tanpa menahan import
+components.start()
+
+
+# =========================
+# Settings routes
+# =========================
+@app.route("/set_summary_mode", methods=["POST"])
+def set_summary_mode():
+    data = request.get_json(force=True, silent=True) or {}
+    mode = (data.get("mode") or "rapat").strip().lower()
+    # Mode default adalah "rapat" untuk notulensi rapat
+    if mode not in ["rapat", "meeting"]:
+        mode = "rapat"  # fallback ke default
+    state_store.set("settings", "summary_mode", mode)
+    return jsonify({"status":"ok","mode": mode})
+
+@app.route("/get_summary_mode", methods=["GET"])
+def get_summary_mode():
+    return jsonify({"mode": get_current_summary_mode()})
+
+
+# =========================
+# API Routes
+# =========================
+@app.route("/test", methods=["GET"])
+def test():
+    return jsonify({"status": "connected", "message": "Backend is running"})
+
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    # Liveness: proses hidup dan melayani request; tidak menyentuh dependency eksternal
+    return jsonify({"status": "ok", "uptime_seconds": round(time.time() - PROCESS_STARTED_AT, 3)})
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    body = components.readiness()
+    return jsonify(body), 200 if body["ready"] else 503
 
-# Initialize database on startup
-init_db()
+@app.route("/summarize", methods=["POST"])
+@require_auth
+def summarize():
+    data = request.get_json(force=True, silent=True) or {}
+    text = (data.get("text") or "").strip()
+    mode = (data.get("mode") or get_current_summary_mode()).strip().lower()
+    if not text:
+        return jsonify({"error": "Teks kosong"}), 400
+    # Teks terlalu pendek → ringkasan singkat agar cepat
+    if len(text) < 20:
+        return jsonify({"summary": "Teks terlalu pendek untuk diringkas. Tambahkan lebih banyak konteks."}), 200
+
+    cached = summary_cache.get_any(summary_cache_keys(text, mode))
+    if cached is not None:
+        return jsonify({"summary": cached, "user": g.user, "cached": True})
+    if not client:
+        return jsonify({"error": "groq_api_key_missing"}), 500
+
+    user_id = g.user.get("sub")
+    report = {}
+    try:
+        prompt = prepare_summary_prompt(text, mode, user_id=user_id, on_preprocess=report.update)
+        model, summary = _chat_complete_routed(prompt, user_id)
+        summary_cache.put(summary_cache_key(text, mode, model), summary)
+        return jsonify({"summary": summary, "user": g.user, "preprocess": report})
+    except LLMGatewayBusy as e:
+        resp = jsonify({"error": "server_busy", "reason": str(e)})
+        resp.headers["Retry-After"] = "5"
+        return resp, 429
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Streaming tanpa Socket.IO: frame `summary_stream` yang sama dikirim sebagai Server-Sent Events
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "10"))
+# Komentar SSE: menjaga proxy tetap terbuka dan mendeteksi klien yang sudah putus
+SSE_KEEPALIVE_EVENT = ": keepalive\n\n"
+SSE_HEADERS = {
+    "Content-Type": "text/event-stream; charset=utf-8",
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # nginx: jangan buffer stream
+}
+sse_streams = set()  # stop event stream SSE yang sedang berjalan
+metrics.gauge("notaku_sse_streams", "Stream ringkasan SSE yang sedang berjalan.", lambda: len(sse_streams))
+
+def sse_event(payload: dict) -> str:
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+def sse_summary_plan(text: str, mode: str):
+    """
+    Keputusan awal /summarize/stream: ("reject", (status, body)), ("frame", payload) untuk satu
+    frame lalu selesai, ("cached", summary), atau ("stream", None).
+    """
+    if not text:
+        return "reject", (400, {"error": "Teks kosong"})
+    if len(text) < 20:
+        return "frame", {"final": "Teks terlalu pendek untuk diringkas. Tambahkan lebih banyak konteks.", "end": True}
+    cached = summary_cache.get_any(summary_cache_keys(text, mode))
+    if cached is not None:
+        return "cached", cached
+    if not client:
+        return "reject", (500, {"error": "groq_api_key_missing"})
+    if llm_gateway.is_full():
+        return "reject", (429, {"error": "server_busy", "queue_full": True})
+    return "stream", None
+
+@app.route("/summarize/stream", methods=["POST"])
+@require_auth
+def summarize_stream_sse():
+    """
+    Seperti /summarize, tetapi hasilnya di-stream sebagai text/event-stream. Tiap event `data:` berisi
+    JSON berbentuk sama dengan frame socket `summary_stream` (progress/queue/token, lalu final+end atau
+    error+end). Koneksi klien yang putus menghentikan generate.
+    """
+    data = request.get_json(force=True, silent=True) or {}
+    text = (data.get("text") or "").strip()
+    mode = (data.get("mode") or get_current_summary_mode()).strip().lower()
+    user_id = g.user.get("sub")
+
+    kind, value = sse_summary_plan(text, mode)
+    if kind == "reject":
+        status, body = value
+        resp = jsonify(body)
+        if status == 429:
+            resp.headers["Retry-After"] = "5"
+        return resp, status
+    if kind == "frame":
+        def job(send, stop_evt):
+            send(value)
+    elif kind == "cached":
+        def job(send, stop_evt):
+            _replay_cached_summary(send, value)
+    else:
+        def job(send, stop_evt):
+            run_summary_stream(send, text, mode, user_id, stop_evt, label=f"sse {user_id}")
+
+    def generate():
+        frames = WorkQueue()
+        stop_evt = Event()
+
+        def worker():
+            try:
+                job(frames.put, stop_evt)
+            finally:
+                frames.put(None)
+
+        sse_streams.add(stop_evt)
+        spawn(worker)
+        try:
+            while True:
+                try:
+                    payload = frames.get(timeout=SSE_KEEPALIVE_SECONDS)
+                except QueueEmpty:
+                    yield SSE_KEEPALIVE_EVENT
+                    continue
+                if payload is None:
+                    break
+                yield sse_event(payload)
+        finally:
+            # Selesai normal atau klien putus (GeneratorExit): hentikan worker yang masih jalan
+            stop_evt.set()
+            sse_streams.discard(stop_evt)
+
+    return Response(generate(), headers=SSE_HEADERS)
+
+@app.route("/api/auth_cache/stats", methods=["GET"])
+@require_admin
+def auth_cache_stats():
+    return jsonify(jwt_cache_stats())
+
+@app.route("/api/llm_gateway/stats", methods=["GET"])
+@require_admin
+def llm_gateway_stats():
+    return jsonify(llm_gateway.stats())
+
+@app.route("/api/llm_router/stats", methods=["GET"])
+@require_admin
+def llm_router_stats():
+    return jsonify(llm_router.stats())
+
+@app.route("/api/socket_sessions/stats", methods=["GET"])
+@require_admin
+def socket_sessions_stats():
+    return jsonify(socket_sessions.stats())
+
+@app.route("/api/outbox/stats", methods=["GET"])
+@require_admin
+def outbox_stats():
+    if not save_outbox:
+        return jsonify({"enabled": False})
+    return jsonify(dict(save_outbox.stats(), enabled=True))
+
+@app.route("/api/share/cache/stats", methods=["GET"])
+@require_admin
+def shared_cache_stats():
+    return jsonify(shared_cache.stats())
+
+@app.route("/api/share/sweeper/stats", methods=["GET"])
+@require_admin
+def share_sweeper_stats():
+    return jsonify(share_sweeper.stats())
+
+@app.route("/api/share/view_counter/stats", methods=["GET"])
+@require_admin
+def view_counter_stats():
+    return jsonify(view_counter.stats())
+
+@app.route("/api/summary_cache/stats", methods=["GET"])
+@require_admin
+def summary_cache_stats():
+    return jsonify(summary_cache.stats())
+
+@app.route("/api/summary_cache/chunks/stats", methods=["GET"])
+@require_admin
+def chunk_summary_cache_stats():
+    return jsonify(chunk_summary_cache.stats())
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    if not METRICS_ENABLED:
+        abort(404)
+    return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+@app.route("/save", methods=["POST"])
+@require_auth
+def save_summary():
+    payload = request.get_json(force=True, silent=False) or {}
+    text = (payload.get("text") or "").strip()
+    meta = payload.get("meta") or {}
+    if not text:
+        return jsonify({"error": "empty_text"}), 400
+    entry = {
+        "id": str(uuid.uuid4()),
+        "text": text,
+        "meta": meta,
+        "created_at": _now_iso(),
+        "user_id": g.user["sub"],
+        "email": g.user.get("email"),
+    }
+    # Generate UUID untuk ID dokumen dan simpan ke Supabase.
+    # Dengan idempotency key, ID deterministik sehingga retry klien tidak membuat duplikat.
+    idem_key = payload.get("idempotency_key") or request.headers.get("Idempotency-Key")
+    doc_id = idempotent_document_id(g.user["sub"], idem_key) if idem_key else str(uuid.uuid4())
+    entry["id"] = doc_id
+    row = {
+        "id": doc_id,
+        "user_id": g.user["sub"],
+        "text": text,
+        "meta": meta,
+        "created_at": entry["created_at"]
+    }
+    duplicate = False
+    pending = False
+    if save_outbox:
+        # Commit lokal dulu; flusher background yang mengirim ke Supabase
+        try:
+            duplicate = not save_outbox.enqueue(row)
+            pending = True
+        except Exception as e:
+            return jsonify({"error": f"Gagal simpan ke outbox: {e}"}), 500
+    else:
+        try:
+            if idem_key:
+                res = supabase.table("documents").upsert(row, on_conflict="id", ignore_duplicates=True).execute()
+                duplicate = not (res.data or [])
+            else:
+                res = supabase.table("documents").insert(row).execute()
+        except Exception as e:
+            return jsonify({"error": f"Gagal simpan ke Supabase: {e}"}), 500
+    if not duplicate:
+        after_documents_saved([row])
+
+    # Kembalikan entry beserta share URL (gunakan host runtime)
+    share_url = f"{request.host_url.rstrip('/')}/s/{doc_id}"
+    return jsonify({
+        "status": "ok",
+        "entry": entry,
+        "share_url": share_url,
+        "duplicate": duplicate,
+        "pending": pending,
+    }), 200
+
+# =========================
+# Save outbox (write-ahead)
+# =========================
+# SaveOutbox (antrian SQLite + flusher ke Supabase) ada di outbox.py; di sini instance-nya dan
+# penggabungan baris pending ke halaman history.
+def _outbox_rows_sent(rows):
+    # Hook dokumen (index pencarian, cache shared) sudah dijalankan /save saat enqueue; di sini cukup
+    # buang halaman history ter-cache yang belum memuat baris ini (sebelumnya disisipkan sebagai pending)
+    for user_id in {row["user_id"] for row in rows}:
+        invalidate_history_cache(user_id)
+
+save_outbox = None
+if SAVE_OUTBOX_ENABLED:
+    try:
+        _outbox_path = os.getenv("SAVE_OUTBOX_DB") or os.path.join(app.instance_path, "outbox.db")
+        os.makedirs(os.path.dirname(_outbox_path) or ".", exist_ok=True)
+        save_outbox = SaveOutbox(_outbox_path, lambda: supabase, on_sent=_outbox_rows_sent)
+        spawn(save_outbox.run)
+    except Exception as e:
+        print(f"[WARN] Save outbox disabled: {e}")
+
+def merge_pending_history(page: dict, user_id: str, cursor=None) -> dict:
+    """Sisipkan entri outbox yang belum terkirim ke halaman history pada rentang keyset-nya."""
+    if not save_outbox:
+        return page
+    pending = save_outbox.pending_for_user(user_id)
+    if not pending:
+        return page
+    items = page["history"]
+    # Urutan keyset (created_at, id) dibandingkan sebagai waktu: format string outbox dan Supabase berbeda
+    upper = _history_order_key(*cursor) if cursor else None
+    lower = _history_order_key(items[-1]["created_at"], items[-1]["id"]) if page.get("has_more") and items else None
+    known = {item["id"] for item in items}
+    extra = []
+    for row in pending:
+        key = _history_order_key(row["created_at"], row["id"])
+        if row["id"] in known or (upper and key >= upper) or (lower and key < lower):
+            continue
+        extra.append(dict(_history_item(row), pending=True))
+    if not extra:
+        return page
+    merged = sorted(items + extra, key=lambda it: _history_order_key(it.get("created_at"), it.get("id")), reverse=True)
+    return dict(page, history=merged)
+
+def _history_order_key(created_at, doc_id):
+    return parse_timestamp(created_at) or _EPOCH, doc_id or ""
+
+# =========================
+# Batch save
+# =========================
+SAVE_BATCH_MAX = int(os.getenv("SAVE_BATCH_MAX", "500"))
+SAVE_BATCH_CHUNK = int(os.getenv("SAVE_BATCH_CHUNK", "100"))
+# Namespace tetap untuk uuid5(user_id + idempotency key)
+IDEMPOTENCY_NAMESPACE = uuid.UUID("2aae18ac-ddcd-4164-bd25-894d1d698318")
+
+def idempotent_document_id(user_id: str, key: str) -> str:
+    return str(uuid.uuid5(IDEMPOTENCY_NAMESPACE, f"{user_id}:{key}"))
+
+@app.route("/save/batch", methods=["POST"])
+@require_auth
+def save_batch():
+    """
+    Simpan banyak dokumen sekaligus: {"entries": [{"text", "meta", "idempotency_key"}, ...]}.
+    Ditulis per chunk sebagai multi-row insert; hasil dilaporkan per item.
+    """
+    payload = request.get_json(force=True, silent=True) or {}
+    entries = payload.get("entries")
+    if not isinstance(entries, list) or not entries:
+        return jsonify({"error": "entries is required"}), 400
+    if len(entries) > SAVE_BATCH_MAX:
+        return jsonify({"error": f"too_many_entries (max {SAVE_BATCH_MAX})"}), 413
+    if not supabase:
+        return jsonify({"error": "supabase_disabled"}), 500
+
+    user_id = g.user["sub"]
+    results = [None] * len(entries)
+    pending = []  # [(index, row)]
+    seen = {}     # {doc_id: index pertama} untuk duplikat di dalam batch yang sama
+    for i, item in enumerate(entries):
+        if not isinstance(item, dict):
+            results[i] = {"index": i, "status": "invalid", "error": "entry must be an object"}
+            continue
+        text = (item.get("text") or "").strip()
+        if not text:
+            results[i] = {"index": i, "status": "invalid", "error": "empty_text"}
+            continue
+        key = item.get("idempotency_key")
+        doc_id = idempotent_document_id(user_id, str(key)) if key else str(uuid.uuid4())
+        if doc_id in seen:
+            results[i] = {"index": i, "status": "duplicate", "id": doc_id}
+            continue
+        seen[doc_id] = i
+        pending.append((i, {
+            "id": doc_id,
+            "user_id": user_id,
+            "text": text,
+            "meta": item.get("meta") or {},
+            "created_at": _now_iso(),
+        }))
+
+    saved_rows = []
+    for start in range(0, len(pending), max(1, SAVE_BATCH_CHUNK)):
+        chunk = pending[start:start + SAVE_BATCH_CHUNK]
+        rows = [row for _, row in chunk]
+        try:
+            # ON CONFLICT DO NOTHING: hanya baris baru yang dikembalikan
+            res = supabase.table("documents").upsert(rows, on_conflict="id", ignore_duplicates=True).execute()
+            created_ids = {r.get("id") for r in (res.data or [])}
+        except Exception as e:
+            for i, row in chunk:
+                results[i] = {"index": i, "status": "error", "id": row["id"], "error": str(e)}
+            continue
+        for i, row in chunk:
+            if row["id"] in created_ids:
+                results[i] = {"index": i, "status": "created", "id": row["id"]}
+                saved_rows.append(row)
+            else:
+                results[i] = {"index": i, "status": "duplicate", "id": row["id"]}
+
+    if saved_rows:
+        after_documents_saved(saved_rows)
+
+    counts = {}
+    for r in results:
+        counts[r["status"]] = counts.get(r["status"], 0) + 1
+    status = 200 if not counts.get("error") else 207
+    return jsonify({"status": "ok" if status == 200 else "partial", "results": results, "counts": counts}), status
+
+# =========================
+# History pagination
+# =========================
+# /api/history memakai keyset pagination (created_at, id) dan proyeksi ringan
+# (id, created_at, meta, preview). Teks lengkap diambil per item via /api/document/<id>.
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "20"))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE", "100"))
+HISTORY_PREVIEW_CHARS = int(os.getenv("HISTORY_PREVIEW_CHARS", "200"))
+HISTORY_CACHE_TTL = float(os.getenv("HISTORY_CACHE_TTL", "30"))
+HISTORY_CACHE_SIZE = int(os.getenv("HISTORY_CACHE_SIZE", "1024"))
+# Kolom generated opsional (lihat setup_database.sql); fallback ke potong `text` di server
+HISTORY_PREVIEW_COLUMN = os.getenv("HISTORY_PREVIEW_COLUMN", "text_preview")
+_history_preview_column_ok = bool(HISTORY_PREVIEW_COLUMN)
+
+class TTLCache:
+    """LRU kecil dengan TTL per entri."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self._entries = OrderedDict()  # {key: (expires, value)}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None or item[0] <= time.time():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key, value, ttl: float = None):
+        with self._lock:
+            self._entries[key] = (time.time() + (self.ttl if ttl is None else ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            return self._entries.pop(key, None)
+
+    def pop_where(self, predicate):
+        with self._lock:
+            for key in [k for k in self._entries if predicate(k)]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+history_first_page_cache = TTLCache(HISTORY_CACHE_SIZE, HISTORY_CACHE_TTL)
+
+def encode_history_cursor(row) -> str:
+    raw = json.dumps([row.get("created_at"), row.get("id")], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_history_cursor(cursor: str):
+    padded = cursor + "=" * (-len(cursor) % 4)
+    created_at, doc_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+    if not isinstance(created_at, str) or not isinstance(doc_id, str):
+        raise ValueError("invalid_cursor")
+    return created_at, doc_id
+
+def validate_history_cursor(cursor):
+    """(created_at, id) dokumen dalam bentuk baku; ValueError bila bukan timestamp ISO + UUID."""
+    created_at, doc_id = cursor
+    try:
+        return datetime.fromisoformat(created_at).isoformat(), str(uuid.UUID(doc_id))
+    except (TypeError, ValueError):
+        raise ValueError("invalid_cursor")
+
+def history_keyset_filter(cursor) -> str:
+    """Filter PostgREST keyset (created_at, id) menurun; nilai divalidasi dulu agar tidak bisa menyisipkan klausa."""
+    created_at, doc_id = validate_history_cursor(cursor)
+    return f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt."{doc_id}")'
+
+def _history_item(row) -> dict:
+    preview = row.get(HISTORY_PREVIEW_COLUMN) if HISTORY_PREVIEW_COLUMN else None
+    if preview is None:
+        preview = (row.get("text") or "")[:HISTORY_PREVIEW_CHARS]
+    return {
+        "id": row.get("id"),
+        "created_at": row.get("created_at"),
+        "meta": row.get("meta"),
+        "preview": preview,
+    }
+
+def fetch_history_page(user_id: str, limit: int, cursor=None):
+    """Satu halaman history milik user, urut (created_at, id) menurun."""
+    global _history_preview_column_ok
+
+    def run(columns):
+        q = supabase.table("documents").select(columns).eq("user_id", user_id)
+        if cursor:
+            q = q.or_(history_keyset_filter(cursor))
+        # Ambil satu baris ekstra untuk mengetahui apakah masih ada halaman berikutnya
+        return q.order("created_at", desc=True).order("id", desc=True).limit(limit + 1).execute()
+
+    if _history_preview_column_ok:
+        try:
+            result = run(f"id, created_at, meta, {HISTORY_PREVIEW_COLUMN}")
+        except Exception as e:
+            print(f"[WARN] History preview column unavailable, falling back to text: {e}")
+            _history_preview_column_ok = False
+            result = run("id, created_at, meta, text")
+    else:
+        result = run("id, created_at, meta, text")
+
+    rows = result.data or []
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "history": [_history_item(r) for r in rows],
+        "next_cursor": encode_history_cursor(rows[-1]) if has_more and rows else None,
+        "has_more": has_more,
+    }
+
+def invalidate_history_cache(user_id: str):
+    history_first_page_cache.pop_where(lambda key: key[0] == user_id)
+
+@app.route("/api/history", methods=["GET"])
+@require_auth
+def api_history():
+    user_id = g.user["sub"]
+    try:
+        limit = int(request.args.get("limit", HISTORY_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return jsonify({"error": "invalid_limit"}), 400
+    limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+    cursor = request.args.get("cursor")
+    try:
+        cursor = decode_history_cursor(cursor) if cursor else None
+        if cursor:
+            validate_history_cursor(cursor)
+    except Exception:
+        return jsonify({"error": "invalid_cursor"}), 400
+
+    # Halaman pertama di-cache per user; /save menghapusnya
+    cache_key = (user_id, limit)
+    page = history_first_page_cache.get(cache_key) if cursor is None else None
+    if page is None:
+        try:
+            page = fetch_history_page(user_id, limit, cursor)
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+        if cursor is None:
+            history_first_page_cache.put(cache_key, page)
+    return jsonify(merge_pending_history(page, user_id, cursor))
 
 
 # =========================
-# Settings routes
+# Full-text search (SQLite FTS5)
 # =========================
-@app.route("/set_summary_mode", methods=["POST"])
-def set_summary_mode():
-    global current_summary_mode
-    data = request.get_json(force=True, silent=True) or {}
-    mode = (data.get("mode") or "rapat").strip().lower()
-    # Mode default adalah "rapat" untuk notulensi rapat
-    if mode not in ["rapat", "meeting"]:
-        mode = "rapat"  # fallback ke default
-    current_summary_mode = mode
-    return jsonify({"status":"ok","mode": current_summary_mode})
-
-@app.route("/get_summary_mode", methods=["GET"])
-def get_summary_mode():
-    return jsonify({"mode": current_summary_mode})
+# SearchIndex ada di search_index.py; di sini instance-nya, backfill dari Supabase, dan /api/search.
+search_index = None
+if SEARCH_INDEX_ENABLED:
+    try:
+        _search_path = os.getenv("SEARCH_INDEX_DB") or os.path.join(app.instance_path, "search_index.db")
+        os.makedirs(os.path.dirname(_search_path) or ".", exist_ok=True)
+        search_index = SearchIndex(_search_path)
+    except Exception as e:
+        print(f"[WARN] Search index disabled: {e}")
 
+def backfill_search_index(user_id: str = None, batch_size: int = None) -> int:
+    """
+    Salin dokumen dari Supabase ke index lokal per batch (keyset pada created_at, id), lalu buang
+    dokumen index yang sudah tidak ada di Supabase (kecuali yang masih menunggu di outbox).
+    """
+    if not (search_index and supabase):
+        return 0
+    batch_size = batch_size or SEARCH_BACKFILL_BATCH
+    cursor, total = None, 0
+    seen, newest = set(), None
+    while True:
+        q = supabase.table("documents").select("id, user_id, created_at, meta, text")
+        if user_id:
+            q = q.eq("user_id", user_id)
+        if cursor:
+            q = q.or_(history_keyset_filter(cursor))
+        rows = q.order("created_at", desc=True).order("id", desc=True).limit(batch_size).execute().data or []
+        if not rows:
+            break
+        search_index.index_documents(rows)
+        seen.update(str(r["id"]) for r in rows)
+        newest = newest or rows[0].get("created_at")
+        total += len(rows)
+        if len(rows) < batch_size:
+            break
+        cursor = (rows[-1]["created_at"], rows[-1]["id"])
+        sleep(0)
+    # Dokumen yang tersimpan setelah scan dimulai (created_at > baris terbaru) tidak disentuh
+    pruned = search_index.prune(seen, user_id=user_id, created_until=newest,
+                                keep=(lambda doc_id: save_outbox.get(doc_id) is not None) if save_outbox else None)
+    if pruned:
+        print(f"[search] {pruned} dokumen terhapus dibuang dari index")
+    if user_id:
+        search_index.mark_user_backfilled(user_id)
+    return total
 
-# =========================
-# API Routes
-# =========================
-@app.route("/test", methods=["GET"])
-def test():
-    return jsonify({"status": "connected", "message": "Backend is running"})
+_search_reconciling = set()  # user yang backfill ulangnya sedang berjalan
 
-@app.route("/summarize", methods=["POST"])
-@require_auth
-def summarize():
-    data = request.get_json(force=True, silent=True) or {}
-    text = (data.get("text") or "").strip()
-    mode = (data.get("mode") or current_summary_mode).strip().lower()
-    if not text:
-        return jsonify({"error": "Teks kosong"}), 400
-    # Teks terlalu pendek → ringkasan singkat agar cepat
-    if len(text) < 20:
-        return jsonify({"summary": "Teks terlalu pendek untuk diringkas. Tambahkan lebih banyak konteks."}), 200
-    if not client:
-        return jsonify({"error": "groq_api_key_missing"}), 500
+def _spawn_search_reconcile(user_id: str):
+    """Backfill ulang index milik user di background (sekaligus membuang dokumen yang sudah dihapus)."""
+    if user_id in _search_reconciling:
+        return
+    _search_reconciling.add(user_id)
 
-    # Batasi panjang input agar responsif
-    if len(text) > 4000:
-        text = text[-4000:]
-    prompt = build_prompt(text, mode)
-    # Kurangi retry agar tidak menunggu terlalu lama
-    max_retries, base_sleep, attempt = 1, 1.5, 0
-    while True:
+    def run():
         try:
-            resp = client.chat.completions.create(
-                messages=[{"role": "user", "content": prompt}],
-                model=MODEL,
-                temperature=0.3,
-            )
-            summary_raw = (resp.choices[0].message.content or "").strip()
-            summary = strip_think(summary_raw)
-            return jsonify({"summary": summary, "user": g.user})
+            backfill_search_index(user_id)
         except Exception as e:
-            msg = str(e).lower()
-            is_rate = "rate limit" in msg or "rate_limit" in msg
-            is_conn = any(k in msg for k in ["connection", "timeout", "temporarily"])
-            retry_after = _parse_retry_after_seconds(str(e)) or base_sleep
-            attempt += 1
-            if (is_rate or is_conn) and attempt <= max_retries:
-                time.sleep(retry_after * (2 ** (attempt - 1)))
-                continue
-            return jsonify({"error": str(e)}), 500
+            app.logger.warning(f"Search reconcile for user failed: {e}")
+        finally:
+            _search_reconciling.discard(user_id)
 
-@app.route("/save", methods=["POST"])
-@require_auth
-def save_summary():
-    payload = request.get_json(force=True, silent=False) or {}
-    text = (payload.get("text") or "").strip()
-    meta = payload.get("meta") or {}
-    if not text:
-        return jsonify({"error": "empty_text"}), 400
-    entry = {
-        "id": str(uuid.uuid4()),
-        "text": text,
-        "meta": meta,
-        "created_at": _now_iso(),
-        "user_id": g.user["sub"],
-        "email": g.user.get("email"),
-    }
-    # Generate UUID untuk ID dokumen dan simpan ke Supabase
-    doc_id = str(uuid.uuid4())
-    entry["id"] = doc_id
+    spawn(run)
+
+def _backfill_all_on_start():
     try:
-        res = supabase.table("documents").insert({
-            "id": doc_id,
-            "user_id": g.user["sub"],
-            "text": text,
-            "meta": meta,
-            "created_at": entry["created_at"]
-        }).execute()
+        count = backfill_search_index()
+        print(f"[OK] Search index backfilled ({count} documents)")
     except Exception as e:
-        return jsonify({"error": f"Gagal simpan ke Supabase: {e}"}), 500
+        print(f"[WARN] Search backfill failed: {e}")
 
-    # Kembalikan entry beserta share URL (gunakan host runtime)
-    share_url = f"{request.host_url.rstrip('/')}/s/{doc_id}"
-    return jsonify({"status": "ok", "entry": entry, "share_url": share_url}), 200
+if search_index and supabase and SEARCH_BACKFILL_ON_START:
+    spawn(_backfill_all_on_start)
 
-@app.route("/api/history", methods=["GET"])
+def after_documents_saved(rows):
+    """Hook setelah dokumen tersimpan di Supabase: invalidasi cache dan perbarui index pencarian."""
+    for row in rows:
+        invalidate_shared_document(row["id"])
+    for user_id in {row["user_id"] for row in rows}:
+        invalidate_history_cache(user_id)
+    if search_index:
+        try:
+            search_index.index_documents(rows)
+        except Exception as e:
+            app.logger.warning(f"Search index update failed: {e}")
+
+@app.route("/api/search", methods=["GET"])
 @require_auth
-def api_history():
+def api_search():
+    if not search_index:
+        return jsonify({"error": "search_disabled"}), 503
     user_id = g.user["sub"]
+    q = (request.args.get("q") or "").strip()
+    if not q:
+        return jsonify({"error": "q is required"}), 400
     try:
-        result = supabase.table("documents").select("*").eq("user_id", user_id).order("created_at", desc=True).execute()
-        return jsonify({"history": result.data})
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        limit = max(1, min(int(request.args.get("limit", SEARCH_PAGE_SIZE)), SEARCH_MAX_PAGE_SIZE))
+        offset = max(0, int(request.args.get("offset", 0)))
+    except (TypeError, ValueError):
+        return jsonify({"error": "invalid_pagination"}), 400
+
+    if supabase and not search_index.is_user_backfilled(user_id):
+        try:
+            backfill_search_index(user_id)
+        except Exception as e:
+            app.logger.warning(f"Search backfill for user failed: {e}")
+    elif supabase and SEARCH_RECONCILE_SECONDS > 0 and not search_index.is_user_backfilled(user_id, SEARCH_RECONCILE_SECONDS):
+        _spawn_search_reconcile(user_id)
+
+    started = time.perf_counter()
+    try:
+        # Ambil satu ekstra untuk has_more
+        results = search_index.search(user_id, q, limit + 1, offset)
+    except sqlite3.OperationalError as e:
+        return jsonify({"error": f"invalid_query: {e}"}), 400
+    has_more = len(results) > limit
+    results = results[:limit]
+    return jsonify({
+        "results": results,
+        "query": q,
+        "offset": offset,
+        "limit": limit,
+        "has_more": has_more,
+        "next_offset": offset + limit if has_more else None,
+        "took_ms": round((time.perf_counter() - started) * 1000, 2),
+    })
 
 
 # =========================
@@ -495,6 +3270,7 @@ def api_history():
 @require_auth
 def generate_share_token():
     """Generate a new share token for a document"""
+    share_db.require()
     data = request.get_json(force=True, silent=True) or {}
     document_id = data.get("document_id")
     expires_days = data.get("expires_days", 7)  # Default 7 days
@@ -540,6 +3316,7 @@ def generate_share_token():
 @app.route("/api/share/validate/<token>", methods=["GET"])
 def validate_share_token(token):
     """Validate a share token and return document access info"""
+    share_db.require()
     share_token = ShareToken.query.filter_by(token=token).first()
     
     if not share_token:
@@ -554,14 +3331,15 @@ def validate_share_token(token):
             return jsonify({"error": "Share token is no longer active"}), 410
     
     # Increment view count
-    share_token.increment_view_count()
+    if not share_token.increment_view_count():
+        return jsonify({"error": "Share token view limit reached"}), 410
     
     return jsonify({
         "valid": True,
         "document_id": share_token.document_id,
         "created_at": share_token.created_at.isoformat(),
         "expires_at": share_token.expires_at.isoformat() if share_token.expires_at else None,
-        "view_count": share_token.view_count,
+        "view_count": share_token.current_view_count(),
         "max_views": share_token.max_views
     })
 
@@ -569,6 +3347,7 @@ def validate_share_token(token):
 @require_auth
 def revoke_share_token():
     """Revoke a share token (deactivate it)"""
+    share_db.require()
     data = request.get_json(force=True, silent=True) or {}
     token = data.get("token")
     
@@ -582,15 +3361,48 @@ def revoke_share_token():
     
     share_token.is_active = False
     db.session.commit()
+    invalidate_shared_token(token)
     
     return jsonify({"success": True, "message": "Share token revoked"})
 
+SHARE_LIST_PAGE_SIZE = int(os.getenv("SHARE_LIST_PAGE_SIZE", "50"))
+SHARE_LIST_MAX_PAGE_SIZE = int(os.getenv("SHARE_LIST_MAX_PAGE_SIZE", "200"))
+
 @app.route("/api/share/list", methods=["GET"])
 @require_auth
 def list_share_tokens():
-    """List all share tokens created by the current user"""
+    """
+    List share tokens created by the current user, newest first.
+    Keyset pagination: ?limit=&cursor= (cursor = next_cursor dari halaman sebelumnya).
+    """
+    share_db.require()
     user_id = g.user["sub"]
-    share_tokens = ShareToken.query.filter_by(created_by=user_id).order_by(ShareToken.created_at.desc()).all()
+    try:
+        limit = int(request.args.get("limit", SHARE_LIST_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return jsonify({"error": "invalid_limit"}), 400
+    limit = max(1, min(limit, SHARE_LIST_MAX_PAGE_SIZE))
+    cursor = request.args.get("cursor")
+    try:
+        cursor = decode_history_cursor(cursor) if cursor else None
+    except Exception:
+        return jsonify({"error": "invalid_cursor"}), 400
+
+    query = ShareToken.query.filter_by(created_by=user_id)
+    if cursor:
+        created_at, token_id = cursor
+        try:
+            created_at, token_id = datetime.fromisoformat(created_at), int(token_id)
+        except ValueError:
+            return jsonify({"error": "invalid_cursor"}), 400
+        query = query.filter(db.or_(
+            ShareToken.created_at < created_at,
+            db.and_(ShareToken.created_at == created_at, ShareToken.id < token_id),
+        ))
+    # Satu baris ekstra untuk mengetahui apakah masih ada halaman berikutnya
+    share_tokens = query.order_by(ShareToken.created_at.desc(), ShareToken.id.desc()).limit(limit + 1).all()
+    has_more = len(share_tokens) > limit
+    share_tokens = share_tokens[:limit]
     
     tokens_data = []
     for token in share_tokens:
@@ -600,24 +3412,33 @@ def list_share_tokens():
             "document_id": token.document_id,
             "created_at": token.created_at.isoformat(),
             "expires_at": token.expires_at.isoformat() if token.expires_at else None,
-            "view_count": token.view_count,
+            "view_count": token.current_view_count(),
             "max_views": token.max_views,
             "is_active": token.is_active,
             "is_expired": token.is_expired(),
             "can_access": token.can_access()
         })
     
-    return jsonify({"tokens": tokens_data})
+    last = share_tokens[-1] if share_tokens else None
+    next_cursor = encode_history_cursor({"created_at": last.created_at.isoformat(), "id": str(last.id)}) \
+        if has_more and last else None
+    return jsonify({"tokens": tokens_data, "next_cursor": next_cursor, "has_more": has_more})
 
 @app.route("/api/document/<document_id>", methods=["GET"])
 def get_document(document_id):
     """Get document data by ID (now using Supabase)"""
     # Validasi: hanya terima UUID yang valid
     try:
-        UUID(str(document_id))
+        uuid.UUID(str(document_id))
     except Exception:
         return jsonify({"error": "Document not found"}), 404
 
+    # Dokumen yang masih di outbox (belum terkirim ke Supabase)
+    if save_outbox:
+        pending = save_outbox.get(str(document_id))
+        if pending is not None:
+            return jsonify(dict(pending, pending=True))
+
     try:
         result = supabase.table("documents").select("*").eq("id", document_id).execute()
         if not result.data:
@@ -634,131 +3455,702 @@ def get_document(document_id):
 # =========================
 # Socket.IO handlers
 # =========================
-@socketio.on("connect")
-def on_connect(auth):
+# Logika event dipisah dari dekorator agar bisa dipanggil oleh server eventlet (di bawah) maupun
+# AsyncServer di asgi.py; balasan selalu lewat socketio.emit(..., to=sid).
+def socket_connect(sid, token) -> dict:
     # Terima koneksi tanpa token terlebih dahulu (agar polling browser tidak 400)
     # Jika token tersedia, verifikasi dan set payload, jika tidak, klien harus kirim event 'authenticate' setelah connect.
-    token = (auth or {}).get("token") if auth else None
-    if not token:
-        auth_header = request.headers.get("Authorization", "")
-        token = request.args.get("token") or (auth_header.split(" ", 1)[1].strip() if auth_header.startswith("Bearer ") else None)
     if token:
         try:
             payload = verify_supabase_jwt(token)
-            authed_sids[request.sid] = payload
+            socket_sessions.authenticate(sid, payload)
         except Exception:
             pass
     elif DEV_ALLOW_NO_AUTH:
-        authed_sids[request.sid] = {"sub": "dev-user", "email": "dev@example.com"}
-    emit("connect_ack", {"ok": True, "authed": request.sid in authed_sids})
+        socket_sessions.authenticate(sid, DEV_SOCKET_CLAIMS)
+    return {"ok": True, "authed": socket_sessions.is_authed(sid)}
 
-@socketio.on("authenticate")
-def on_authenticate(data):
-    token = (data or {}).get("token")
+def socket_authenticate(sid, token) -> dict:
     if not token:
         if DEV_ALLOW_NO_AUTH:
-            authed_sids[request.sid] = {"sub": "dev-user", "email": "dev@example.com"}
-            emit("auth_result", {"ok": True, "dev": True})
-            return
-        emit("auth_result", {"ok": False, "error": "missing_token"})
-        return
+            socket_sessions.authenticate(sid, DEV_SOCKET_CLAIMS)
+            return {"ok": True, "dev": True}
+        return {"ok": False, "error": "missing_token"}
     try:
         payload = verify_supabase_jwt(token)
-        authed_sids[request.sid] = payload
-        emit("auth_result", {"ok": True})
+        socket_sessions.authenticate(sid, payload)
+        return {"ok": True}
     except Exception as e:
-        emit("auth_result", {"ok": False, "error": str(e)})
+        return {"ok": False, "error": str(e)}
 
-@socketio.on("summarize_stream")
-def handle_summarize_stream(data):
-    sid = request.sid
-    user = authed_sids.get(sid)
+def summary_stream_plan(sid, data):
+    """
+    Pemeriksaan awal event summarize_stream. Kembalikan ("frame", payload) untuk satu frame balasan
+    langsung, ("cached", summary) untuk replay cache, atau ("stream", (user, text, mode)).
+    """
+    user = socket_sessions.get(sid)
     # In development, allow requests without valid JWT to simplify local testing
     if not user and DEV_ALLOW_NO_AUTH:
-        user = {"sub": "dev-user", "email": "dev@example.com"}
-        authed_sids[sid] = user
+        user = socket_sessions.authenticate(sid, DEV_SOCKET_CLAIMS)
     print("[socket] summarize_stream from", sid, "authed=", bool(user))
     if not user:
-        socketio.emit("summary_stream", {"error": "unauthorized"}, to=sid)
-        return
+        return "frame", {"error": "unauthorized"}
 
+    data = data or {}
     text = (data.get("text") or "").strip()
-    mode = (data.get("mode") or current_summary_mode).strip().lower()
+    mode = (data.get("mode") or get_current_summary_mode()).strip().lower()
     if not text:
-        socketio.emit("summary_stream", {"error": "Teks kosong"}, to=sid)
-        return
-    if not client:
-        socketio.emit("summary_stream", {"error": "groq_api_key_missing"}, to=sid)
-        return
+        return "frame", {"error": "Teks kosong"}
     if len(text) < 20:
-        socketio.emit("summary_stream", {
+        return "frame", {
             "final": "Teks terlalu pendek untuk diringkas. Tambahkan lebih banyak konteks.",
             "end": True
-        }, to=sid)
+        }
+    cached = summary_cache.get_any(summary_cache_keys(text, mode))
+    if cached is not None:
+        return "cached", cached
+    if not client:
+        return "frame", {"error": "groq_api_key_missing"}
+    if llm_gateway.is_full():
+        return "frame", {"error": "server_busy", "queue_full": True, "end": True}
+    return "stream", (user, text, mode)
+
+def _socket_token(auth, headers, args):
+    token = (auth or {}).get("token") if auth else None
+    if not token:
+        auth_header = headers.get("Authorization", "")
+        token = args.get("token") or (auth_header.split(" ", 1)[1].strip() if auth_header.startswith("Bearer ") else None)
+    return token
+
+@socketio.on("connect")
+def on_connect(auth):
+    emit("connect_ack", socket_connect(request.sid, _socket_token(auth, request.headers, request.args)))
+
+@socketio.on("authenticate")
+def on_authenticate(data):
+    emit("auth_result", socket_authenticate(request.sid, (data or {}).get("token")))
+
+@socketio.on("summarize_stream")
+def handle_summarize_stream(data):
+    sid = request.sid
+    send = _summary_sender(sid)
+    kind, value = summary_stream_plan(sid, data)
+    if kind == "frame":
+        send(value)
+        return
+    if kind == "cached":
+        _replay_cached_summary(send, value)
+        return
+    user, text, mode = value
+    stop_evt = socket_sessions.start_stream(sid)
+
+    def worker():
+        try:
+            run_summary_stream(send, text, mode, user.sub, stop_evt, label=f"socket {sid}")
+        finally:
+            socket_sessions.end_stream(sid, stop_evt)
+            print("[socket] stream done", sid)
+
+    socketio.start_background_task(worker)
+
+def _summary_sender(sid):
+    """Pengirim frame `summary_stream` ke satu socket."""
+    def send(payload):
+        socketio.emit("summary_stream", payload, to=sid)
+    return send
+
+def run_summary_stream(send, text: str, mode: str, user_id: str, stop_evt: Event, label: str = "-"):
+    """
+    Worker ringkasan streaming yang dipakai Socket.IO maupun SSE: map-reduce bila perlu, stream tahap
+    akhir sebagai frame progress/queue/token lalu final/end lewat send(payload), dan simpan ke cache.
+    Error dikirim sebagai frame, bukan dilempar.
+    """
+    def on_progress(done, total):
+        send(progress_frame(done, total))
+        socketio.sleep(0)
+
+    try:
+        # Transkrip panjang: ringkas potongan paralel dulu, lalu stream tahap reduce
+        prompt = prepare_summary_prompt(text, mode, on_progress=on_progress, stop_evt=stop_evt, user_id=user_id,
+                                        on_preprocess=preprocess_logger(label))
+        if stop_evt.is_set():
+            send({"end": True})
+            return
+        model, final = _stream_completion(send, prompt, stop_evt, user_id)
+        cache_streamed_summary(text, mode, model, final, stop_evt)
+    except Exception as e:
+        send(stream_error_frame(e, label))
+
+# Frame `summary_stream` bersama untuk Socket.IO, SSE, dan asgi.py
+def progress_frame(done: int, total: int) -> dict:
+    return {"progress": {"stage": "map", "done": done, "total": total}}
+
+def queue_frame(position: int) -> dict:
+    return {"queue": {"position": position}}
+
+def stream_error_frame(e, label: str = "-") -> dict:
+    """Frame error penutup stream: server_busy untuk LLMGatewayBusy, selain itu pesan error (dan dicatat)."""
+    if isinstance(e, LLMGatewayBusy):
+        return {"error": "server_busy", "reason": str(e), "end": True}
+    print(f"[stream] error {label}:", e)
+    return {"error": str(e), "end": True}
+
+def preprocess_logger(label: str):
+    def on_preprocess(report):
+        print(f"[stream] preprocess {label}: {report['tokens_before']} -> {report['tokens_after']} tokens")
+    return on_preprocess
+
+def cache_streamed_summary(text: str, mode: str, model, final: str, stop_evt):
+    """Simpan hasil stream yang selesai utuh, dengan kunci model yang benar-benar menjawab."""
+    if model and not stop_evt.is_set():
+        summary_cache.put(summary_cache_key(text, mode, model), final)
+
+def _stream_completion(send, prompt: str, stop_evt: Event, user_id: str = None, endpoint: str = "summarize_stream"):
+    """Stream jawaban Groq lewat send(payload) sebagai frame token lalu final/end; kembalikan (model, final)."""
+    def on_position(position):
+        send(queue_frame(position))
+
+    with llm_gateway.slot(user_id, on_position=on_position, stop_evt=stop_evt):
+        try:
+            return _stream_response(send, prompt, stop_evt, endpoint)
+        except Exception as e:
+            if _is_rate_limit_error(e):
+                llm_rate_limited.inc(endpoint=endpoint)
+            llm_requests.inc(endpoint=endpoint, outcome="error")
+            raise
+
+# Coalescing frame token: kumpulkan potongan kecil dari Groq dan kirim per N ms atau M byte
+STREAM_FLUSH_MS = float(os.getenv("STREAM_FLUSH_MS", "40"))
+STREAM_FLUSH_BYTES = int(os.getenv("STREAM_FLUSH_BYTES", "256"))
+
+class TokenCoalescer:
+    """
+    Buffer token untuk satu stream. Token pertama langsung dikirim (time-to-first-token),
+    berikutnya di-flush setiap flush_ms atau flush_bytes, mana yang lebih dulu.
+    flush_ms <= 0 mematikan coalescing (satu frame per potongan seperti sebelumnya).
+    Saat upstream diam, flush_due() (dari start_timer atau loop stream ber-timeout) mengirim sisa buffer.
+    """
+
+    def __init__(self, send, flush_ms: float = None, flush_bytes: int = None):
+        self.send = send
+        self.flush_interval = (STREAM_FLUSH_MS if flush_ms is None else flush_ms) / 1000.0
+        self.flush_bytes = STREAM_FLUSH_BYTES if flush_bytes is None else flush_bytes
+        self._buf = []
+        self._buf_bytes = 0
+        self._last_flush = None
+        self._lock = threading.Lock()
+        self._timer_stop = None
+        self.frames = 0
+        self.pieces = 0
+
+    def push(self, piece: str):
+        with self._lock:
+            self.pieces += 1
+            self._buf.append(piece)
+            self._buf_bytes += len(piece.encode("utf-8"))
+            now = time.monotonic()
+            if (
+                self._last_flush is None
+                or self.flush_interval <= 0
+                or self._buf_bytes >= self.flush_bytes
+                or now - self._last_flush >= self.flush_interval
+            ):
+                self._flush_locked(now)
+
+    def flush(self, now: float = None):
+        with self._lock:
+            self._flush_locked(now)
+
+    def flush_due(self):
+        """Flush buffer yang sudah tertahan flush_ms sejak flush terakhir walau tidak ada token baru."""
+        with self._lock:
+            if self._buf and time.monotonic() - (self._last_flush or 0.0) >= self.flush_interval:
+                self._flush_locked()
+
+    def _flush_locked(self, now: float = None):
+        if not self._buf:
+            return
+        self.send("".join(self._buf))
+        self._buf, self._buf_bytes = [], 0
+        self._last_flush = now if now is not None else time.monotonic()
+        self.frames += 1
+
+    def start_timer(self):
+        """Jalankan flush_due setiap flush_ms di green-thread (thread di mode ASGI) sampai stop_timer()."""
+        if self.flush_interval <= 0 or self._timer_stop is not None:
+            return
+        self._timer_stop = stop = Event()
+
+        def tick():
+            while not stop.wait(self.flush_interval):
+                self.flush_due()
+
+        spawn(tick)
+
+    def stop_timer(self):
+        if self._timer_stop is not None:
+            self._timer_stop.set()
+
+class StreamCollector:
+    """
+    Pembaca satu stream jawaban, dipakai _stream_response (eventlet/thread) dan asgi.stream_response
+    (asyncio): kumpulkan teks, catat TTFT dan usage (koreksi pesanan token di limiter route), kirim frame
+    token lewat TokenCoalescer, lalu finish() mencatat metrics dan membuat frame final.
+    """
+
+    def __init__(self, send_frame, endpoint: str, reserved_tokens: float):
+        self.coalescer = TokenCoalescer(lambda text: send_frame({"token": text}))
+        self.endpoint = endpoint
+        self.reserved_tokens = reserved_tokens
+        self.route = None  # diisi setelah router memilih pemenang
+        self.collected = []
+        self.started = time.perf_counter()
+        self.first_token_at = None
+        self.completion_tokens = 0
+        self.final = ""
+
+    @property
+    def model(self):
+        return self.route.model if self.route else None
+
+    def add(self, chunk):
+        # Chunk terakhir Groq membawa usage di x_groq
+        usage = getattr(getattr(chunk, "x_groq", None), "usage", None)
+        if usage is not None:
+            if self.route is not None:
+                self.route.limiter.settle(self.reserved_tokens, getattr(usage, "total_tokens", 0) or 0)
+            self.completion_tokens = getattr(usage, "completion_tokens", 0) or self.completion_tokens
+        piece = _chunk_content(chunk)
+        if piece:
+            if self.first_token_at is None:
+                self.first_token_at = time.perf_counter()
+            self.collected.append(piece)
+            self.coalescer.push(piece)
+
+    def finish(self, stopped: bool) -> dict:
+        """Flush sisa buffer (juga saat dihentikan), catat metrics, dan kembalikan frame final/end."""
+        coalescer = self.coalescer
+        coalescer.flush()
+        stream_frames.inc(coalescer.frames, endpoint=self.endpoint)
+        if stopped:
+            llm_requests.inc(endpoint=self.endpoint, outcome="cancelled")
+        else:
+            # Tanpa usage dari server, satu delta Groq kira-kira satu token
+            observe_llm_call(self.endpoint, self.started, self.first_token_at, self.completion_tokens or coalescer.pieces)
+        print(f"[stream] sent {coalescer.frames} frames ({coalescer.pieces} chunks) "
+              f"via {self.route.name if self.route else '-'}")
+        self.final = strip_think(("".join(self.collected)).strip())
+        return {"final": self.final, "end": True}
+
+def _stream_response(send, prompt: str, stop_evt: Event, endpoint: str = "summarize_stream"):
+    def send_frame(frame):
+        send(frame)
+        socketio.sleep(0)  # penting utk flush
+
+    collector = StreamCollector(send_frame, endpoint, estimate_request_tokens(prompt))
+    # Router memilih model (dengan hedging); chunks sudah termasuk yang terbaca sampai token pertama
+    route, response, chunks = llm_router.stream(prompt, stop_evt, tokens=collector.reserved_tokens)
+    collector.route = route
+    collector.coalescer.start_timer()  # upstream bisa diam di tengah jawaban; buffer tetap dikirim tiap flush_ms
+    try:
+        for chunk in chunks:
+            if stop_evt.is_set():
+                break
+            collector.add(chunk)
+    finally:
+        collector.coalescer.stop_timer()
+        if response is not None:
+            _close_stream(response)
+    send(collector.finish(stop_evt.is_set()))
+    return collector.model, collector.final
+
+def transcript_append(sid, data):
+    """Tambah teks transkrip live; ringkas segmen di background bila ekor melewati ambang."""
+    user = _socket_user(sid)
+    if not user:
+        socketio.emit("transcript_state", {"error": "unauthorized"}, to=sid)
         return
-    if len(text) > 4000:
-        text = text[-4000:]
 
-    prompt = build_prompt(text, mode)
-    stop_evt = Event()
-    stop_flags[sid] = stop_evt
+    data = data or {}
+    text = (data.get("text") or "").strip()
+    mode = (data.get("mode") or get_current_summary_mode()).strip().lower()
+    append_rolling_text(sid, user.sub, text, mode, reset=bool(data.get("reset")))
+
+@socketio.on("transcript_append")
+def handle_transcript_append(data):
+    transcript_append(request.sid, data)
+
+def append_rolling_text(sid, user_id: str, text: str, mode: str, reset: bool = False) -> RollingTranscript:
+    """Tambahkan teks ke state rolling milik sid dan kirim `transcript_state` (dipakai juga oleh audio)."""
+    state = rolling_states.get(sid)
+    if state is None or reset:
+        state = RollingTranscript(mode, user_id)
+        rolling_states[sid] = state
+    if text:
+        state.append(text)
+
+    def on_segment(index):
+        socketio.emit("transcript_state", dict(state.state(), segment_done=index), to=sid)
+
+    if client and len(state.tail) >= ROLLING_SEGMENT_CHARS and not state.pending:
+        socketio.start_background_task(advance_rolling, state, on_segment)
+    socketio.emit("transcript_state", state.state(), to=sid)
+    return state
+
+def rolling_summary_plan(sid):
+    """Pemeriksaan awal transcript_summarize: (frame balasan, None) atau (None, state rolling)."""
+    if not socket_sessions.is_authed(sid) and not DEV_ALLOW_NO_AUTH:
+        return {"error": "unauthorized"}, None
+    if llm_gateway.is_full():
+        return {"error": "server_busy", "queue_full": True, "end": True}, None
+    state = rolling_states.get(sid)
+    if state is None or not state.has_text():
+        return {"error": "Teks kosong"}, None
+    if not client:
+        return {"error": "groq_api_key_missing"}, None
+    return None, state
+
+def rolling_summary_prompt(state, stop_evt) -> str:
+    """Prompt notulensi terkini dari state rolling; segmen lama dipadatkan dulu bila terlalu panjang."""
+    segments, tail = state.snapshot()
+    if sum(len(x) for x in segments) > ROLLING_MAX_SEGMENTS_CHARS:
+        # Padatkan ringkasan segmen lama sekali, lalu simpan kembali ke state
+        compacted = compact_partials(segments, state.mode, stop_evt=stop_evt, user_id=state.user_id)
+        state.replace_segments(len(segments), compacted)
+        segments = compacted
+    return build_rolling_prompt(segments, tail, state.mode)
+
+@socketio.on("transcript_summarize")
+def handle_transcript_summarize(data=None):
+    """Buat notulensi terkini dari state rolling dan stream lewat `summary_stream`."""
+    sid = request.sid
+    send = _summary_sender(sid)
+    frame, state = rolling_summary_plan(sid)
+    if frame is not None:
+        send(frame)
+        return
+    stop_evt = socket_sessions.start_stream(sid)
 
     def worker():
-        collected = []
         try:
-            response = client.chat.completions.create(
-                messages=[{"role": "user", "content": prompt}],
-                model=MODEL,
-                temperature=0.3,
-                stream=True,
-            )
-            cnt = 0
-            for chunk in response:
-                if stop_evt.is_set():
-                    break
-                try:
-                    choice = chunk.choices[0]
-                except Exception:
-                    continue
-                piece = None
-                if hasattr(choice, "delta"):
-                    piece = getattr(choice.delta, "content", None)
-                if not piece and hasattr(choice, "message"):
-                    piece = getattr(choice.message, "content", None)
-
-                if piece:
-                    collected.append(piece)
-                    socketio.emit("summary_stream", {"token": piece}, to=sid)
-                    socketio.sleep(0)  # penting utk flush
-                    cnt += 1
-                    if cnt % 20 == 0:
-                        print(f"[socket] sent {cnt} chunks to {sid}")
-
-            final = strip_think(("".join(collected)).strip())
-            socketio.emit("summary_stream", {"final": final, "end": True}, to=sid)
+            prompt = rolling_summary_prompt(state, stop_evt)
+            if stop_evt.is_set():
+                send({"end": True})
+                return
+            _stream_completion(send, prompt, stop_evt, state.user_id, endpoint="transcript_summarize")
         except Exception as e:
-            print("[socket] stream error:", e)
-            socketio.emit("summary_stream", {"error": str(e), "end": True}, to=sid)
+            send(stream_error_frame(e, f"rolling {sid}"))
         finally:
-            stop_flags.pop(sid, None)
-            print("[socket] stream done", sid)
+            socket_sessions.end_stream(sid, stop_evt)
 
     socketio.start_background_task(worker)
 
+def transcript_reset(sid):
+    rolling_states.pop(sid, None)
+    socketio.emit("transcript_state", {"segments": 0, "segment_chars": 0, "tail_chars": 0, "total_chars": 0,
+                                       "pending": False}, to=sid)
+
+def drop_socket_state(sids):
+    """Buang state per-socket terbesar (transkrip rolling, sesi audio); dipanggil saat disconnect dan sweep."""
+    for sid in sids:
+        rolling_states.pop(sid, None)
+        audio = audio_sessions.pop(sid, None)
+        if audio is not None:
+            audio.disconnected = True
+            audio.closed = True
+
+def socket_disconnect(sid):
+    socket_sessions.remove(sid)  # juga menghentikan stream yang masih berjalan
+    drop_socket_state([sid])
+    print(f"[socket] disconnect SID={sid}")
+
+@socketio.on("transcript_reset")
+def handle_transcript_reset():
+    transcript_reset(request.sid)
+
 @socketio.on("stop_stream")
 def handle_stop_stream():
-    sid = request.sid
-    if sid in stop_flags:
-        stop_flags[sid].set()
+    request_stop(request.sid)
     emit("stop_stream")
 
 @socketio.on("disconnect")
 def on_disconnect():
-    sid = request.sid
-    authed_sids.pop(sid, None)
-    if sid in stop_flags:
-        stop_flags[sid].set()
-    print(f"[socket] disconnect SID={sid}")
+    socket_disconnect(request.sid)
+
+
+# =========================
+# Audio ingestion (VAD + transkripsi server-side)
+# =========================
+# Klien mengirim audio PCM16 mono per potongan (socket `audio_chunk`) atau satu file (POST
+# /api/audio/transcribe). Voice-activity detection memotong audio menjadi segmen ucapan, tiap segmen
+# ditranskripsi paralel oleh backend yang bisa diganti (Groq Whisper atau stand-in lokal), lalu teksnya
+# langsung masuk ke transkrip rolling yang sama dengan `transcript_append`.
+# Segmenter VAD, backend transkripsi, dan pool-nya ada di audio.py; di sini sesi socket dan rute HTTP.
+AUDIO_SAMPLE_RATE = int(os.getenv("AUDIO_SAMPLE_RATE", "16000"))
+AUDIO_MAX_SESSIONS = int(os.getenv("AUDIO_MAX_SESSIONS", "200"))
+AUDIO_MAX_PENDING_SEGMENTS = int(os.getenv("AUDIO_MAX_PENDING_SEGMENTS", "20"))
+AUDIO_MAX_UPLOAD_BYTES = int(os.getenv("AUDIO_MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+TRANSCRIBE_BACKEND = os.getenv("TRANSCRIBE_BACKEND", "groq")  # groq | local | modul:Kelas
+TRANSCRIBE_CONCURRENCY = int(os.getenv("TRANSCRIBE_CONCURRENCY", "16"))
+TRANSCRIBE_HTTP_TIMEOUT = float(os.getenv("TRANSCRIBE_HTTP_TIMEOUT", "300"))
+
+audio_seconds_total = metrics.counter(
+    "notaku_audio_seconds_total", "Detik audio yang diterima.", ("source",))
+audio_chunks_dropped = metrics.counter(
+    "notaku_audio_chunks_dropped_total", "Potongan audio socket yang dibuang karena transkripsi tertinggal.")
+
+transcription_pool = TranscriptionPool(create_transcriber(TRANSCRIBE_BACKEND, client), TRANSCRIBE_CONCURRENCY)
+
+class AudioSession:
+    """Satu aliran audio per socket: segmenter VAD + penyusun ulang hasil transkripsi sesuai urutan segmen."""
+
+    def __init__(self, sid, user_id: str, mode: str, sample_rate: int):
+        self.sid = sid
+        self.user_id = user_id
+        self.mode = mode
+        self.segmenter = VoiceActivitySegmenter(sample_rate, self._on_segment)
+        self.lock = threading.Lock()
+        self.results = {}    # {seq: (segment, text)} menunggu giliran
+        self.next_seq = 1
+        self.pending = 0
+        self.closed = False
+        self.disconnected = False  # socket sudah putus: hasil yang masih berjalan dibuang
+        self.lagging = False       # pending > AUDIO_MAX_PENDING_SEGMENTS: potongan audio baru dibuang
+        self.dropped_chunks = 0
+
+    def _update_lagging(self, pending: int):
+        lagging = pending > AUDIO_MAX_PENDING_SEGMENTS
+        if lagging == self.lagging:
+            return
+        self.lagging = lagging
+        if self.disconnected:
+            return
+        state = {"lagging": lagging, "pending": pending, "dropped_chunks": self.dropped_chunks}
+        if lagging:
+            state["dropping"] = True
+        socketio.emit("audio_state", state, to=self.sid)
+
+    def _on_segment(self, segment: AudioSegment):
+        with self.lock:
+            self.pending += 1
+            pending = self.pending
+        self._update_lagging(pending)
+        transcription_pool.submit(segment, self._on_transcribed, cancelled=lambda: self.disconnected)
+
+    def _on_transcribed(self, segment: AudioSegment, text: str, error):
+        ready = []
+        with self.lock:
+            self.results[segment.seq] = (segment, text)
+            while self.next_seq in self.results:
+                ready.append(self.results.pop(self.next_seq))
+                self.next_seq += 1
+            self.pending -= len(ready)
+            pending = self.pending
+            finished = self.closed and self.pending == 0
+        self._update_lagging(pending)
+        if self.disconnected:
+            # Jangan emit ke socket mati dan jangan membuat rolling_states[sid] baru yang tak pernah dibersihkan
+            return
+        for seg, seg_text in ready:
+            socketio.emit("transcript_text", {
+                "seq": seg.seq, "text": seg_text, "start": round(seg.start, 2), "end": round(seg.end, 2),
+            }, to=self.sid)
+            if seg_text:
+                append_rolling_text(self.sid, self.user_id, seg_text, self.mode)
+        if finished:
+            self._finish()
+
+    def feed(self, data: bytes) -> bool:
+        """False jika potongan dibuang karena transkripsi sesi ini tertinggal terlalu jauh."""
+        if self.lagging:
+            self.dropped_chunks += 1
+            audio_chunks_dropped.inc()
+            return False
+        before = self.segmenter.seconds
+        self.segmenter.feed(data)
+        audio_seconds_total.inc(self.segmenter.seconds - before, source="socket")
+        return True
+
+    def close(self):
+        self.segmenter.flush()
+        with self.lock:
+            self.closed = True
+            finished = self.pending == 0
+        if finished:
+            self._finish()
+
+    def _finish(self):
+        if audio_sessions.get(self.sid) is self:
+            audio_sessions.pop(self.sid, None)
+        if self.disconnected:
+            return
+        socketio.emit("audio_state", {"done": True, "segments": self.segmenter.seq,
+                                      "audio_seconds": round(self.segmenter.seconds, 2)}, to=self.sid)
+
+audio_sessions = {}  # {sid: AudioSession} - lokal di worker pemilik socket
+socket_sessions.on_evict = drop_socket_state
+metrics.gauge("notaku_audio_sessions", "Aliran audio yang sedang aktif.", lambda: len(audio_sessions))
+metrics.gauge("notaku_transcribe_queued", "Segmen audio yang menunggu worker transkripsi.", lambda: transcription_pool.queued)
+
+def _socket_user(sid):
+    user = socket_sessions.get(sid)
+    if not user and DEV_ALLOW_NO_AUTH:
+        user = socket_sessions.authenticate(sid, DEV_SOCKET_CLAIMS)
+    return user
+
+def audio_start(sid, data):
+    """Mulai aliran audio: {sample_rate?, mode?, encoding: "pcm16"} (PCM 16-bit little-endian mono)."""
+    user = _socket_user(sid)
+    if not user:
+        socketio.emit("audio_state", {"error": "unauthorized"}, to=sid)
+        return
+    data = data or {}
+    if (data.get("encoding") or "pcm16").lower() != "pcm16":
+        socketio.emit("audio_state", {"error": "unsupported_encoding", "supported": ["pcm16"]}, to=sid)
+        return
+    if sid not in audio_sessions and len(audio_sessions) >= AUDIO_MAX_SESSIONS:
+        socketio.emit("audio_state", {"error": "server_busy"}, to=sid)
+        return
+    sample_rate = parse_sample_rate(data.get("sample_rate") or AUDIO_SAMPLE_RATE)
+    if sample_rate is None:
+        socketio.emit("audio_state", {"error": "invalid_sample_rate"}, to=sid)
+        return
+    mode = (data.get("mode") or get_current_summary_mode()).strip().lower()
+    previous = audio_sessions.get(sid)
+    if previous is not None:
+        previous.close()
+    audio_sessions[sid] = AudioSession(sid, user.sub, mode, sample_rate)
+    if data.get("reset"):
+        append_rolling_text(sid, user.sub, "", mode, reset=True)
+    socketio.emit("audio_state", {"started": True, "sample_rate": sample_rate,
+                                  "backend": transcription_pool.backend_name}, to=sid)
+
+def audio_chunk(sid, data):
+    """Potongan audio: bytes biner, atau {data: bytes | base64}."""
+    session = audio_sessions.get(sid)
+    if session is None or session.closed:
+        socketio.emit("audio_state", {"error": "audio_not_started"}, to=sid)
+        return
+    socket_sessions.touch(sid)  # sweep membuang state audio sesi idle; stream audio berarti aktif
+    if isinstance(data, dict):
+        data = data.get("data")
+    if isinstance(data, str):
+        try:
+            data = base64.b64decode(data)
+        except Exception:
+            socketio.emit("audio_state", {"error": "invalid_chunk"}, to=sid)
+            return
+    if not isinstance(data, (bytes, bytearray)):
+        socketio.emit("audio_state", {"error": "invalid_chunk"}, to=sid)
+        return
+    session.feed(bytes(data))
+
+def audio_stop(sid):
+    session = audio_sessions.get(sid)
+    if session is not None:
+        session.close()
+
+@socketio.on("audio_start")
+def handle_audio_start(data=None):
+    audio_start(request.sid, data)
+
+@socketio.on("audio_chunk")
+def handle_audio_chunk(data):
+    audio_chunk(request.sid, data)
+
+@socketio.on("audio_stop")
+def handle_audio_stop(data=None):
+    audio_stop(request.sid)
+
+@app.route("/api/audio/transcribe", methods=["POST"])
+@require_auth
+def transcribe_audio():
+    """
+    Transkripsi satu file audio: WAV 16-bit, atau PCM16 mentah (?sample_rate=16000).
+    ?summarize=1 sekalian membuat notulensi dari hasil transkripsi.
+    """
+    if (request.content_length or 0) > AUDIO_MAX_UPLOAD_BYTES:
+        return jsonify({"error": "audio_too_large", "max_bytes": AUDIO_MAX_UPLOAD_BYTES}), 413
+    raw = request.files["file"].read() if "file" in request.files else request.get_data(cache=False)
+    if not raw:
+        return jsonify({"error": "audio_kosong"}), 400
+    try:
+        if raw[:4] == b"RIFF":
+            pcm, sample_rate = wav_to_pcm16(raw)
+        else:
+            pcm, sample_rate = raw, request.args.get("sample_rate") or AUDIO_SAMPLE_RATE
+    except (ValueError, wave.Error, EOFError) as e:
+        return jsonify({"error": "invalid_audio", "detail": str(e)}), 400
+    sample_rate = parse_sample_rate(sample_rate)
+    if sample_rate is None:
+        return jsonify({"error": "invalid_sample_rate",
+                        "min": AUDIO_MIN_SAMPLE_RATE, "max": AUDIO_MAX_SAMPLE_RATE}), 400
+
+    started = time.perf_counter()
+    segments = []
+    segmenter = VoiceActivitySegmenter(sample_rate, segments.append)
+    segmenter.feed(pcm)
+    segmenter.flush()
+    audio_seconds_total.inc(segmenter.seconds, source="http")
+
+    if not transcription_pool.has_room(len(segments)):
+        resp = jsonify({"error": "server_busy", "queued": transcription_pool.queued})
+        resp.headers["Retry-After"] = "5"
+        return resp, 429
+
+    results = {}
+    done = Event()
+    timed_out = Event()
+    results_lock = threading.Lock()
+
+    def on_transcribed(segment, text, error):
+        with results_lock:
+            results[segment.seq] = (text, error)
+            finished = len(results) == len(segments)
+        if finished:
+            done.set()
+
+    for segment in segments:
+        transcription_pool.submit(segment, on_transcribed, cancelled=timed_out.is_set)
+    if segments and not done.wait(TRANSCRIBE_HTTP_TIMEOUT):
+        # Segmen yang belum mulai dilewati pool; yang sedang berjalan dibiarkan selesai
+        timed_out.set()
+        with results_lock:
+            segments_done = sum(1 for _, error in results.values() if error != "cancelled")
+        return jsonify({"error": "transcribe_timeout", "segments_done": segments_done,
+                        "segments": len(segments)}), 504
+
+    items = [{
+        "seq": seg.seq, "start": round(seg.start, 2), "end": round(seg.end, 2),
+        "text": results[seg.seq][0], "error": results[seg.seq][1],
+    } for seg in segments]
+    text = " ".join(item["text"] for item in items if item["text"])
+    body = {
+        "text": text,
+        "segments": items,
+        "audio_seconds": round(segmenter.seconds, 2),
+        "processing_seconds": round(time.perf_counter() - started, 3),
+    }
+    if request.args.get("summarize") in ("1", "true") and len(text) >= 20:
+        if not client:
+            return jsonify(dict(body, error="groq_api_key_missing")), 500
+        mode = (request.args.get("mode") or get_current_summary_mode()).strip().lower()
+        user_id = g.user.get("sub")
+        try:
+            report = {}
+            prompt = prepare_summary_prompt(text, mode, user_id=user_id, on_preprocess=report.update)
+            body["summary"] = _chat_complete(prompt, user_id)
+            body["preprocess"] = report
+        except LLMGatewayBusy as e:
+            resp = jsonify(dict(body, error="server_busy", reason=str(e)))
+            resp.headers["Retry-After"] = "5"
+            return resp, 429
+    return jsonify(body)
+
+@app.route("/api/audio/stats", methods=["GET"])
+@require_admin
+def audio_stats():
+    return jsonify(dict(transcription_pool.stats(), sessions=len(audio_sessions)))
 
 
 # =========================
@@ -0,0 +1,610 @@
+"""
+Mode ASGI untuk backend NOTAKU: rute HTTP dan event Socket.IO yang sama dengan api.py, tetapi
+dilayani uvicorn tanpa eventlet monkey-patch.
+
+    cd backend && uvicorn asgi:app --host 0.0.0.0 --port 5001
+
+Jalur panas berjalan native async di event loop:
+- Socket.IO (python-socketio AsyncServer); summarize_stream / transcript_summarize men-stream Groq
+  lewat AsyncGroq (hedging, rate limiter, dan gateway yang sama dengan mode eventlet)
+- POST /summarize/stream (SSE) dengan stream AsyncGroq yang sama
+- GET /shared/<identifier>: logika yang sama dengan route Flask (api.shared_document_result) di executor
+  database khusus, dokumen lewat httpx.AsyncClient ber-pool ke Supabase REST
+- GET /healthz dan /readyz (status warmup api.components) tanpa lewat thread pool WSGI
+Rute Flask lain dan kode sinkron (map-reduce, VAD, transkripsi, outbox) tetap di api.py dan
+berjalan di thread pool (a2wsgi / asyncio.to_thread).
+"""
+import os
+
+os.environ["SERVER_MODE"] = "asgi"
+
+import asyncio
+import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from threading import Event
+from urllib.parse import parse_qs
+
+import httpx
+import socketio
+from a2wsgi import WSGIMiddleware
+from flask import render_template
+from werkzeug.exceptions import Unauthorized
+
+import api
+import llm
+
+if api.SERVER_MODE != "asgi":
+    raise RuntimeError("asgi.py harus di-import sebelum api.py (api sudah berjalan dengan eventlet)")
+
+ASGI_BLOCKING_THREADS = int(os.getenv("ASGI_BLOCKING_THREADS", "64"))  # asyncio.to_thread (kode sinkron api.py)
+ASGI_WSGI_THREADS = int(os.getenv("ASGI_WSGI_THREADS", "32"))          # rute Flask lewat a2wsgi
+ASGI_DB_THREADS = int(os.getenv("ASGI_DB_THREADS", "4"))               # query share token (SQLAlchemy)
+ASGI_LLM_MAX_CONNECTIONS = int(os.getenv("ASGI_LLM_MAX_CONNECTIONS", "2000"))
+ASGI_STORE_MAX_CONNECTIONS = int(os.getenv("ASGI_STORE_MAX_CONNECTIONS", "100"))
+ASGI_STORE_TIMEOUT = float(os.getenv("ASGI_STORE_TIMEOUT", "10"))
+
+db_executor = ThreadPoolExecutor(max_workers=max(1, ASGI_DB_THREADS), thread_name_prefix="notaku-db")
+_background = set()  # task yang harus tetap hidup setelah handler selesai
+
+# Pool koneksi HTTP: satu untuk stream LLM (berumur panjang), satu untuk document store
+llm_http = httpx.AsyncClient(
+    limits=httpx.Limits(max_connections=ASGI_LLM_MAX_CONNECTIONS, max_keepalive_connections=min(200, ASGI_LLM_MAX_CONNECTIONS)),
+    timeout=httpx.Timeout(600.0, connect=10.0),
+)
+store_http = httpx.AsyncClient(
+    limits=httpx.Limits(max_connections=ASGI_STORE_MAX_CONNECTIONS, max_keepalive_connections=ASGI_STORE_MAX_CONNECTIONS),
+    timeout=ASGI_STORE_TIMEOUT,
+)
+
+async def blocking(fn, *args, **kwargs):
+    """Jalankan kode sinkron api.py di thread pool tanpa menahan event loop."""
+    return await asyncio.to_thread(fn, *args, **kwargs)
+
+async def db_call(fn, *args):
+    """Query SQLAlchemy di executor database khusus, di dalam app context Flask."""
+    def run():
+        with api.app.app_context():
+            return fn(*args)
+    return await asyncio.get_running_loop().run_in_executor(db_executor, run)
+
+def _keep(task):
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+    return task
+
+
+# =========================
+# Async LLM streaming
+# =========================
+# Satu AsyncGroq per route (endpoint bisa berbeda), semuanya berbagi pool llm_http.
+llm_clients = {}
+
+def _build_llm_clients():
+    from groq import AsyncGroq  # import SDK ditunda ke startup, sama seperti klien sinkron di api.py
+    clients = {}
+    for route in api.llm_router.routes:
+        _, _, base_url = route.name.partition("@")
+        clients[route.name] = AsyncGroq(api_key=api.GROQ_API_KEY, base_url=base_url or api.GROQ_BASE_URL,
+                                        http_client=llm_http)
+    return clients
+
+async def _aclose_stream(response):
+    try:
+        await response.close()
+    except Exception:
+        pass
+
+async def _rate_limited_stream(route, tokens: float, **kwargs):
+    """Versi async _rate_limited_create: tunggu kuota limiter route tanpa memblokir, lalu buka stream."""
+    limiter = route.limiter
+    started = time.monotonic()
+    while True:
+        wait = limiter.reserve(tokens, time.monotonic() - started)
+        if wait <= 0:
+            break
+        await asyncio.sleep(min(wait, 0.25))
+    limiter.record_wait(time.monotonic() - started)
+    completions = llm_clients[route.name].chat.completions
+    try:
+        raw = await completions.with_raw_response.create(model=route.model, stream=True, **kwargs)
+        limiter.update(raw.headers)
+        return await raw.parse()
+    except Exception as e:
+        if llm._is_rate_limit_error(e):
+            limiter.penalize(e)
+        raise
+
+async def stream_race(prompt: str, tokens: float, stop_evt, temperature: float = 0.3):
+    """
+    Padanan async LLMRouter._race untuk stream: kebijakan hedge/failover dari llm.HedgeRace, route
+    dijalankan sebagai task; pemenang adalah yang pertama menghasilkan token. Task yang kalah dibatalkan
+    (koneksinya ikut ditutup). Kembalikan (route, (response, head, rest)) atau (None, None) jika stop_evt
+    di-set lebih dulu.
+    """
+    race = llm.HedgeRace(api.llm_router, "stream")
+    messages = [{"role": "user", "content": prompt}]
+    tasks = {}  # {task: route}
+
+    async def start(route):
+        response = await _rate_limited_stream(route, tokens, messages=messages, temperature=temperature)
+        rest, head = response.__aiter__(), []
+        try:
+            async for chunk in rest:
+                head.append(chunk)
+                if llm._chunk_content(chunk):
+                    break
+        except BaseException:
+            await _aclose_stream(response)
+            raise
+        return response, head, rest
+
+    def launch(route):
+        tasks[asyncio.ensure_future(start(route))] = route
+
+    launch(race.launch())
+    winner = None
+    try:
+        while race.running:
+            done, _ = await asyncio.wait(list(tasks), timeout=race.wait_timeout(), return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                if stop_evt is not None and stop_evt.is_set():
+                    return None, None
+                hedge = race.on_idle()
+                if hedge is not None:
+                    launch(hedge)
+                continue
+            for task in done:
+                route = tasks.pop(task)
+                error = task.exception()
+                if error is None:
+                    if winner is None:
+                        race.succeeded(route)
+                        winner = (route, task.result())
+                    else:
+                        await _aclose_stream(task.result()[0])
+                    continue
+                race.failed(route, error)
+            if winner is not None:
+                return winner
+            failover = race.failover()
+            if failover is not None:
+                launch(failover)
+        raise race.last_error
+    finally:
+        for task in tasks:
+            task.cancel()
+        race.finish()
+
+async def stream_response(send, prompt: str, stop_evt, endpoint: str = "summarize_stream"):
+    """Padanan async api._stream_response (logika frame/metrics di api.StreamCollector) lewat await send(payload)."""
+    frames = []
+    collector = api.StreamCollector(frames.append, endpoint, api.estimate_request_tokens(prompt))
+    coalescer = collector.coalescer
+    route, result = await stream_race(prompt, collector.reserved_tokens, stop_evt)
+    collector.route = route
+    response = result[0] if result else None
+    next_chunk = None
+    try:
+        if route is not None:
+            _, head, rest = result
+
+            async def chunks():
+                for chunk in head:
+                    yield chunk
+                async for chunk in rest:
+                    yield chunk
+
+            # Baca chunk dengan timeout flush_ms: saat upstream diam, buffer coalescer tetap dikirim
+            stream = chunks()
+            timeout = coalescer.flush_interval if coalescer.flush_interval > 0 else None
+            while True:
+                if next_chunk is None:
+                    next_chunk = asyncio.ensure_future(stream.__anext__())
+                done, _ = await asyncio.wait({next_chunk}, timeout=timeout)
+                if not done:
+                    coalescer.flush_due()
+                    while frames:
+                        await send(frames.pop(0))
+                    if stop_evt.is_set():
+                        break
+                    continue
+                try:
+                    chunk = next_chunk.result()
+                except StopAsyncIteration:
+                    break
+                next_chunk = None
+                if stop_evt.is_set():
+                    break
+                collector.add(chunk)
+                while frames:
+                    await send(frames.pop(0))
+    finally:
+        if next_chunk is not None and not next_chunk.done():
+            next_chunk.cancel()
+        if response is not None:
+            await _aclose_stream(response)
+
+    final = collector.finish(stop_evt.is_set())
+    while frames:
+        await send(frames.pop(0))
+    await send(final)
+    return collector.model, collector.final
+
+@asynccontextmanager
+async def gateway_slot(user_id: str, on_position=None, stop_evt=None):
+    """Padanan async LLMGateway.slot: antrian, giliran, dan batas waktu yang sama, tanpa thread menunggu."""
+    gateway = llm.llm_gateway
+    loop = asyncio.get_running_loop()
+    granted = asyncio.Event()
+    waiter = gateway.enqueue(user_id, on_position, on_grant=lambda: loop.call_soon_threadsafe(granted.set))
+    if waiter is not None:
+        started = time.time()
+        try:
+            while not gateway.poll(waiter, started, stop_evt):
+                try:
+                    await asyncio.wait_for(granted.wait(), 0.25)
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            if not gateway.abandon(waiter, True):
+                gateway.release()
+            raise
+    try:
+        yield
+    finally:
+        gateway.release()
+
+async def stream_completion(send, prompt: str, stop_evt, user_id: str = None, endpoint: str = "summarize_stream"):
+    loop = asyncio.get_running_loop()
+
+    def on_position(position):
+        # Bisa dipanggil dari thread lain (release() oleh stream sinkron)
+        asyncio.run_coroutine_threadsafe(send(api.queue_frame(position)), loop)
+
+    async with gateway_slot(user_id, on_position=on_position, stop_evt=stop_evt):
+        try:
+            return await stream_response(send, prompt, stop_evt, endpoint)
+        except Exception as e:
+            if llm._is_rate_limit_error(e):
+                api.llm_rate_limited.inc(endpoint=endpoint)
+            api.llm_requests.inc(endpoint=endpoint, outcome="error")
+            raise
+
+async def run_summary_stream(send, text: str, mode: str, user_id: str, stop_evt, label: str = "-"):
+    """Padanan async api.run_summary_stream; tahap map-reduce (bila perlu) tetap di thread pool."""
+    loop = asyncio.get_running_loop()
+
+    def on_progress(done, total):
+        asyncio.run_coroutine_threadsafe(send(api.progress_frame(done, total)), loop)
+
+    try:
+        prompt = await blocking(api.prepare_summary_prompt, text, mode, on_progress=on_progress, stop_evt=stop_evt,
+                                user_id=user_id, on_preprocess=api.preprocess_logger(label))
+        if stop_evt.is_set():
+            await send({"end": True})
+            return
+        model, final = await stream_completion(send, prompt, stop_evt, user_id)
+        await blocking(api.cache_streamed_summary, text, mode, model, final, stop_evt)
+    except Exception as e:
+        await send(api.stream_error_frame(e, label))
+
+async def replay_cached_summary(send, summary: str):
+    for frame in api.cached_summary_frames(summary):
+        await send(frame)
+
+
+# =========================
+# Socket.IO (AsyncServer)
+# =========================
+sio = socketio.AsyncServer(
+    async_mode="asgi", cors_allowed_origins="*", always_connect=True,
+    client_manager=socketio.AsyncRedisManager(api.SOCKETIO_MESSAGE_QUEUE) if api.SOCKETIO_MESSAGE_QUEUE else None,
+)
+_sid_locks = {}  # {sid: asyncio.Lock} - event audio/transkrip per socket diproses berurutan
+
+class SocketBridge:
+    """Pengganti api.socketio untuk kode sinkron di thread: emit dijadwalkan ke AsyncServer di event loop."""
+
+    def __init__(self, server):
+        self.server = server
+        self.loop = None
+
+    def emit(self, event, data=None, to=None, **kwargs):
+        asyncio.run_coroutine_threadsafe(self.server.emit(event, data, to=to), self.loop)
+
+    def sleep(self, seconds=0):
+        api.sleep(seconds)
+
+    def start_background_task(self, target, *args, **kwargs):
+        return api.spawn(target, *args, **kwargs)
+
+socket_bridge = SocketBridge(sio)
+
+def summary_sender(sid):
+    async def send(payload):
+        await sio.emit("summary_stream", payload, to=sid)
+    return send
+
+async def _in_order(sid, fn, *args):
+    lock = _sid_locks.setdefault(sid, asyncio.Lock())
+    async with lock:
+        await blocking(fn, sid, *args)
+
+@sio.on("connect")
+async def on_connect(sid, environ, auth=None):
+    headers = {"Authorization": environ.get("HTTP_AUTHORIZATION", "")}
+    args = {k: v[0] for k, v in parse_qs(environ.get("QUERY_STRING", "")).items()}
+    ack = await blocking(api.socket_connect, sid, api._socket_token(auth, headers, args))
+    await sio.emit("connect_ack", ack, to=sid)
+
+@sio.on("authenticate")
+async def on_authenticate(sid, data=None):
+    result = await blocking(api.socket_authenticate, sid, (data or {}).get("token"))
+    await sio.emit("auth_result", result, to=sid)
+
+@sio.on("summarize_stream")
+async def handle_summarize_stream(sid, data=None):
+    send = summary_sender(sid)
+    kind, value = await blocking(api.summary_stream_plan, sid, data)
+    if kind == "frame":
+        await send(value)
+        return
+    if kind == "cached":
+        await replay_cached_summary(send, value)
+        return
+    user, text, mode = value
+    stop_evt = api.socket_sessions.start_stream(sid)
+    try:
+        await run_summary_stream(send, text, mode, user.sub, stop_evt, label=f"socket {sid}")
+    finally:
+        api.socket_sessions.end_stream(sid, stop_evt)
+        print("[socket] stream done", sid)
+
+@sio.on("transcript_summarize")
+async def handle_transcript_summarize(sid, data=None):
+    send = summary_sender(sid)
+    frame, state = api.rolling_summary_plan(sid)
+    if frame is not None:
+        await send(frame)
+        return
+    stop_evt = api.socket_sessions.start_stream(sid)
+    try:
+        prompt = await blocking(api.rolling_summary_prompt, state, stop_evt)
+        if stop_evt.is_set():
+            await send({"end": True})
+            return
+        await stream_completion(send, prompt, stop_evt, state.user_id, endpoint="transcript_summarize")
+    except Exception as e:
+        await send(api.stream_error_frame(e, f"rolling {sid}"))
+    finally:
+        api.socket_sessions.end_stream(sid, stop_evt)
+
+@sio.on("transcript_append")
+async def handle_transcript_append(sid, data=None):
+    await _in_order(sid, api.transcript_append, data)
+
+@sio.on("transcript_reset")
+async def handle_transcript_reset(sid, data=None):
+    await _in_order(sid, api.transcript_reset)
+
+@sio.on("stop_stream")
+async def handle_stop_stream(sid, data=None):
+    await blocking(api.request_stop, sid)
+    await sio.emit("stop_stream", to=sid)
+
+@sio.on("audio_start")
+async def handle_audio_start(sid, data=None):
+    await _in_order(sid, api.audio_start, data)
+
+@sio.on("audio_chunk")
+async def handle_audio_chunk(sid, data=None):
+    await _in_order(sid, api.audio_chunk, data)
+
+@sio.on("audio_stop")
+async def handle_audio_stop(sid, data=None):
+    await _in_order(sid, api.audio_stop)
+
+@sio.on("disconnect")
+async def on_disconnect(sid, *args):
+    _sid_locks.pop(sid, None)
+    await blocking(api.socket_disconnect, sid)
+
+
+# =========================
+# HTTP (native async + Flask lewat a2wsgi)
+# =========================
+_SHARED_PATH = re.compile(r"^/shared/([^/]+)$")
+
+async def _read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+async def _respond(send, status: int, body, content_type="application/json", headers=()):
+    if not isinstance(body, (bytes, str)):
+        body = json.dumps(body, ensure_ascii=False)
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    await send({"type": "http.response.start", "status": status, "headers": [
+        (b"content-type", content_type.encode()), (b"content-length", str(len(body)).encode()),
+    ] + [(k.encode(), v.encode()) for k, v in headers]})
+    await send({"type": "http.response.body", "body": body})
+
+def _observe(scope, route: str, started: float, status: int):
+    if api.METRICS_ENABLED:
+        api.http_request_seconds.observe(time.perf_counter() - started, method=scope["method"], route=route, status=status)
+
+async def _request_user(scope, body: dict):
+    """Padanan api.require_auth; None jika tidak terautentikasi."""
+    # DEV BYPASS: hanya untuk debugging lokal!
+    if os.getenv("DEV_BYPASS_AUTH") == "1":
+        return {"sub": "dev-user", "email": "dev@example.com"}
+    headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+    auth = headers.get("authorization", "")
+    token = auth.split(" ", 1)[1].strip() if auth.startswith("Bearer ") else None
+    if not token:
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        token = (query.get("token") or [None])[0] or body.get("token")
+    if not token:
+        return None
+    try:
+        return await blocking(api.verify_supabase_jwt, token)
+    except Exception as e:
+        api.app.logger.warning(f"JWT verify failed: {e}")
+        return None
+
+async def summarize_stream_sse(scope, receive, send):
+    """Padanan native async POST /summarize/stream (frame dan perilaku sama dengan versi Flask)."""
+    started = time.perf_counter()
+    try:
+        data = json.loads(await _read_body(receive) or b"{}")
+    except ValueError:
+        data = {}
+    data = data if isinstance(data, dict) else {}
+    user = await _request_user(scope, data)
+    if user is None:
+        _observe(scope, "/summarize/stream", started, 401)
+        return await _respond(send, 401, {"error": Unauthorized.description})
+    text = (data.get("text") or "").strip()
+    mode = (data.get("mode") or api.get_current_summary_mode()).strip().lower()
+    user_id = user.get("sub")
+
+    kind, value = await blocking(api.sse_summary_plan, text, mode)
+    if kind == "reject":
+        status, body = value
+        _observe(scope, "/summarize/stream", started, status)
+        return await _respond(send, status, body, headers=[("retry-after", "5")] if status == 429 else ())
+
+    frames = asyncio.Queue()
+    stop_evt = Event()
+
+    async def job():
+        try:
+            if kind == "frame":
+                await frames.put(value)
+            elif kind == "cached":
+                await replay_cached_summary(frames.put, value)
+            else:
+                await run_summary_stream(frames.put, text, mode, user_id, stop_evt, label=f"sse {user_id}")
+        finally:
+            await frames.put(None)
+
+    async def watch_disconnect():
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                stop_evt.set()
+                await frames.put(None)
+                return
+
+    await send({"type": "http.response.start", "status": 200, "headers": [
+        (k.lower().encode(), v.encode()) for k, v in api.SSE_HEADERS.items()
+    ]})
+    api.sse_streams.add(stop_evt)
+    worker = _keep(asyncio.ensure_future(job()))
+    watcher = asyncio.ensure_future(watch_disconnect())
+    try:
+        while not stop_evt.is_set():
+            try:
+                payload = await asyncio.wait_for(frames.get(), api.SSE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                await send({"type": "http.response.body", "body": api.SSE_KEEPALIVE_EVENT.encode(), "more_body": True})
+                continue
+            if payload is None:
+                break
+            await send({"type": "http.response.body", "body": api.sse_event(payload).encode("utf-8"), "more_body": True})
+        if not stop_evt.is_set():
+            await send({"type": "http.response.body", "body": b""})
+    finally:
+        # Selesai normal atau klien putus: hentikan job yang masih jalan (ia berhenti di chunk berikutnya)
+        stop_evt.set()
+        watcher.cancel()
+        api.sse_streams.discard(stop_evt)
+        _observe(scope, "/summarize/stream", started, 200)
+        if worker.done():
+            worker.result()
+
+async def fetch_shared_doc(document_id):
+    """Padanan async api._fetch_shared_doc: Supabase REST lewat pool store_http."""
+    doc = api.shared_cache.get_doc(document_id)
+    if doc is not None:
+        return doc
+    if api.save_outbox:
+        pending = await blocking(api.save_outbox.get, str(document_id))
+        if pending is not None:
+            return pending
+    if not (api.SUPABASE_URL and api.SUPABASE_KEY):
+        # Client supabase yang dipasang langsung (mis. bench/fake_supabase.py)
+        return await blocking(api._fetch_shared_doc, document_id)
+    resp = await store_http.get(
+        f"{api.SUPABASE_URL}/rest/v1/documents",
+        params={"select": "*", "id": f"eq.{document_id}", "limit": "1"},
+        headers={"apikey": api.SUPABASE_KEY, "Authorization": f"Bearer {api.SUPABASE_KEY}"},
+    )
+    resp.raise_for_status()
+    rows = resp.json()
+    if not rows:
+        return None
+    api.shared_cache.put_doc(document_id, rows[0])
+    return rows[0]
+
+async def shared_document(scope, receive, send, identifier: str):
+    """
+    GET /shared/<identifier> lewat api.shared_document_result (logika yang sama dengan route Flask) di
+    executor database; dokumen diambil lewat pool store_http di event loop.
+    """
+    started = time.perf_counter()
+    loop = asyncio.get_running_loop()
+
+    def fetch_doc(document_id):
+        return asyncio.run_coroutine_threadsafe(fetch_shared_doc(document_id), loop).result()
+
+    try:
+        kind, status, body = await db_call(api.shared_document_result, identifier, fetch_doc, render_template)
+    except api.ComponentUnavailable as e:
+        kind, status, body = "json", 503, {"error": str(e)}
+    _observe(scope, "/shared/<identifier>", started, status)
+    if kind == "html":
+        return await _respond(send, status, body, content_type="text/html; charset=utf-8")
+    return await _respond(send, status, body)
+
+wsgi_app = WSGIMiddleware(api.app, workers=ASGI_WSGI_THREADS)
+
+async def http_app(scope, receive, send):
+    if scope["type"] == "http":
+        path, method = scope["path"], scope["method"]
+        if path == "/summarize/stream" and method == "POST":
+            return await summarize_stream_sse(scope, receive, send)
+        # Probe tetap dijawab di event loop walau thread pool WSGI penuh
+        if path == "/healthz" and method == "GET":
+            return await _respond(send, 200, {"status": "ok",
+                                              "uptime_seconds": round(time.time() - api.PROCESS_STARTED_AT, 3)})
+        if path == "/readyz" and method == "GET":
+            body = api.components.readiness()
+            return await _respond(send, 200 if body["ready"] else 503, body)
+        match = _SHARED_PATH.match(path)
+        if match and method == "GET":
+            return await shared_document(scope, receive, send, match.group(1))
+    await wsgi_app(scope, receive, send)
+
+async def on_startup():
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=max(4, ASGI_BLOCKING_THREADS), thread_name_prefix="notaku-io"))
+    socket_bridge.loop = loop
+    api.socketio = socket_bridge
+    llm_clients.update(_build_llm_clients())
+    print(f"[asgi] ready: {len(llm_clients)} LLM route(s), blocking_threads={ASGI_BLOCKING_THREADS}, "
+          f"wsgi_threads={ASGI_WSGI_THREADS}, db_threads={ASGI_DB_THREADS}")
+
+async def on_shutdown():
+    await llm_http.aclose()
+    await store_http.aclose()
+    db_executor.shutdown(wait=False)
+
+app = socketio.ASGIApp(sio, other_asgi_app=http_app, on_startup=on_startup, on_shutdown=on_shutdown)
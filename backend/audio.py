@@ -0,0 +1,336 @@
+"""
+Audio ingestion NOTAKU: voice-activity detection dan transkripsi segmen.
+
+VoiceActivitySegmenter memotong aliran PCM16 mono menjadi segmen ucapan; TranscriptionPool
+mentranskripsi segmen paralel lewat backend yang bisa diganti (Groq Whisper atau stand-in lokal).
+Sesi socket, rute HTTP, dan penggabungan ke transkrip rolling ada di api.py.
+"""
+import importlib
+import io
+import math
+import operator
+import os
+import sys
+import threading
+import time
+import wave
+from array import array
+from collections import deque
+
+from concurrency import spawn, sleep, Semaphore
+from metrics import metrics
+
+AUDIO_MIN_SAMPLE_RATE, AUDIO_MAX_SAMPLE_RATE = 8000, 48000
+AUDIO_FRAME_MS = 30
+VAD_BACKEND = os.getenv("VAD_BACKEND", "auto")  # auto | webrtc | energy
+VAD_AGGRESSIVENESS = int(os.getenv("VAD_AGGRESSIVENESS", "2"))
+VAD_MIN_SPEECH_MS = int(os.getenv("VAD_MIN_SPEECH_MS", "150"))
+VAD_SILENCE_MS = int(os.getenv("VAD_SILENCE_MS", "600"))
+VAD_PREROLL_MS = int(os.getenv("VAD_PREROLL_MS", "300"))
+VAD_MAX_SEGMENT_SECONDS = float(os.getenv("VAD_MAX_SEGMENT_SECONDS", "15"))
+VAD_ENERGY_RATIO = float(os.getenv("VAD_ENERGY_RATIO", "3.0"))
+VAD_MIN_RMS = float(os.getenv("VAD_MIN_RMS", "300"))
+TRANSCRIBE_MODEL = os.getenv("TRANSCRIBE_MODEL", "whisper-large-v3-turbo")
+TRANSCRIBE_LANGUAGE = os.getenv("TRANSCRIBE_LANGUAGE", "id")
+TRANSCRIBE_LOCAL_RTF = float(os.getenv("TRANSCRIBE_LOCAL_RTF", "0.05"))
+TRANSCRIBE_MAX_QUEUED = int(os.getenv("TRANSCRIBE_MAX_QUEUED", "2000"))  # segmen antri maksimal (upload HTTP ditolak)
+
+transcribe_seconds = metrics.histogram(
+    "notaku_transcribe_seconds", "Durasi transkripsi satu segmen audio.", ("backend",))
+transcribe_rtf = metrics.histogram(
+    "notaku_transcribe_real_time_factor", "Waktu proses / durasi audio per segmen (< 1 = lebih cepat dari real time).",
+    ("backend",), buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0))
+audio_segments_total = metrics.counter(
+    "notaku_audio_segments_total", "Segmen ucapan hasil VAD per hasil transkripsi.", ("outcome",))
+
+def _pcm16_samples(data: bytes) -> array:
+    samples = array("h")
+    samples.frombytes(data[: len(data) - len(data) % 2])
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return samples
+
+def _frame_rms(frame: bytes) -> float:
+    samples = _pcm16_samples(frame)
+    if not samples:
+        return 0.0
+    return math.sqrt(sum(map(operator.mul, samples, samples)) / len(samples))
+
+def parse_sample_rate(value):
+    """Sample rate (int) dari input klien atau header WAV; None jika bukan angka atau di luar rentang yang didukung."""
+    try:
+        rate = int(value)
+    except (TypeError, ValueError):
+        return None
+    return rate if AUDIO_MIN_SAMPLE_RATE <= rate <= AUDIO_MAX_SAMPLE_RATE else None
+
+def pcm16_to_wav(pcm: bytes, sample_rate: int) -> bytes:
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(pcm)
+    return buf.getvalue()
+
+def wav_to_pcm16(data: bytes):
+    """(pcm16 mono, sample_rate) dari file WAV 16-bit; kanal pertama dipakai bila stereo."""
+    with wave.open(io.BytesIO(data), "rb") as w:
+        if w.getsampwidth() != 2:
+            raise ValueError("wav_must_be_16bit")
+        channels, rate = w.getnchannels(), w.getframerate()
+        pcm = w.readframes(w.getnframes())
+    if channels > 1:
+        samples = _pcm16_samples(pcm)[::channels]
+        if sys.byteorder == "big":
+            samples.byteswap()
+        pcm = samples.tobytes()
+    return pcm, rate
+
+class AudioSegment:
+    __slots__ = ("seq", "pcm", "start", "end", "sample_rate")
+
+    def __init__(self, seq: int, pcm: bytes, start: float, end: float, sample_rate: int):
+        self.seq = seq
+        self.pcm = pcm
+        self.start = start
+        self.end = end
+        self.sample_rate = sample_rate
+
+    @property
+    def duration(self) -> float:
+        return len(self.pcm) / 2 / self.sample_rate
+
+    def to_wav(self) -> bytes:
+        return pcm16_to_wav(self.pcm, self.sample_rate)
+
+def _create_webrtc_vad(sample_rate: int):
+    if VAD_BACKEND == "energy" or sample_rate not in (8000, 16000, 32000, 48000):
+        return None
+    try:
+        import webrtcvad  # opsional
+        return webrtcvad.Vad(max(0, min(3, VAD_AGGRESSIVENESS)))
+    except ImportError:
+        if VAD_BACKEND == "webrtc":
+            print("[WARN] VAD_BACKEND=webrtc tetapi webrtcvad tidak terpasang; pakai VAD energi.")
+        return None
+
+class VoiceActivitySegmenter:
+    """
+    Potong aliran PCM16 mono menjadi segmen ucapan per frame 30 ms. Dengan webrtcvad bila terpasang,
+    selain itu energi (RMS) terhadap noise floor adaptif. Segmen dimulai setelah VAD_MIN_SPEECH_MS
+    ucapan (ditambah pre-roll), selesai setelah VAD_SILENCE_MS hening atau VAD_MAX_SEGMENT_SECONDS.
+    """
+
+    def __init__(self, sample_rate: int, on_segment):
+        self.sample_rate = sample_rate
+        self.on_segment = on_segment
+        self.frame_bytes = sample_rate * AUDIO_FRAME_MS // 1000 * 2
+        if self.frame_bytes <= 0:
+            # frame 0 byte membuat feed() berputar selamanya
+            raise ValueError("invalid_sample_rate")
+        self.max_segment_bytes = int(VAD_MAX_SEGMENT_SECONDS * sample_rate) * 2
+        self._vad = _create_webrtc_vad(sample_rate)
+        self._buf = bytearray()
+        self._preroll = deque(maxlen=max(1, VAD_PREROLL_MS // AUDIO_FRAME_MS))
+        self._segment = None
+        self._segment_start = 0
+        self._voiced_run = 0
+        self._silence_run = 0
+        self._noise = None
+        self.frames = 0
+        self.seq = 0
+
+    @property
+    def seconds(self) -> float:
+        return self.frames * AUDIO_FRAME_MS / 1000.0
+
+    def _is_speech(self, frame: bytes) -> bool:
+        if self._vad is not None:
+            return self._vad.is_speech(frame, self.sample_rate)
+        rms = _frame_rms(frame)
+        if self._noise is None:
+            self._noise = rms
+        speech = rms > max(VAD_MIN_RMS, self._noise * VAD_ENERGY_RATIO)
+        if not speech:
+            self._noise = 0.95 * self._noise + 0.05 * rms
+        return speech
+
+    def feed(self, data: bytes):
+        self._buf.extend(data)
+        size = self.frame_bytes
+        while len(self._buf) >= size:
+            frame = bytes(self._buf[:size])
+            del self._buf[:size]
+            self._process(frame)
+
+    def _process(self, frame: bytes):
+        self.frames += 1
+        speech = self._is_speech(frame)
+        if self._segment is None:
+            self._preroll.append(frame)
+            self._voiced_run = self._voiced_run + 1 if speech else 0
+            if self._voiced_run * AUDIO_FRAME_MS >= VAD_MIN_SPEECH_MS:
+                self._segment = bytearray(b"".join(self._preroll))
+                self._segment_start = self.frames - len(self._preroll)
+                self._preroll.clear()
+                self._silence_run = 0
+            return
+        self._segment.extend(frame)
+        self._silence_run = 0 if speech else self._silence_run + 1
+        if self._silence_run * AUDIO_FRAME_MS >= VAD_SILENCE_MS or len(self._segment) >= self.max_segment_bytes:
+            self._emit()
+
+    def _emit(self):
+        pcm, start = bytes(self._segment), self._segment_start
+        self._segment = None
+        self._voiced_run = 0
+        self._silence_run = 0
+        self.seq += 1
+        frame_s = AUDIO_FRAME_MS / 1000.0
+        self.on_segment(AudioSegment(self.seq, pcm, start * frame_s, self.frames * frame_s, self.sample_rate))
+
+    def flush(self):
+        """Akhiri segmen yang masih terbuka (dipanggil saat audio selesai)."""
+        if self._segment is not None:
+            if self._buf:
+                self._segment.extend(self._buf)
+                self._buf.clear()
+            self._emit()
+
+class GroqTranscriber:
+    """Transkripsi lewat endpoint audio Groq (Whisper); client = klien Groq (boleh lazy)."""
+    name = "groq"
+
+    def __init__(self, client=None):
+        self.client = client
+
+    def transcribe(self, segment: AudioSegment) -> str:
+        if not self.client:
+            raise RuntimeError("groq_api_key_missing")
+        kwargs = {"language": TRANSCRIBE_LANGUAGE} if TRANSCRIBE_LANGUAGE else {}
+        resp = self.client.audio.transcriptions.create(
+            file=(f"segment-{segment.seq}.wav", segment.to_wav()),
+            model=TRANSCRIBE_MODEL,
+            temperature=0.0,
+            **kwargs,
+        )
+        return (getattr(resp, "text", "") or "").strip()
+
+class LocalTranscriber:
+    """Stand-in lokal untuk test/benchmark: tanpa jaringan, latency = durasi segmen * TRANSCRIBE_LOCAL_RTF."""
+    name = "local"
+
+    def __init__(self, rtf: float = None):
+        self.rtf = TRANSCRIBE_LOCAL_RTF if rtf is None else rtf
+
+    def transcribe(self, segment: AudioSegment) -> str:
+        sleep(segment.duration * self.rtf)
+        return f"segmen {segment.seq} ({segment.duration:.1f} detik)."
+
+TRANSCRIBERS = {"groq": GroqTranscriber, "local": LocalTranscriber}
+
+def create_transcriber(spec: str, groq_client=None):
+    """Nama di TRANSCRIBERS atau "modul:Kelas" untuk backend lain (kelas dengan method transcribe(segment))."""
+    if spec == "groq":
+        return GroqTranscriber(groq_client)
+    if spec in TRANSCRIBERS:
+        return TRANSCRIBERS[spec]()
+    module_name, _, attr = spec.partition(":")
+    if not attr:
+        raise ValueError(f"unknown transcribe backend: {spec}")
+    return getattr(importlib.import_module(module_name), attr)()
+
+class TranscriptionPool:
+    """
+    Worker pool green-thread (thread di mode ASGI) bersama untuk semua sesi; konkurensi dibatasi
+    semaphore. Segmen yang pemiliknya sudah batal (cancelled() True: upload HTTP lewat batas waktu,
+    socket putus) dilewati saat gilirannya tiba, tidak dikirim ke backend.
+    """
+
+    def __init__(self, backend, concurrency: int):
+        self.backend = backend
+        self.backend_name = getattr(backend, "name", type(backend).__name__)
+        self._sem = Semaphore(max(1, concurrency))
+        self._lock = threading.Lock()
+        self.concurrency = max(1, concurrency)
+        self.queued = 0
+        self.running = 0
+        self.done = 0
+        self.failed = 0
+        self.skipped = 0
+        self.audio_seconds = 0.0
+        self.busy_seconds = 0.0
+
+    def has_room(self, n: int) -> bool:
+        with self._lock:
+            return self.queued + n <= TRANSCRIBE_MAX_QUEUED
+
+    def submit(self, segment: AudioSegment, callback, cancelled=None):
+        """
+        Tidak memblokir pemanggil; callback(segment, text, error) dipanggil dari worker, juga untuk
+        segmen yang dilewati (error "cancelled") agar pemanggil tetap bisa menghitung sisa segmen.
+        """
+        with self._lock:
+            self.queued += 1
+        spawn(self._run, segment, callback, cancelled)
+
+    def _run(self, segment: AudioSegment, callback, cancelled=None):
+        with self._sem:
+            skip = cancelled is not None and cancelled()
+            with self._lock:
+                self.queued -= 1
+                if skip:
+                    self.skipped += 1
+                else:
+                    self.running += 1
+            if skip:
+                audio_segments_total.inc(outcome="skipped")
+                self._callback(callback, segment, "", "cancelled")
+                return
+            started = time.perf_counter()
+            text, error = "", None
+            try:
+                text = self.backend.transcribe(segment)
+            except Exception as e:
+                error = str(e)
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.running -= 1
+                self.audio_seconds += segment.duration
+                self.busy_seconds += elapsed
+                if error:
+                    self.failed += 1
+                else:
+                    self.done += 1
+        transcribe_seconds.observe(elapsed, backend=self.backend_name)
+        if segment.duration > 0:
+            transcribe_rtf.observe(elapsed / segment.duration, backend=self.backend_name)
+        if error:
+            audio_segments_total.inc(outcome="error")
+            print(f"[audio] segmen {segment.seq} gagal ditranskripsi: {error}")
+        else:
+            audio_segments_total.inc(outcome="ok")
+        self._callback(callback, segment, text, error)
+
+    @staticmethod
+    def _callback(callback, segment, text, error):
+        try:
+            callback(segment, text, error)
+        except Exception as e:
+            print(f"[audio] callback error: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": self.backend_name,
+                "concurrency": self.concurrency,
+                "queued": self.queued,
+                "running": self.running,
+                "done": self.done,
+                "failed": self.failed,
+                "skipped": self.skipped,
+                "audio_seconds": round(self.audio_seconds, 1),
+                # Kapasitas kira-kira: berapa aliran real-time yang sanggup dilayani pool ini
+                "real_time_factor": round(self.busy_seconds / self.audio_seconds, 3) if self.audio_seconds else None,
+            }
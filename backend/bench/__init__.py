@@ -0,0 +1,7 @@
+"""
+Benchmark offline untuk backend/api.py.
+
+Jalankan dari folder backend/:
+
+    python -m bench.run_bench --help
+"""
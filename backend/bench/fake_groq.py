@@ -0,0 +1,203 @@
+"""
+Server chat-completions palsu yang kompatibel dengan Groq/OpenAI untuk benchmark.
+
+    python -m bench.fake_groq --port 5901 --ttft-ms 300 --tokens-per-sec 250
+
+Mendukung POST /openai/v1/chat/completions (dan /v1/chat/completions), baik
+streaming (SSE) maupun non-streaming. Isi jawaban berupa notulensi tiruan.
+Dengan --rpm/--tpm kuota per menit ditegakkan seperti Groq: header x-ratelimit-*
+di tiap respons dan 429 + retry-after saat kuota habis.
+"""
+import eventlet
+eventlet.monkey_patch()
+
+import argparse
+import itertools
+import json
+import math
+import time
+import uuid
+
+from eventlet import wsgi
+
+WORDS = (
+    "**Notulensi Rapat** **Topik Pembahasan:** - Anggaran proyek dan jadwal rilis "
+    "**Peserta Rapat:** - Budi - Ani - Sari **Poin-Poin Penting:** - Progres modul "
+    "pembayaran sudah 80% - Pengujian beban dijadwalkan minggu depan "
+    "**Keputusan yang Diambil:** - Rilis ditunda satu minggu "
+    "**Action Items / Tugas:** - Budi - menyiapkan laporan keuangan - Jumat "
+    "**Follow-up / Tindak Lanjut:** - Rapat lanjutan hari Senin "
+    "**Catatan Tambahan:** - Tidak ada"
+).split(" ")
+
+
+class FakeGroq:
+    def __init__(self, ttft_ms: float, tokens_per_sec: float, completion_tokens: int, rpm: float = 0, tpm: float = 0):
+        self.ttft = ttft_ms / 1000.0
+        self.token_interval = 1.0 / tokens_per_sec if tokens_per_sec > 0 else 0.0
+        self.completion_tokens = completion_tokens
+        self.requests = 0
+        self.active = 0
+        self.rate_limited = 0
+        self.rpm = rpm
+        self.tpm = tpm
+        self.req_level = rpm
+        self.tok_level = tpm
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed, self.updated = now - self.updated, now
+        if self.rpm > 0:
+            self.req_level = min(self.rpm, self.req_level + elapsed * self.rpm / 60.0)
+        if self.tpm > 0:
+            self.tok_level = min(self.tpm, self.tok_level + elapsed * self.tpm / 60.0)
+
+    def _admit(self, tokens: int):
+        """None jika diterima (kuota dipotong), selain itu detik sampai kuota cukup."""
+        self._refill()
+        waits = []
+        if self.rpm > 0 and self.req_level < 1:
+            waits.append((1 - self.req_level) * 60.0 / self.rpm)
+        if self.tpm > 0 and self.tok_level < min(tokens, self.tpm):
+            waits.append((min(tokens, self.tpm) - self.tok_level) * 60.0 / self.tpm)
+        if waits:
+            return max(waits)
+        self.req_level -= 1
+        self.tok_level -= tokens
+        return None
+
+    def _tokens(self):
+        words = itertools.islice(itertools.cycle(WORDS), self.completion_tokens)
+        return [w + " " for w in words]
+
+    def _headers(self):
+        if not (self.rpm or self.tpm):
+            return [
+                ("x-ratelimit-limit-requests", "14400"),
+                ("x-ratelimit-remaining-requests", "14399"),
+                ("x-ratelimit-limit-tokens", "1000000"),
+                ("x-ratelimit-remaining-tokens", "999000"),
+            ]
+        rpm, tpm = self.rpm or 14400, self.tpm or 1000000
+        req_level = self.req_level if self.rpm else rpm
+        tok_level = self.tok_level if self.tpm else tpm
+        return [
+            ("x-ratelimit-limit-requests", str(int(rpm))),
+            ("x-ratelimit-remaining-requests", str(max(0, int(req_level)))),
+            ("x-ratelimit-reset-requests", f"{max(0.0, (1 - req_level) * 60.0 / rpm):.2f}s"),
+            ("x-ratelimit-limit-tokens", str(int(tpm))),
+            ("x-ratelimit-remaining-tokens", str(max(0, int(tok_level)))),
+            ("x-ratelimit-reset-tokens", f"{max(0.0, (tpm - tok_level) * 60.0 / tpm):.2f}s"),
+        ]
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        if environ["REQUEST_METHOD"] == "GET" and path == "/stats":
+            body = json.dumps({"requests": self.requests, "active": self.active,
+                               "rate_limited": self.rate_limited}).encode()
+            start_response("200 OK", [("Content-Type", "application/json")])
+            return [body]
+        if environ["REQUEST_METHOD"] != "POST" or not path.endswith("/chat/completions"):
+            start_response("404 Not Found", [("Content-Type", "application/json")])
+            return [b'{"error": {"message": "not found"}}']
+
+        length = int(environ.get("CONTENT_LENGTH") or 0)
+        payload = json.loads(environ["wsgi.input"].read(length) or b"{}")
+        model = payload.get("model", "fake-model")
+        prompt_chars = sum(len(m.get("content") or "") for m in payload.get("messages", []))
+        self.requests += 1
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        usage = {
+            "prompt_tokens": prompt_chars // 4,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": prompt_chars // 4 + self.completion_tokens,
+        }
+        wait = self._admit(usage["total_tokens"])
+        if wait is not None:
+            self.rate_limited += 1
+            body = json.dumps({"error": {
+                "message": f"Rate limit reached for model `{model}`. Please try again in {wait:.2f}s.",
+                "type": "tokens",
+                "code": "rate_limit_exceeded",
+            }}).encode()
+            start_response("429 Too Many Requests", [("Content-Type", "application/json"),
+                                                     ("retry-after", str(math.ceil(wait)))] + self._headers())
+            return [body]
+
+        if not payload.get("stream"):
+            self.active += 1
+            try:
+                eventlet.sleep(self.ttft + self.token_interval * self.completion_tokens)
+            finally:
+                self.active -= 1
+            body = json.dumps({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(self._tokens()).strip()},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            }).encode()
+            start_response("200 OK", [("Content-Type", "application/json")] + self._headers())
+            return [body]
+
+        # Kirim tiap chunk SSE langsung (default eventlet.wsgi menahan sampai 4 KB)
+        environ["eventlet.minimum_write_chunk_size"] = 0
+        start_response("200 OK", [("Content-Type", "text/event-stream"), ("Cache-Control", "no-cache")] + self._headers())
+
+        def stream():
+            self.active += 1
+            try:
+                eventlet.sleep(self.ttft)
+                for tok in self._tokens():
+                    chunk = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": created,
+                        "model": model,
+                        "choices": [{"index": 0, "delta": {"content": tok}, "finish_reason": None}],
+                    }
+                    yield f"data: {json.dumps(chunk)}\n\n".encode()
+                    if self.token_interval:
+                        eventlet.sleep(self.token_interval)
+                done = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                    "x_groq": {"usage": usage},
+                }
+                yield f"data: {json.dumps(done)}\n\n".encode()
+                yield b"data: [DONE]\n\n"
+            finally:
+                self.active -= 1
+
+        return stream()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fake Groq chat-completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5901)
+    parser.add_argument("--ttft-ms", type=float, default=300.0, help="time-to-first-token")
+    parser.add_argument("--tokens-per-sec", type=float, default=250.0, help="0 = secepatnya")
+    parser.add_argument("--completion-tokens", type=int, default=120)
+    parser.add_argument("--rpm", type=float, default=0, help="kuota request/menit (0 = tanpa batas)")
+    parser.add_argument("--tpm", type=float, default=0, help="kuota token/menit (0 = tanpa batas)")
+    args = parser.parse_args(argv)
+
+    app = FakeGroq(args.ttft_ms, args.tokens_per_sec, args.completion_tokens, args.rpm, args.tpm)
+    sock = eventlet.listen((args.host, args.port))
+    print(f"[fake_groq] listening on http://{args.host}:{args.port}", flush=True)
+    wsgi.server(sock, app, log_output=False, max_size=10000)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Pengganti in-memory untuk client Supabase (hanya tabel yang dipakai api.py).
+
+Mendukung subset query builder yang dipakai backend: select, eq, in_, or_ (format
+keyset pagination), order (beberapa kolom), limit, insert dan upsert.
+"""
+import copy
+import re
+import threading
+from types import SimpleNamespace
+
+_KEYSET = re.compile(
+    r'^(\w+)\.lt\."([^"]*)",and\((\w+)\.eq\."([^"]*)",(\w+)\.lt\."([^"]*)"\)$'
+)
+
+
+class FakeQuery:
+    def __init__(self, store, name):
+        self._store = store
+        self._name = name
+        self._columns = None
+        self._filters = []
+        self._order = []
+        self._limit = None
+        self._write = None
+        self._ignore_duplicates = False
+
+    def select(self, columns="*", **kwargs):
+        if columns.strip() != "*":
+            self._columns = [c.strip() for c in columns.split(",")]
+        return self
+
+    def eq(self, column, value):
+        self._filters.append(lambda r: r.get(column) == value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self._filters.append(lambda r: r.get(column) in values)
+        return self
+
+    def or_(self, expr):
+        m = _KEYSET.match(expr)
+        if not m:
+            raise ValueError(f"fake_supabase: unsupported or_ filter: {expr}")
+        col, upper, _, eq_val, col2, upper2 = m.groups()
+        self._filters.append(
+            lambda r: r.get(col) < upper or (r.get(col) == eq_val and r.get(col2) < upper2)
+        )
+        return self
+
+    def order(self, column, desc=False):
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def insert(self, rows, **kwargs):
+        self._write = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def upsert(self, rows, ignore_duplicates=False, **kwargs):
+        self._write = rows if isinstance(rows, list) else [rows]
+        self._ignore_duplicates = ignore_duplicates
+        return self
+
+    def execute(self):
+        with self._store.lock:
+            self._store.calls += 1
+            table = self._store.tables.setdefault(self._name, {})
+            if self._write is not None:
+                written = []
+                for row in self._write:
+                    if row.get("id") in table:
+                        if self._ignore_duplicates:
+                            continue
+                        raise Exception(f"duplicate key value violates unique constraint ({row.get('id')})")
+                    table[row["id"]] = copy.deepcopy(row)
+                    written.append(copy.deepcopy(row))
+                return SimpleNamespace(data=written)
+
+            rows = [r for r in table.values() if all(f(r) for f in self._filters)]
+            for column, desc in reversed(self._order):
+                rows.sort(key=lambda r: r.get(column) or "", reverse=desc)
+            if self._limit is not None:
+                rows = rows[: self._limit]
+            if self._columns:
+                rows = [{c: r.get(c) for c in self._columns} for r in rows]
+            return SimpleNamespace(data=copy.deepcopy(rows))
+
+
+class FakeSupabase:
+    def __init__(self):
+        self.tables = {}
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def seed_documents(self, rows):
+        with self.lock:
+            table = self.tables.setdefault("documents", {})
+            for row in rows:
+                table[row["id"]] = dict(row)
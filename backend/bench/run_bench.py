@@ -0,0 +1,380 @@
+"""
+Benchmark beban offline untuk api.py (tanpa Groq/Supabase asli).
+
+    cd backend
+    python -m bench.run_bench                       # semua skenario, nilai default
+    python -m bench.run_bench --scenarios stream --stream-clients 200
+    python -m bench.run_bench --out result.json --baseline baseline.json
+
+Menjalankan bench.fake_groq dan bench.server sebagai subprocess, lalu driver:
+- summarize : POST /summarize paralel
+- stream    : banyak klien Socket.IO `summarize_stream` bersamaan
+- shared    : GET /shared/<token>
+- history   : GET /api/history (halaman pertama + halaman berikutnya)
+
+Laporan berisi p50/p95/p99, throughput, dan frame per detik untuk stream.
+Dengan --baseline, keluar dengan kode 1 jika p95 memburuk melebihi --max-regression.
+"""
+import eventlet
+eventlet.monkey_patch()
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+import jwt
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+JWT_SECRET = "notaku-bench-secret-not-for-production"
+SCENARIOS = ("summarize", "stream", "shared", "history")
+
+
+# =========================
+# Helpers
+# =========================
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_http(url: str, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=2):
+                return
+        except urllib.error.HTTPError:
+            return
+        except Exception:
+            eventlet.sleep(0.2)
+    raise RuntimeError(f"timeout waiting for {url}")
+
+
+def make_token(user_id: str) -> str:
+    now = int(time.time())
+    return jwt.encode(
+        {"sub": user_id, "email": f"{user_id}@bench.local", "aud": "authenticated", "iat": now, "exp": now + 3600},
+        JWT_SECRET,
+        algorithm="HS256",
+    )
+
+
+def percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[k]
+
+
+def summarize_latencies(latencies, errors: int, elapsed: float) -> dict:
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2) if latencies else 0.0,
+    }
+
+
+def http_request(method: str, url: str, token: str = None, body: dict = None, timeout: float = 120.0):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data=data, method=method)
+    if data is not None:
+        req.add_header("Content-Type", "application/json")
+    if token:
+        req.add_header("Authorization", f"Bearer {token}")
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.status, resp.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def run_http_load(requests_total: int, concurrency: int, make_call):
+    """Jalankan make_call(i) -> bool sebanyak requests_total dengan konkurensi tetap."""
+    latencies, errors = [], 0
+    pool = eventlet.GreenPool(concurrency)
+
+    def one(i):
+        started = time.perf_counter()
+        ok = make_call(i)
+        return ok, time.perf_counter() - started
+
+    started = time.perf_counter()
+    for ok, latency in pool.imap(one, range(requests_total)):
+        if ok:
+            latencies.append(latency)
+        else:
+            errors += 1
+    return summarize_latencies(latencies, errors, time.perf_counter() - started)
+
+
+def transcript(i: int, chars: int) -> str:
+    # Teks unik per request agar tidak terkena cache ringkasan; kalimat bernomor dan sedikit
+    # filler supaya mirip transkrip asli dan tidak habis dibuang oleh dedupe preprocessing
+    parts, k = [], 0
+    while sum(len(p) for p in parts) < chars:
+        k += 1
+        filler = "eh " if k % 3 == 0 else ""
+        parts.append(f"{filler}Poin {k} rapat nomor {i} membahas anggaran, jadwal rilis, dan pembagian tugas tim. ")
+    return "".join(parts)[:chars]
+
+
+# =========================
+# Scenarios
+# =========================
+def bench_summarize(base: str, users, args) -> dict:
+    tokens = [make_token(u) for u in users]
+    run_id = uuid.uuid4().hex[:6]
+
+    def call(i):
+        status, _ = http_request(
+            "POST", f"{base}/summarize", tokens[i % len(tokens)],
+            {"text": transcript(i, args.transcript_chars) + run_id},
+        )
+        return status == 200
+
+    return run_http_load(args.requests, args.concurrency, call)
+
+
+def bench_stream(base: str, users, args) -> dict:
+    import socketio
+
+    tokens = [make_token(u) for u in users]
+    run_id = uuid.uuid4().hex[:6]
+    ttft, totals, frames_total, errors = [], [], [0], [0]
+
+    def client(i):
+        sio = socketio.Client(reconnection=False)
+        done = eventlet.event.Event()
+        state = {"first": None, "frames": 0}
+
+        @sio.on("summary_stream")
+        def on_stream(data):
+            if data.get("token") and state["first"] is None:
+                state["first"] = time.perf_counter()
+            if data.get("token"):
+                state["frames"] += 1
+            if data.get("error"):
+                errors[0] += 1
+                if not done.ready():
+                    done.send(False)
+            elif data.get("end") and not done.ready():
+                done.send(True)
+
+        try:
+            sio.connect(base, auth={"token": tokens[i % len(tokens)]}, transports=args.transports, wait_timeout=10)
+            started = time.perf_counter()
+            sio.emit("summarize_stream", {"text": transcript(i, args.transcript_chars) + run_id})
+            ok = done.wait(timeout=args.stream_timeout)
+            if ok:
+                totals.append(time.perf_counter() - started)
+                if state["first"] is not None:
+                    ttft.append(state["first"] - started)
+                frames_total[0] += state["frames"]
+            elif ok is None:
+                errors[0] += 1
+        except Exception as e:
+            print(f"[bench] stream client {i} failed: {e}")
+            errors[0] += 1
+        finally:
+            try:
+                sio.disconnect()
+            except Exception:
+                pass
+
+    started = time.perf_counter()
+    pool = eventlet.GreenPool(args.stream_clients)
+    for i in range(args.stream_clients):
+        pool.spawn(client, i)
+    pool.waitall()
+    elapsed = time.perf_counter() - started
+
+    result = summarize_latencies(totals, errors[0], elapsed)
+    result["ttft_p50_ms"] = round(percentile(ttft, 50) * 1000, 2)
+    result["ttft_p95_ms"] = round(percentile(ttft, 95) * 1000, 2)
+    result["ttft_p99_ms"] = round(percentile(ttft, 99) * 1000, 2)
+    result["frames"] = frames_total[0]
+    result["frames_per_sec"] = round(frames_total[0] / elapsed, 2) if elapsed > 0 else 0.0
+    return result
+
+
+def bench_shared(base: str, share_tokens, args) -> dict:
+    def call(i):
+        status, _ = http_request("GET", f"{base}/shared/{share_tokens[i % len(share_tokens)]}")
+        return status == 200
+
+    return run_http_load(args.requests, args.concurrency, call)
+
+
+def bench_history(base: str, users, args) -> dict:
+    tokens = [make_token(u) for u in users]
+
+    def call(i):
+        token = tokens[i % len(tokens)]
+        status, body = http_request("GET", f"{base}/api/history?limit={args.history_limit}", token)
+        if status != 200:
+            return False
+        # Setiap request kedua juga mengambil halaman berikutnya (tidak ter-cache)
+        cursor = json.loads(body).get("next_cursor")
+        if cursor and i % 2:
+            status, _ = http_request("GET", f"{base}/api/history?limit={args.history_limit}&cursor={cursor}", token)
+        return status == 200
+
+    return run_http_load(args.requests, args.concurrency, call)
+
+
+# =========================
+# Reporting
+# =========================
+def print_report(results: dict):
+    print()
+    print(f"{'scenario':<10} {'count':>6} {'err':>4} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}  extra")
+    for name, r in results.items():
+        extra = ""
+        if "frames_per_sec" in r:
+            extra = f"ttft p50/p95/p99={r['ttft_p50_ms']}/{r['ttft_p95_ms']}/{r['ttft_p99_ms']} ms, {r['frames_per_sec']} frames/s"
+        print(
+            f"{name:<10} {r['count']:>6} {r['errors']:>4} {r['throughput_rps']:>9} "
+            f"{r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9}  {extra}"
+        )
+
+
+def compare_baseline(results: dict, baseline: dict, max_regression: float):
+    regressions = []
+    for name, r in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        for key in ("p95_ms", "ttft_p95_ms"):
+            if key in r and base.get(key):
+                ratio = r[key] / base[key]
+                if ratio > 1.0 + max_regression:
+                    regressions.append(f"{name}.{key}: {base[key]} -> {r[key]} ms (+{(ratio - 1) * 100:.0f}%)")
+        if base.get("errors", 0) == 0 and r.get("errors", 0) > 0:
+            regressions.append(f"{name}.errors: 0 -> {r['errors']}")
+    return regressions
+
+
+# =========================
+# Main
+# =========================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test for api.py")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=200, help="request per skenario HTTP")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--stream-clients", type=int, default=50)
+    parser.add_argument("--stream-timeout", type=float, default=120.0)
+    parser.add_argument("--transports", default="websocket", help="websocket atau polling")
+    parser.add_argument("--transcript-chars", type=int, default=2000)
+    parser.add_argument("--history-limit", type=int, default=20)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--docs-per-user", type=int, default=200)
+    parser.add_argument("--ttft-ms", type=float, default=300.0)
+    parser.add_argument("--tokens-per-sec", type=float, default=250.0)
+    parser.add_argument("--completion-tokens", type=int, default=120)
+    parser.add_argument("--groq-rpm", type=float, default=0, help="kuota request/menit fake Groq (0 = tanpa batas)")
+    parser.add_argument("--groq-tpm", type=float, default=0, help="kuota token/menit fake Groq (0 = tanpa batas)")
+    parser.add_argument("--mode", choices=("eventlet", "asgi"), default="eventlet", help="mode server api.py")
+    parser.add_argument("--server-env", action="append", default=[], help="KEY=VALUE tambahan untuk server api.py")
+    parser.add_argument("--out", default=None, help="simpan hasil ke file JSON")
+    parser.add_argument("--baseline", default=None, help="file JSON hasil sebelumnya untuk deteksi regresi")
+    parser.add_argument("--max-regression", type=float, default=0.25, help="batas kenaikan p95 (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+    args.transports = [t.strip() for t in args.transports.split(",") if t.strip()]
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    groq_port, api_port = free_port(), free_port()
+    workdir = tempfile.mkdtemp(prefix="notaku-bench-")
+    manifest_path = os.path.join(workdir, "manifest.json")
+    env = dict(os.environ, GROQ_BASE_URL=f"http://127.0.0.1:{groq_port}", PYTHONUNBUFFERED="1")
+    for item in args.server_env:
+        key, _, value = item.partition("=")
+        env[key] = value
+
+    procs = []
+    try:
+        procs.append(subprocess.Popen(
+            [sys.executable, "-m", "bench.fake_groq", "--port", str(groq_port),
+             "--ttft-ms", str(args.ttft_ms), "--tokens-per-sec", str(args.tokens_per_sec),
+             "--completion-tokens", str(args.completion_tokens),
+             "--rpm", str(args.groq_rpm), "--tpm", str(args.groq_tpm)],
+            cwd=BACKEND_DIR, env=env,
+        ))
+        server_log = open(os.path.join(workdir, "server.log"), "w")
+        procs.append(subprocess.Popen(
+            [sys.executable, "-m", "bench.server", "--port", str(api_port),
+             "--users", str(args.users), "--docs-per-user", str(args.docs_per_user),
+             "--manifest", manifest_path, "--workdir", workdir, "--mode", args.mode],
+            cwd=BACKEND_DIR, env=env, stdout=server_log, stderr=subprocess.STDOUT,
+        ))
+        base = f"http://127.0.0.1:{api_port}"
+        wait_http(f"http://127.0.0.1:{groq_port}/stats")
+        wait_http(f"{base}/test", timeout=60)
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+        results = {}
+        for name in scenarios:
+            print(f"[bench] running {name} ...", flush=True)
+            if name == "summarize":
+                results[name] = bench_summarize(base, manifest["users"], args)
+            elif name == "stream":
+                results[name] = bench_stream(base, manifest["users"], args)
+            elif name == "shared":
+                results[name] = bench_shared(base, manifest["share_tokens"], args)
+            elif name == "history":
+                results[name] = bench_history(base, manifest["users"], args)
+        print_report(results)
+        _, raw = http_request("GET", f"http://127.0.0.1:{groq_port}/stats")
+        upstream = json.loads(raw)
+        print(f"\n[bench] upstream: {upstream['requests']} requests, {upstream['rate_limited']} rate limited (429)")
+        print(f"\n[bench] server log: {os.path.join(workdir, 'server.log')}")
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            try:
+                p.wait(timeout=5)
+            except Exception:
+                p.kill()
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "baseline")},
+        "results": results,
+        "upstream": upstream,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_baseline(results, json.load(f), args.max_regression)
+        if regressions:
+            print("\n[bench] REGRESSION:")
+            for line in regressions:
+                print("  - " + line)
+            return 1
+        print("\n[bench] no regression against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""
+Menjalankan api.py untuk benchmark dengan Supabase in-memory dan dokumen contoh.
+
+    python -m bench.server --port 5902 --users 20 --docs-per-user 200
+    python -m bench.server --port 5902 --mode asgi   # asgi.py di uvicorn, tanpa eventlet
+
+Groq diarahkan lewat env GROQ_BASE_URL (mis. ke bench/fake_groq.py). Share token
+untuk dokumen contoh ditulis ke file JSON (--manifest) agar driver bisa memakainya.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _configure_env(workdir: str):
+    defaults = {
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'share_tokens.db')}",
+        "SEARCH_INDEX_DB": os.path.join(workdir, "search_index.db"),
+        "SAVE_OUTBOX_DB": os.path.join(workdir, "outbox.db"),
+        "SUMMARY_CACHE_DB": os.path.join(workdir, "summary_cache.db"),
+    }
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+    # Jangan pakai kredensial asli dari backend/.env untuk benchmark
+    os.environ["GROQ_API_KEY"] = "bench-key"
+    os.environ["SUPABASE_JWT_SECRET"] = "notaku-bench-secret-not-for-production"
+    os.environ["SUPABASE_URL"] = ""
+    os.environ["SUPABASE_KEY"] = ""
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="api.py benchmark server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5902)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--docs-per-user", type=int, default=200)
+    parser.add_argument("--doc-chars", type=int, default=3000)
+    parser.add_argument("--share-tokens", type=int, default=50)
+    parser.add_argument("--manifest", default=None, help="tulis user/token contoh ke file JSON")
+    parser.add_argument("--workdir", default=None)
+    parser.add_argument("--mode", choices=("eventlet", "asgi"), default="eventlet")
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="notaku-bench-")
+    _configure_env(workdir)
+    sys.path.insert(0, BACKEND_DIR)
+
+    if args.mode == "asgi":
+        import asgi
+        api = asgi.api
+    else:
+        import api
+    from bench.fake_supabase import FakeSupabase
+
+    fake = FakeSupabase()
+    api.supabase = fake
+
+    base = datetime(2025, 1, 1)
+    sentence = "Budi melaporkan progres modul pembayaran dan Ani membahas jadwal rilis. "
+    body = (sentence * (args.doc_chars // len(sentence) + 1))[: args.doc_chars]
+    users = [f"bench-user-{i}" for i in range(args.users)]
+    rows, doc_ids = [], []
+    for u, user_id in enumerate(users):
+        for d in range(args.docs_per_user):
+            doc_id = str(uuid.uuid4())
+            created = (base + timedelta(minutes=u * args.docs_per_user + d)).isoformat() + "Z"
+            rows.append({
+                "id": doc_id,
+                "user_id": user_id,
+                "text": body,
+                "text_preview": body[:200],
+                "meta": {"title": f"Rapat {d}"},
+                "created_at": created,
+            })
+            doc_ids.append((user_id, doc_id))
+    fake.seed_documents(rows)
+
+    tokens = []
+    with api.app.app_context():
+        api.share_db.require()
+        for i in range(min(args.share_tokens, len(doc_ids))):
+            user_id, doc_id = doc_ids[i * max(1, len(doc_ids) // max(1, args.share_tokens)) % len(doc_ids)]
+            token = uuid.uuid4().hex
+            api.db.session.add(api.ShareToken(token=token, document_id=doc_id, created_by=user_id))
+            tokens.append(token)
+        api.db.session.commit()
+
+    if args.manifest:
+        with open(args.manifest, "w") as f:
+            json.dump({"users": users, "share_tokens": tokens, "workdir": workdir}, f)
+
+    print(f"[bench.server] {len(rows)} documents, {len(tokens)} share tokens, workdir={workdir}", flush=True)
+    if args.mode == "asgi":
+        import uvicorn
+        uvicorn.run(asgi.app, host=args.host, port=args.port, log_level="warning")
+    else:
+        api.socketio.run(api.app, host=args.host, port=args.port, log_output=False, allow_unsafe_werkzeug=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Primitive konkurensi NOTAKU (eventlet / thread).
+
+Semua kode sinkron memakai helper ini, bukan eventlet langsung, agar modul yang sama bisa berjalan di
+bawah eventlet (default) maupun di thread pool mode ASGI. Modul ini harus di-import paling awal
+(sebelum flask, threading, dsb.): di mode eventlet ia menjalankan monkey_patch().
+"""
+import os
+# SERVER_MODE=asgi (lihat asgi.py): tanpa monkey-patch, I/O jalur panas berjalan async di uvicorn
+# dan kode sinkron sisanya memakai thread biasa (eventlet tidak di-import sama sekali).
+SERVER_MODE = os.getenv("SERVER_MODE", "eventlet").strip().lower()
+if SERVER_MODE != "asgi":
+    import eventlet
+    eventlet.monkey_patch()
+import threading
+import time
+
+if SERVER_MODE == "asgi":
+    import queue as _queue
+    from concurrent.futures import ThreadPoolExecutor
+
+    class _ThreadTask:
+        """Thread daemon dengan antarmuka mirip GreenThread (kill hanya menandai; thread tidak bisa dihentikan paksa)."""
+        def __init__(self, fn, args, kwargs):
+            self.killed = False
+            self._thread = threading.Thread(target=fn, args=args, kwargs=kwargs, daemon=True)
+            self._thread.start()
+
+        def kill(self):
+            self.killed = True
+
+        def wait(self, timeout=None):
+            self._thread.join(timeout)
+
+    def spawn(fn, *args, **kwargs):
+        return _ThreadTask(fn, args, kwargs)
+
+    sleep = time.sleep
+    WorkQueue = _queue.Queue
+    QueueEmpty = _queue.Empty
+    Semaphore = threading.Semaphore
+
+    def imap_pool(fn, items, size):
+        with ThreadPoolExecutor(max_workers=max(1, size), thread_name_prefix="notaku-map") as pool:
+            yield from pool.map(fn, items)
+else:
+    import eventlet.queue
+    import eventlet.semaphore
+
+    spawn = eventlet.spawn
+    sleep = eventlet.sleep
+    WorkQueue = eventlet.queue.LightQueue
+    QueueEmpty = eventlet.queue.Empty
+    Semaphore = eventlet.semaphore.Semaphore
+
+    def imap_pool(fn, items, size):
+        return eventlet.GreenPool(max(1, size)).imap(fn, items)
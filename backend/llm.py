@@ -0,0 +1,780 @@
+"""
+Jalur panggilan LLM NOTAKU: gateway admission control (konkurensi global + antrian round-robin per
+user), rate limiter RPM/TPM per route, dan router multi-model dengan hedging/failover.
+
+Modul ini tidak tahu soal Flask atau klien Groq: api.py membuat route dari klien yang dikonfigurasi
+(LLMRoute) lalu LLMRouter, sedangkan asgi.py memakai kebijakan yang sama (HedgeRace, llm_gateway)
+dari event loop.
+"""
+import itertools
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from threading import Event
+
+from concurrency import spawn, sleep, WorkQueue, QueueEmpty
+from metrics import metrics
+
+# =========================
+# LLM gateway (admission control)
+# =========================
+# Semua panggilan ke Groq lewat gateway ini: batas konkurensi global, antrian terbatas
+# yang dilayani bergiliran per user (round-robin), dan penolakan jelas saat antrian penuh.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_QUEUE_SIZE = int(os.getenv("LLM_QUEUE_SIZE", "32"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "60"))
+
+llm_gateway_wait_seconds = metrics.histogram(
+    "notaku_llm_gateway_wait_seconds", "Waktu tunggu antrian LLM gateway sebelum mendapat slot.")
+
+class LLMGatewayBusy(Exception):
+    """Antrian gateway penuh atau waktu tunggu habis; klien sebaiknya mencoba lagi nanti."""
+
+class _GatewayWaiter:
+    __slots__ = ("user", "event", "granted", "on_position", "on_grant", "last_position")
+
+    def __init__(self, user, on_position, on_grant=None):
+        self.user = user
+        self.event = Event()
+        self.granted = False
+        self.on_position = on_position
+        self.on_grant = on_grant  # dipanggil (di bawah lock) saat slot diberikan; mis. membangunkan coroutine
+        self.last_position = None
+
+class LLMGateway:
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiting = 0
+        self._queues = OrderedDict()  # {user: deque[_GatewayWaiter]} dalam urutan giliran
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.max_wait_seconds = 0.0
+
+    def is_full(self) -> bool:
+        with self._lock:
+            return self._active >= self.max_concurrency and self._waiting >= self.max_queue
+
+    def _positions_locked(self):
+        # Urutan layanan round-robin: satu waiter per user per putaran
+        queues = [list(q) for q in self._queues.values()]
+        order, depth = [], 0
+        while True:
+            row = [q[depth] for q in queues if len(q) > depth]
+            if not row:
+                break
+            order.extend(row)
+            depth += 1
+        return [(w, i + 1) for i, w in enumerate(order)]
+
+    def _notify(self, positions):
+        for w, pos in positions:
+            if w.on_position and w.last_position != pos:
+                w.last_position = pos
+                try:
+                    w.on_position(pos)
+                except Exception:
+                    pass
+
+    def enqueue(self, user: str, on_position=None, on_grant=None):
+        """
+        Masuk gateway tanpa memblokir: None jika slot langsung didapat, selain itu waiter yang
+        menunggu giliran (waiter.event / on_grant). LLMGatewayBusy jika antrian penuh.
+        """
+        user = user or "anonymous"
+        with self._lock:
+            if self._active < self.max_concurrency and self._waiting == 0:
+                self._active += 1
+                self.admitted += 1
+                llm_gateway_wait_seconds.observe(0.0)
+                return None
+            if self._waiting >= self.max_queue:
+                self.rejected += 1
+                raise LLMGatewayBusy("llm_queue_full")
+            waiter = _GatewayWaiter(user, on_position, on_grant)
+            self._queues.setdefault(user, deque()).append(waiter)
+            self._waiting += 1
+            self.queued += 1
+            positions = self._positions_locked()
+        self._notify(positions)
+        return waiter
+
+    def abandon(self, waiter, stopped: bool) -> bool:
+        """Keluarkan waiter dari antrian (dibatalkan / timeout). False jika slot sudah terlanjur diberikan."""
+        with self._lock:
+            if waiter.granted:
+                return False
+            q = self._queues.get(waiter.user)
+            if q is not None and waiter in q:
+                q.remove(waiter)
+                if not q:
+                    del self._queues[waiter.user]
+            self._waiting -= 1
+            if stopped:
+                self.cancelled += 1
+            else:
+                self.timeouts += 1
+            positions = self._positions_locked()
+        self._notify(positions)
+        return True
+
+    def record_wait(self, waited: float):
+        llm_gateway_wait_seconds.observe(waited)
+        with self._lock:
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def poll(self, waiter, started: float, stop_evt=None) -> bool:
+        """
+        Pemeriksaan berkala waiter yang menunggu giliran (acquire() dan asgi.gateway_slot): True jika slot
+        sudah diberikan, False jika harus terus menunggu, LLMGatewayBusy jika stop_evt di-set atau
+        queue_timeout lewat sejak started (waiter sudah dikeluarkan dari antrian).
+        """
+        if not waiter.granted:
+            stopped = stop_evt is not None and stop_evt.is_set()
+            timed_out = self.queue_timeout > 0 and time.time() - started >= self.queue_timeout
+            if not (stopped or timed_out):
+                return False
+            if self.abandon(waiter, stopped):
+                raise LLMGatewayBusy("llm_stream_cancelled" if stopped else "llm_queue_timeout")
+        self.record_wait(time.time() - started)
+        return True
+
+    def acquire(self, user: str, on_position=None, stop_evt=None):
+        waiter = self.enqueue(user, on_position)
+        if waiter is None:
+            return
+        started = time.time()
+        while not self.poll(waiter, started, stop_evt):
+            waiter.event.wait(0.25)
+
+    def try_acquire(self) -> bool:
+        """Slot tambahan tanpa menunggu (request hedge); False jika gateway penuh atau ada yang antri."""
+        with self._lock:
+            if self._active >= self.max_concurrency or self._waiting:
+                return False
+            self._active += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._active -= 1
+            waiter = None
+            while self._queues and waiter is None:
+                user, q = next(iter(self._queues.items()))
+                waiter = q.popleft()
+                if q:
+                    self._queues.move_to_end(user)  # user berikutnya mendapat giliran
+                else:
+                    del self._queues[user]
+            if waiter is not None:
+                waiter.granted = True
+                self._active += 1
+                self._waiting -= 1
+                self.admitted += 1
+                waiter.event.set()
+                if waiter.on_grant:
+                    waiter.on_grant()
+            positions = self._positions_locked()
+        self._notify(positions)
+
+    @contextmanager
+    def slot(self, user: str, on_position=None, stop_evt=None):
+        self.acquire(user, on_position=on_position, stop_evt=stop_evt)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active": self._active,
+                "waiting": self._waiting,
+                "users_waiting": len(self._queues),
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "admitted": self.admitted,
+                "queued": self.queued,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "cancelled": self.cancelled,
+                "max_wait_seconds": round(self.max_wait_seconds, 3),
+            }
+
+llm_gateway = LLMGateway(LLM_MAX_CONCURRENCY, LLM_QUEUE_SIZE, LLM_QUEUE_TIMEOUT)
+
+# =========================
+# LLM rate limiter (RPM/TPM)
+# =========================
+# Token bucket per route untuk request/menit dan token/menit: panggilan ke Groq dipacing sedikit di
+# bawah kuota alih-alih menabrak 429 beruntun. Kapasitas dari LLM_RPM/LLM_TPM (TPM otomatis dari header
+# x-ratelimit-limit-tokens bila tidak diisi). Header x-ratelimit-remaining-* dan retry-after di tiap
+# respons menyelaraskan bucket dengan hitungan server, termasuk pemakaian worker/proses lain.
+LLM_RPM = float(os.getenv("LLM_RPM", "0"))  # 0 = tanpa batas lokal
+LLM_TPM = float(os.getenv("LLM_TPM", "0"))  # 0 = ikuti x-ratelimit-limit-tokens dari Groq
+LLM_RATE_HEADROOM = float(os.getenv("LLM_RATE_HEADROOM", "0.9"))  # pakai 90% kuota
+LLM_EXPECTED_COMPLETION_TOKENS = int(os.getenv("LLM_EXPECTED_COMPLETION_TOKENS", "600"))
+LLM_RATE_MAX_WAIT = float(os.getenv("LLM_RATE_MAX_WAIT", "30"))  # lebih lama dari ini -> server_busy
+
+llm_rate_wait_seconds = metrics.histogram(
+    "notaku_llm_rate_limiter_wait_seconds", "Waktu tunggu pacing RPM/TPM sebelum panggilan Groq.", ("model",))
+
+def _parse_retry_after_seconds(message: str):
+    try:
+        m = re.search(r"in\s+(?:(\d+)m)?(\d+(?:\.\d+)?)s", message)
+        if not m:
+            return None
+        minutes = float(m.group(1)) if m.group(1) else 0.0
+        seconds = float(m.group(2))
+        return minutes * 60.0 + seconds
+    except Exception:
+        return None
+
+
+def _is_rate_limit_error(e: Exception) -> bool:
+    msg = str(e).lower()
+    return "rate limit" in msg or "rate_limit" in msg
+
+def _parse_reset_seconds(value):
+    """Durasi dari header Groq: "7.66s", "2m59.56s", "120ms", atau angka detik (retry-after)."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if not parts:
+        return None
+    scale = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+    return sum(float(amount) * scale[unit] for amount, unit in parts)
+
+def _header_float(headers, name: str):
+    try:
+        value = headers.get(name)
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+def _error_headers(e: Exception):
+    return getattr(getattr(e, "response", None), "headers", None) or {}
+
+def _retry_after_seconds(e: Exception):
+    """retry-after dari header respons 429, atau dari pesan error bila header tidak ada."""
+    return _parse_reset_seconds(_error_headers(e).get("retry-after")) or _parse_retry_after_seconds(str(e))
+
+class TokenBucket:
+    """Bucket dengan refill kontinu sebesar per_minute per 60 detik; per_minute <= 0 = tanpa batas."""
+    __slots__ = ("per_minute", "level", "updated")
+
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        if self.per_minute > 0:
+            self.level = min(self.per_minute, self.level + (now - self.updated) * self.per_minute / 60.0)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        if self.per_minute <= 0:
+            return 0.0
+        self._refill(now)
+        # Request yang lebih besar dari kapasitas tetap boleh lewat saat bucket penuh
+        amount = min(amount, self.per_minute)
+        return 0.0 if self.level >= amount else (amount - self.level) * 60.0 / self.per_minute
+
+    def take(self, amount: float):
+        if self.per_minute > 0:
+            self.level -= amount  # boleh negatif: kelebihan dibayar dengan menunggu refill
+
+    def resize(self, per_minute: float, now: float):
+        self._refill(now)
+        if self.per_minute <= 0:
+            self.level = per_minute
+        self.per_minute = per_minute
+        self.level = min(self.level, per_minute)
+
+class LLMRateLimiter:
+    def __init__(self, name: str, rpm: float, tpm: float, headroom: float):
+        self.name = name
+        self.headroom = max(0.1, min(1.0, headroom))
+        self.requests = TokenBucket(rpm * self.headroom)
+        self.tokens = TokenBucket(tpm * self.headroom)
+        self.tpm_from_headers = tpm <= 0
+        self.blocked_until = 0.0  # time.monotonic(); diisi dari retry-after / kuota request habis
+        self._lock = threading.Lock()
+        self.paced = 0
+        self.rejected = 0
+        self.throttled = 0
+        self.wait_seconds = 0.0
+        self.last_remaining = {}
+
+    def blocked(self) -> bool:
+        return time.monotonic() < self.blocked_until
+
+    def _wait_locked(self, tokens: float, now: float) -> float:
+        return max(self.blocked_until - now, self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+
+    def reserve(self, tokens: float, waited: float = 0.0) -> float:
+        """
+        Pesan kuota untuk satu request berukuran kira-kira `tokens` bila tersedia (0.0); selain itu
+        kembalikan detik yang perlu ditunggu. LLMGatewayBusy jika total tunggu (waited + sisa)
+        akan melewati LLM_RATE_MAX_WAIT. Tidak memblokir, jadi dipakai juga oleh jalur async.
+        """
+        with self._lock:
+            wait = self._wait_locked(tokens, time.monotonic())
+            if wait <= 0:
+                self.requests.take(1)
+                self.tokens.take(tokens)
+                return 0.0
+            if LLM_RATE_MAX_WAIT > 0 and waited + wait > LLM_RATE_MAX_WAIT:
+                self.rejected += 1
+                raise LLMGatewayBusy("llm_rate_limited")
+            return wait
+
+    def record_wait(self, waited: float):
+        llm_rate_wait_seconds.observe(waited, model=self.name)
+        if waited > 0.01:
+            with self._lock:
+                self.paced += 1
+                self.wait_seconds += waited
+
+    def acquire(self, tokens: float) -> float:
+        """Tunggu (kooperatif) sampai reserve() berhasil."""
+        started = time.monotonic()
+        while True:
+            wait = self.reserve(tokens, time.monotonic() - started)
+            if wait <= 0:
+                break
+            sleep(min(wait, 0.25))
+        self.record_wait(time.monotonic() - started)
+        return tokens
+
+    def settle(self, reserved: float, actual: float):
+        """Koreksi pesanan dengan usage sebenarnya dari respons."""
+        if actual:
+            with self._lock:
+                self.tokens.take(actual - reserved)
+
+    def update(self, headers):
+        """Selaraskan bucket dengan header x-ratelimit-* / retry-after dari Groq."""
+        if not headers:
+            return
+        now = time.monotonic()
+        limit_tokens = _header_float(headers, "x-ratelimit-limit-tokens")
+        remaining_tokens = _header_float(headers, "x-ratelimit-remaining-tokens")
+        remaining_requests = _header_float(headers, "x-ratelimit-remaining-requests")
+        with self._lock:
+            if limit_tokens and self.tpm_from_headers:
+                self.tokens.resize(limit_tokens * self.headroom, now)
+            if remaining_tokens is not None and self.tokens.per_minute > 0:
+                # Sisakan (1 - headroom) dari kuota server sebagai cadangan
+                reserve = (limit_tokens or 0) * (1.0 - self.headroom)
+                self.tokens._refill(now)
+                self.tokens.level = min(self.tokens.level, remaining_tokens - reserve)
+            if remaining_requests is not None and remaining_requests < 1:
+                reset = _parse_reset_seconds(headers.get("x-ratelimit-reset-requests"))
+                if reset:
+                    self.blocked_until = max(self.blocked_until, now + reset)
+            retry_after = _parse_reset_seconds(headers.get("retry-after"))
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+            self.last_remaining = {"requests": remaining_requests, "tokens": remaining_tokens}
+
+    def penalize(self, e: Exception):
+        """429 dari Groq: tahan semua panggilan ke route ini sampai retry-after lewat."""
+        self.update(_error_headers(e))
+        retry_after = _retry_after_seconds(e) or 1.0
+        with self._lock:
+            self.throttled += 1
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            self.requests._refill(now)
+            self.tokens._refill(now)
+            return {
+                "rpm": round(self.requests.per_minute, 1),
+                "tpm": round(self.tokens.per_minute, 1),
+                "requests_available": round(self.requests.level, 1) if self.requests.per_minute > 0 else None,
+                "tokens_available": round(self.tokens.level) if self.tokens.per_minute > 0 else None,
+                "blocked_for_seconds": round(max(0.0, self.blocked_until - now), 2),
+                "server_remaining": self.last_remaining,
+                "paced": self.paced,
+                "wait_seconds": round(self.wait_seconds, 2),
+                "throttled": self.throttled,
+                "rejected": self.rejected,
+            }
+
+
+def _rate_limited_create(route, tokens: float, **kwargs):
+    """chat.completions.create untuk satu route lewat limiter-nya; header respons mengkalibrasi bucket."""
+    route.limiter.acquire(tokens)
+    completions = route.client.chat.completions
+    raw_api = getattr(completions, "with_raw_response", None)
+    try:
+        if raw_api is None:
+            return completions.create(model=route.model, **kwargs)
+        raw = raw_api.create(model=route.model, **kwargs)
+        route.limiter.update(raw.headers)
+        return raw.parse()
+    except Exception as e:
+        if _is_rate_limit_error(e):
+            route.limiter.penalize(e)
+        raise
+
+
+# =========================
+# LLM router (multi-model + hedging)
+# =========================
+# Daftar model/endpoint berurutan, mis. LLM_ROUTES="llama-3.1-8b-instant,llama-3.3-70b-versatile@https://api.groq.com".
+# Stream yang belum memberi token pertama setelah LLM_HEDGE_TTFT_MS memicu request cadangan ke route
+# berikutnya; yang lebih dulu menjawab dipakai, yang kalah dibatalkan. Route yang sedang lambat atau
+# sering gagal (statistik beberapa detik terakhir) diturunkan ke akhir urutan.
+LLM_ROUTES = os.getenv("LLM_ROUTES", "")
+LLM_HEDGE_TTFT_MS = float(os.getenv("LLM_HEDGE_TTFT_MS", "1500"))
+LLM_HEDGE_COMPLETE_MS = float(os.getenv("LLM_HEDGE_COMPLETE_MS", "0"))  # 0 = non-streaming hanya failover
+LLM_HEDGE_MIN_MS = float(os.getenv("LLM_HEDGE_MIN_MS", "250"))
+LLM_HEDGE_MAX = int(os.getenv("LLM_HEDGE_MAX", "1"))
+LLM_ROUTE_WINDOW_SECONDS = float(os.getenv("LLM_ROUTE_WINDOW_SECONDS", "120"))
+LLM_ROUTE_MAX_ERRORS = int(os.getenv("LLM_ROUTE_MAX_ERRORS", "3"))
+LLM_ROUTE_COOLDOWN_SECONDS = float(os.getenv("LLM_ROUTE_COOLDOWN_SECONDS", "30"))
+
+llm_hedges = metrics.counter(
+    "notaku_llm_hedged_requests_total", "Request cadangan yang dimulai karena route utama lambat.", ("kind",))
+llm_route_wins = metrics.counter(
+    "notaku_llm_route_wins_total", "Route yang jawabannya dipakai.", ("model", "kind"))
+llm_route_errors = metrics.counter(
+    "notaku_llm_route_errors_total", "Kegagalan panggilan per route.", ("model", "kind"))
+
+def _percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100.0 * len(ordered)))]
+
+class LLMRoute:
+    """Satu model di satu endpoint, dengan statistik latency terbaru per jenis panggilan."""
+
+    def __init__(self, name: str, model: str, llm_client):
+        self.name = name
+        self.model = model
+        self.client = llm_client
+        self.limiter = LLMRateLimiter(name, LLM_RPM, LLM_TPM, LLM_RATE_HEADROOM)
+        self._lock = threading.Lock()
+        self._samples = {"stream": deque(maxlen=200), "complete": deque(maxlen=200)}  # (ts, detik)
+        self.consecutive_errors = 0
+        self.last_error_at = 0.0
+        self.wins = 0
+        self.errors = 0
+
+    def record(self, kind: str, seconds: float):
+        with self._lock:
+            self._samples[kind].append((time.time(), seconds))
+
+    def record_success(self, kind: str, seconds: float):
+        self.record(kind, seconds)
+        with self._lock:
+            self.consecutive_errors = 0
+            self.wins += 1
+
+    def record_error(self, kind: str):
+        with self._lock:
+            self.consecutive_errors += 1
+            self.last_error_at = time.time()
+            self.errors += 1
+
+    def recent(self, kind: str):
+        cutoff = time.time() - LLM_ROUTE_WINDOW_SECONDS
+        with self._lock:
+            return [s for ts, s in self._samples[kind] if ts >= cutoff]
+
+    def is_failing(self) -> bool:
+        return (
+            self.consecutive_errors >= LLM_ROUTE_MAX_ERRORS
+            and time.time() - self.last_error_at < LLM_ROUTE_COOLDOWN_SECONDS
+        )
+
+    def is_slow(self, kind: str, deadline: float) -> bool:
+        samples = self.recent(kind)
+        return deadline > 0 and len(samples) >= 3 and _percentile(samples, 50) > deadline
+
+    def stats(self):
+        out = {
+            "model": self.model,
+            "wins": self.wins,
+            "errors": self.errors,
+            "consecutive_errors": self.consecutive_errors,
+            "failing": self.is_failing(),
+            "rate_limit": self.limiter.stats(),
+        }
+        for kind in self._samples:
+            samples = self.recent(kind)
+            out[kind] = {
+                "samples": len(samples),
+                "p50_ms": round(_percentile(samples, 50) * 1000, 1) if samples else None,
+                "p95_ms": round(_percentile(samples, 95) * 1000, 1) if samples else None,
+            }
+        return out
+
+class HedgeRace:
+    """
+    Kebijakan satu race antar route tanpa I/O: urutan route, kapan hedge dan failover dimulai, slot
+    gateway untuk hedge, dan statistik route. LLMRouter._race (green thread / thread) dan
+    asgi.stream_race (asyncio) hanya menjalankan route yang diminta lalu melaporkan hasilnya.
+    Tiap hedge mengambil slot gateway tambahan tanpa menunggu (dilewati bila penuh); finish() melepasnya.
+    """
+
+    def __init__(self, router, kind: str):
+        self.router = router
+        self.kind = kind
+        self.pending = router.ranked(kind)
+        if not self.pending:
+            raise RuntimeError("llm_no_routes")
+        self.started = {}  # {route.name: (route, perf_counter saat mulai)} yang masih berjalan
+        self.hedges = 0
+        self.hedge_slots = 0
+        self.hedge_at = None
+        self.last_error = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self.started)
+
+    def launch(self) -> LLMRoute:
+        """Ambil route berikutnya untuk dijalankan dan jadwalkan hedge setelahnya."""
+        route = self.pending.pop(0)
+        now = time.perf_counter()
+        self.started[route.name] = (route, now)
+        delay = self.router.hedge_delay(self.kind, route)
+        self.hedge_at = now + delay if delay > 0 and self.hedges < self.router.hedge_max else None
+        return route
+
+    def wait_timeout(self) -> float:
+        """Berapa lama pemanggil boleh menunggu hasil sebelum memanggil on_idle()."""
+        if self.hedge_at is None:
+            return 0.1
+        return max(0.0, min(0.1, self.hedge_at - time.perf_counter()))
+
+    def on_idle(self):
+        """Tidak ada hasil dalam wait_timeout(): route hedge yang harus dimulai sekarang, atau None."""
+        if self.hedge_at is None or time.perf_counter() < self.hedge_at:
+            return None
+        self.hedge_at = None
+        if not self.pending or self.hedges >= self.router.hedge_max:
+            return None
+        if not self.router.gateway.try_acquire():
+            self.router.hedges_skipped += 1
+            return None
+        self.hedges += 1
+        self.hedge_slots += 1
+        self.router.hedged += 1
+        llm_hedges.inc(kind=self.kind)
+        return self.launch()
+
+    def succeeded(self, route: LLMRoute):
+        _, started = self.started.pop(route.name)
+        route.record_success(self.kind, time.perf_counter() - started)
+        llm_route_wins.inc(model=route.name, kind=self.kind)
+
+    def failed(self, route: LLMRoute, error):
+        self.started.pop(route.name, None)
+        if not isinstance(error, LLMGatewayBusy):  # menunggu kuota bukan kegagalan route
+            route.record_error(self.kind)
+            llm_route_errors.inc(model=route.name, kind=self.kind)
+        self.last_error = error
+
+    def failover(self):
+        """Semua yang berjalan sudah gagal: route berikutnya untuk langsung dijalankan, atau None."""
+        if self.started or not self.pending:
+            return None
+        self.router.failovers += 1
+        return self.launch()
+
+    def finish(self):
+        """Race selesai (menang, gagal, atau dihentikan): route yang masih berjalan dianggap dibatalkan."""
+        now = time.perf_counter()
+        for route, started in self.started.values():
+            # Sampel tersensor: route ini setidaknya selambat ini
+            route.record(self.kind, now - started)
+        self.started.clear()
+        for _ in range(self.hedge_slots):
+            self.router.gateway.release()
+        self.hedge_slots = 0
+
+class LLMRouter:
+    def __init__(self, routes, hedge_ttft_ms: float, hedge_complete_ms: float, hedge_max: int, gateway,
+                 estimate_tokens):
+        self.routes = list(routes)
+        self.gateway = gateway  # slot tambahan untuk hedge diambil dari sini
+        self.estimate_tokens = estimate_tokens  # prompt -> perkiraan token request (untuk limiter)
+        self.deadlines = {"stream": hedge_ttft_ms / 1000.0, "complete": hedge_complete_ms / 1000.0}
+        self.hedge_max = max(0, hedge_max)
+        self.hedged = 0
+        self.hedges_skipped = 0  # hedge batal karena gateway tidak punya slot kosong
+        self.failovers = 0
+
+    def ranked(self, kind: str):
+        """Urutan konfigurasi, tetapi route yang gagal beruntun, kena retry-after, atau lambat dipindah ke belakang."""
+        deadline = self.deadlines[kind]
+        return sorted(self.routes, key=lambda r: (r.is_failing(), r.limiter.blocked(), r.is_slow(kind, deadline)))
+
+    def hedge_delay(self, kind: str, route: LLMRoute) -> float:
+        """Tunggu sampai p95 TTFT route utama (dibatasi konfigurasi) sebelum request cadangan."""
+        deadline = self.deadlines[kind]
+        if deadline <= 0:
+            return 0.0
+        samples = route.recent(kind)
+        if len(samples) >= 20:
+            return min(deadline, max(LLM_HEDGE_MIN_MS / 1000.0, _percentile(samples, 95)))
+        return deadline
+
+    def _race(self, kind: str, start, discard, stop_evt=None):
+        """
+        Jalankan start(route) di green thread (thread di mode ASGI) menurut kebijakan HedgeRace.
+        Kembalikan (route, hasil) pertama yang sukses, batalkan sisanya; (None, None) jika stop_evt
+        di-set sebelum ada pemenang. Pemanggil sudah memegang satu slot gateway.
+        """
+        race = HedgeRace(self, kind)
+        results = WorkQueue()
+        threads = {}  # {route.name: greenthread}
+        # Thread (mode ASGI) tidak bisa di-kill: hasil yang datang setelah race selesai dibuang di sini
+        finished = [False]
+        finish_lock = threading.Lock()
+
+        def launch(route):
+            def run():
+                try:
+                    item = (route, start(route), None)
+                except Exception as e:
+                    item = (route, None, e)
+                with finish_lock:
+                    late = finished[0]
+                    if not late:
+                        results.put(item)
+                if late and item[1] is not None:
+                    discard(item[1])
+
+            threads[route.name] = spawn(run)
+
+        def cancel_all():
+            with finish_lock:
+                finished[0] = True
+            for thread in threads.values():
+                thread.kill()
+            threads.clear()
+            while not results.empty():
+                _, result, _ = results.get_nowait()
+                if result is not None:
+                    discard(result)
+
+        launch(race.launch())
+        try:
+            while race.running:
+                try:
+                    route, result, error = results.get(timeout=race.wait_timeout())
+                except QueueEmpty:
+                    if stop_evt is not None and stop_evt.is_set():
+                        return None, None
+                    hedge = race.on_idle()
+                    if hedge is not None:
+                        launch(hedge)
+                    continue
+                threads.pop(route.name, None)
+                if error is None:
+                    race.succeeded(route)
+                    return route, result
+                race.failed(route, error)
+                failover = race.failover()
+                if failover is not None:
+                    launch(failover)
+            raise race.last_error
+        finally:
+            cancel_all()
+            race.finish()
+
+    def complete(self, prompt: str, stop_evt=None, temperature: float = 0.3):
+        """Panggilan non-streaming; kembalikan (route, response)."""
+        tokens = self.estimate_tokens(prompt)
+
+        def start(route):
+            resp = _rate_limited_create(
+                route, tokens,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=temperature,
+            )
+            route.limiter.settle(tokens, getattr(getattr(resp, "usage", None), "total_tokens", 0) or 0)
+            return resp
+
+        return self._race("complete", start, lambda resp: None, stop_evt)
+
+    def stream(self, prompt: str, stop_evt=None, temperature: float = 0.3, tokens: float = None):
+        """
+        Buka stream dan tunggu token pertama di route pemenang. Kembalikan (route, response, chunks)
+        dengan chunks = iterator chunk yang dimulai dari chunk yang sudah terbaca. Usage di chunk
+        terakhir dikoreksi ke limiter route oleh pembaca stream (StreamCollector).
+        """
+        tokens = self.estimate_tokens(prompt) if tokens is None else tokens
+
+        def start(route):
+            response = _rate_limited_create(
+                route, tokens,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=temperature,
+                stream=True,
+            )
+            rest, head = iter(response), []
+            try:
+                for chunk in rest:
+                    head.append(chunk)
+                    if _chunk_content(chunk):
+                        break
+            except BaseException:
+                _close_stream(response)
+                raise
+            return response, itertools.chain(head, rest)
+
+        route, result = self._race("stream", start, lambda res: _close_stream(res[0]), stop_evt)
+        if route is None:
+            return None, None, iter(())
+        return route, result[0], result[1]
+
+    def stats(self):
+        return {
+            "routes": [r.stats() for r in self.routes],
+            "ranked_stream": [r.name for r in self.ranked("stream")],
+            "hedge_ttft_ms": self.deadlines["stream"] * 1000,
+            "hedge_complete_ms": self.deadlines["complete"] * 1000,
+            "hedged": self.hedged,
+            "hedges_skipped": self.hedges_skipped,
+            "failovers": self.failovers,
+        }
+
+def _chunk_content(chunk):
+    try:
+        choice = chunk.choices[0]
+    except Exception:
+        return None
+    piece = None
+    if hasattr(choice, "delta"):
+        piece = getattr(choice.delta, "content", None)
+    if not piece and hasattr(choice, "message"):
+        piece = getattr(choice.message, "content", None)
+    return piece
+
+def _close_stream(response):
+    try:
+        response.close()
+    except Exception:
+        pass
@@ -0,0 +1,235 @@
+"""
+Save outbox (write-ahead) NOTAKU.
+
+/save menulis ke antrian SQLite lokal (di samping share_tokens.db) lalu langsung kembali. Flusher
+background mengirim ke Supabase per batch dengan retry + backoff. Insert memakai ON CONFLICT DO NOTHING
+pada id sehingga pengiriman ulang aman (at-least-once).
+"""
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from threading import Event
+
+from concurrency import sleep
+from llm import _is_rate_limit_error
+from metrics import metrics
+
+SAVE_OUTBOX_ENABLED = os.getenv("SAVE_OUTBOX_ENABLED", "true").strip().lower() == "true"
+OUTBOX_FLUSH_SECONDS = float(os.getenv("OUTBOX_FLUSH_SECONDS", "1"))
+OUTBOX_BATCH = int(os.getenv("OUTBOX_BATCH", "100"))
+OUTBOX_RETRY_BASE = float(os.getenv("OUTBOX_RETRY_BASE", "2"))
+OUTBOX_RETRY_MAX = float(os.getenv("OUTBOX_RETRY_MAX", "300"))
+# Baris yang ditolak Supabase (meta rusak, constraint, terlalu besar) sebanyak ini dipindah ke status dead
+OUTBOX_MAX_REJECTIONS = int(os.getenv("OUTBOX_MAX_REJECTIONS", "5"))
+# Saat batch gagal dan beberapa baris pertama juga gagal sendiri-sendiri tanpa tanda Supabase hidup,
+# anggap outage: sisa batch hanya di-backoff, tidak dicoba satu per satu
+OUTBOX_OUTAGE_PROBE_ROWS = int(os.getenv("OUTBOX_OUTAGE_PROBE_ROWS", "3"))
+# Id yang sudah terkirim diingat selama ini: retry /save dengan idempotency key yang sama setelah flush
+# tetap dilaporkan duplicate (tanpa menjalankan hook dokumen lagi)
+OUTBOX_SENT_TTL = float(os.getenv("OUTBOX_SENT_TTL", str(24 * 3600)))
+
+class SaveOutbox:
+    """
+    Antrian baris `documents` di SQLite. client() mengembalikan klien Supabase saat flush (None/falsy =
+    belum bisa mengirim; dipanggil tiap flush agar klien yang diganti tetap terpakai). on_sent(rows)
+    dipanggil setelah baris terkirim dan dihapus dari antrian.
+    """
+
+    def __init__(self, db_path: str, client, on_sent=None):
+        self._client = client
+        self._on_sent = on_sent
+        self._lock = threading.Lock()
+        self._wake = Event()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                row_json TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL DEFAULT 0,
+                last_error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS outbox_user_created_idx ON outbox(user_id, created_at DESC);
+            CREATE INDEX IF NOT EXISTS outbox_next_attempt_idx ON outbox(next_attempt_at);
+            CREATE TABLE IF NOT EXISTS outbox_sent (
+                id TEXT PRIMARY KEY,
+                sent_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS outbox_sent_at_idx ON outbox_sent(sent_at);
+        """)
+        # Kolom dead-letter untuk outbox.db lama
+        columns = {r[1] for r in self._db.execute("PRAGMA table_info(outbox)")}
+        if "rejections" not in columns:
+            self._db.execute("ALTER TABLE outbox ADD COLUMN rejections INTEGER NOT NULL DEFAULT 0")
+        if "dead" not in columns:
+            self._db.execute("ALTER TABLE outbox ADD COLUMN dead INTEGER NOT NULL DEFAULT 0")
+        self._db.commit()
+        self.flushed = 0
+        self.failures = 0
+        self.row_retries = 0
+        self.dead_lettered = 0
+
+    def enqueue(self, row: dict) -> bool:
+        """Simpan baris secara durable. False jika id yang sama masih menunggu atau baru saja terkirim."""
+        with self._lock:
+            sent = self._db.execute(
+                "SELECT 1 FROM outbox_sent WHERE id = ? AND sent_at >= ?", (row["id"], time.time() - OUTBOX_SENT_TTL)
+            ).fetchone()
+            if sent:
+                return False
+            cur = self._db.execute(
+                "INSERT OR IGNORE INTO outbox (id, user_id, created_at, row_json) VALUES (?, ?, ?, ?)",
+                (row["id"], row["user_id"], row["created_at"], json.dumps(row, ensure_ascii=False)),
+            )
+            self._db.commit()
+            inserted = cur.rowcount == 1
+        if inserted:
+            self._wake.set()
+        return inserted
+
+    def pending_for_user(self, user_id: str, limit: int = 200):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT row_json FROM outbox WHERE user_id = ? ORDER BY created_at DESC, id DESC LIMIT ?",
+                (user_id, limit),
+            ).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def get(self, doc_id: str):
+        with self._lock:
+            row = self._db.execute("SELECT row_json FROM outbox WHERE id = ?", (doc_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _due_batch(self):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, row_json, attempts, rejections FROM outbox WHERE dead = 0 AND next_attempt_at <= ? "
+                "ORDER BY created_at LIMIT ?",
+                (time.time(), OUTBOX_BATCH),
+            ).fetchall()
+        return [(r[0], json.loads(r[1]), r[2], r[3]) for r in rows]
+
+    def _upsert(self, rows):
+        self._client().table("documents").upsert(rows, on_conflict="id", ignore_duplicates=True).execute()
+
+    @staticmethod
+    def _is_rejection(e) -> bool:
+        """Error dari PostgREST (punya kode, mis. 23505/22P02/PGRST...) = baris ditolak, bukan outage."""
+        return bool(getattr(e, "code", None)) and not _is_rate_limit_error(e)
+
+    def _mark_failed(self, entries, error, rejected: bool):
+        """Backoff baris yang gagal; baris yang ditolak berulang kali dipindah ke status dead."""
+        now = time.time()
+        dead = []
+        with self._lock:
+            for doc_id, row, attempts, rejections in entries:
+                rejections += 1 if rejected else 0
+                is_dead = rejected and rejections >= OUTBOX_MAX_REJECTIONS
+                delay = min(OUTBOX_RETRY_MAX, OUTBOX_RETRY_BASE * (2 ** attempts))
+                delay *= 0.5 + random.random() / 2  # jitter agar retry tidak serempak
+                self._db.execute(
+                    "UPDATE outbox SET attempts = attempts + 1, rejections = ?, dead = ?, next_attempt_at = ?, "
+                    "last_error = ? WHERE id = ?",
+                    (rejections, 1 if is_dead else 0, now + delay, str(error)[:500], doc_id),
+                )
+                if is_dead:
+                    dead.append((doc_id, row["user_id"]))
+            self._db.commit()
+        if dead:
+            self.dead_lettered += len(dead)
+            outbox_dead_lettered.inc(len(dead))
+            # Detail per baris hanya ke log server; /api/outbox/stats cukup memuat jumlahnya
+            for doc_id, user_id in dead:
+                print(f"[WARN] Outbox: row {doc_id} (user {user_id}) moved to dead-letter: {error}")
+
+    def _delete(self, entries):
+        """Hapus baris yang terkirim dan catat id-nya di ledger outbox_sent (dibuang setelah OUTBOX_SENT_TTL)."""
+        now = time.time()
+        with self._lock:
+            self._db.executemany("DELETE FROM outbox WHERE id = ?", [(e[0],) for e in entries])
+            self._db.executemany("INSERT OR REPLACE INTO outbox_sent (id, sent_at) VALUES (?, ?)",
+                                 [(e[0], now) for e in entries])
+            self._db.execute("DELETE FROM outbox_sent WHERE sent_at < ?", (now - OUTBOX_SENT_TTL,))
+            self._db.commit()
+
+    def flush_once(self) -> int:
+        batch = self._due_batch()
+        if not batch or not self._client():
+            return 0
+        try:
+            self._upsert([row for _, row, _, _ in batch])
+            sent = batch
+        except Exception as e:
+            self.failures += 1
+            print(f"[WARN] Outbox flush failed ({len(batch)} rows): {e}")
+            # Satu baris yang ditolak tidak boleh menahan baris lain: coba satu per satu
+            sent = self._flush_rows(batch, e)
+        if sent:
+            self._delete(sent)
+            self.flushed += len(sent)
+            outbox_flushed_rows.inc(len(sent))
+            if self._on_sent:
+                self._on_sent([row for _, row, _, _ in sent])
+        return len(sent)
+
+    def _flush_rows(self, batch, batch_error):
+        sent, failed = [], []
+        if len(batch) == 1:
+            self._mark_failed(batch, batch_error, self._is_rejection(batch_error))
+            return sent
+        for i, entry in enumerate(batch):
+            if i >= OUTBOX_OUTAGE_PROBE_ROWS and not sent and not any(rejected for _, _, rejected in failed):
+                # Tidak ada satu pun yang masuk atau ditolak eksplisit: kemungkinan Supabase down
+                self._mark_failed(batch[i:], batch_error, rejected=False)
+                break
+            self.row_retries += 1
+            try:
+                self._upsert([entry[1]])
+                sent.append(entry)
+            except Exception as e:
+                failed.append((entry, e, self._is_rejection(e)))
+        for entry, e, rejected in failed:
+            # Baris lain di ronde yang sama berhasil: Supabase hidup, kegagalan ini milik barisnya sendiri
+            self._mark_failed([entry], e, rejected or bool(sent))
+        return sent
+
+    def run(self):
+        while True:
+            self._wake.wait(OUTBOX_FLUSH_SECONDS)
+            self._wake.clear()
+            try:
+                # Kuras selama masih ada batch penuh yang jatuh tempo
+                while self.flush_once() >= OUTBOX_BATCH:
+                    sleep(0)
+            except Exception as e:
+                print(f"[WARN] Outbox flusher error: {e}")
+
+    def stats(self):
+        with self._lock:
+            count, oldest, retrying = self._db.execute(
+                "SELECT COUNT(*), MIN(created_at), SUM(CASE WHEN attempts > 0 THEN 1 ELSE 0 END) FROM outbox "
+                "WHERE dead = 0"
+            ).fetchone()
+            dead_count, oldest_dead = self._db.execute(
+                "SELECT COUNT(*), MIN(created_at) FROM outbox WHERE dead = 1").fetchone()
+        return {
+            "pending": count,
+            "oldest_pending": oldest,
+            "retrying": retrying or 0,
+            "flushed": self.flushed,
+            "flush_failures": self.failures,
+            "row_retries": self.row_retries,
+            "dead": dead_count,
+            "oldest_dead": oldest_dead,
+        }
+
+outbox_flushed_rows = metrics.counter("notaku_outbox_flushed_rows_total", "Baris outbox yang terkirim ke Supabase.")
+outbox_dead_lettered = metrics.counter(
+    "notaku_outbox_dead_lettered_total", "Baris outbox yang ditolak berulang kali dan dipindah ke dead-letter.")
@@ -0,0 +1,172 @@
+"""
+Index pencarian full-text (SQLite FTS5) NOTAKU.
+
+Index lokal yang mencerminkan tabel `documents` di Supabase. Diperbarui per /save, dan di-backfill per
+user saat pertama kali mencari (atau massal saat start); backfill dan rute /api/search ada di api.py.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+SEARCH_INDEX_ENABLED = os.getenv("SEARCH_INDEX_ENABLED", "true").strip().lower() == "true"
+SEARCH_BACKFILL_ON_START = os.getenv("SEARCH_BACKFILL_ON_START", "false").strip().lower() == "true"
+SEARCH_BACKFILL_BATCH = int(os.getenv("SEARCH_BACKFILL_BATCH", "500"))
+# Backfill per user diulang (di background) setelah selang ini agar dokumen yang dihapus ikut hilang dari index
+SEARCH_RECONCILE_SECONDS = float(os.getenv("SEARCH_RECONCILE_SECONDS", "3600"))
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "20"))
+SEARCH_MAX_PAGE_SIZE = int(os.getenv("SEARCH_MAX_PAGE_SIZE", "100"))
+_SEARCH_TERM = re.compile(r"\w+", re.UNICODE)
+
+class SearchIndex:
+    def __init__(self, db_path: str):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(
+                doc_id UNINDEXED, owner, created_at UNINDEXED, text, meta,
+                tokenize = 'unicode61 remove_diacritics 2'
+            );
+            CREATE TABLE IF NOT EXISTS search_docs (
+                doc_id TEXT PRIMARY KEY,
+                fts_rowid INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS search_users (
+                user_id TEXT PRIMARY KEY,
+                backfilled_at TEXT NOT NULL
+            );
+        """)
+        self._db.commit()
+
+    @staticmethod
+    def _phrase(value: str) -> str:
+        return '"' + str(value).replace('"', '""') + '"'
+
+    def _upsert_locked(self, doc: dict):
+        doc_id = str(doc.get("id"))
+        row = self._db.execute("SELECT fts_rowid FROM search_docs WHERE doc_id = ?", (doc_id,)).fetchone()
+        if row:
+            self._db.execute("DELETE FROM search_fts WHERE rowid = ?", (row[0],))
+        meta = doc.get("meta")
+        cur = self._db.execute(
+            "INSERT INTO search_fts (doc_id, owner, created_at, text, meta) VALUES (?, ?, ?, ?, ?)",
+            (
+                doc_id,
+                str(doc.get("user_id") or ""),
+                str(doc.get("created_at") or ""),
+                doc.get("text") or "",
+                json.dumps(meta, ensure_ascii=False) if meta else "",
+            ),
+        )
+        self._db.execute(
+            "INSERT OR REPLACE INTO search_docs (doc_id, fts_rowid) VALUES (?, ?)", (doc_id, cur.lastrowid)
+        )
+
+    def index_documents(self, docs):
+        """Tambah/perbarui banyak dokumen dalam satu transaksi."""
+        with self._lock:
+            try:
+                for doc in docs:
+                    if doc.get("id"):
+                        self._upsert_locked(doc)
+                self._db.commit()
+            except Exception:
+                self._db.rollback()
+                raise
+
+    def remove_document(self, doc_id: str):
+        with self._lock:
+            row = self._db.execute("SELECT fts_rowid FROM search_docs WHERE doc_id = ?", (doc_id,)).fetchone()
+            if row:
+                self._db.execute("DELETE FROM search_fts WHERE rowid = ?", (row[0],))
+                self._db.execute("DELETE FROM search_docs WHERE doc_id = ?", (doc_id,))
+                self._db.commit()
+
+    def prune(self, keep_ids, user_id: str = None, created_until: str = None, keep=None) -> int:
+        """
+        Hapus dokumen index yang tidak ada di keep_ids (sudah dihapus di sumber). Hanya dokumen milik
+        user_id (bila diisi) dengan created_at <= created_until; keep(doc_id) bisa menahan dokumen lain.
+        """
+        sql = "SELECT d.doc_id, d.fts_rowid FROM search_docs d JOIN search_fts f ON f.rowid = d.fts_rowid"
+        conds, params = [], []
+        if user_id:
+            conds.append("f.owner = ?")
+            params.append(user_id)
+        if created_until:
+            conds.append("f.created_at <= ?")
+            params.append(created_until)
+        if conds:
+            sql += " WHERE " + " AND ".join(conds)
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        stale = [(doc_id, rowid) for doc_id, rowid in rows
+                 if doc_id not in keep_ids and (keep is None or not keep(doc_id))]
+        if not stale:
+            return 0
+        with self._lock:
+            try:
+                for doc_id, rowid in stale:
+                    self._db.execute("DELETE FROM search_fts WHERE rowid = ?", (rowid,))
+                    self._db.execute("DELETE FROM search_docs WHERE doc_id = ?", (doc_id,))
+                self._db.commit()
+            except Exception:
+                self._db.rollback()
+                raise
+        return len(stale)
+
+    def is_user_backfilled(self, user_id: str, max_age: float = None) -> bool:
+        """Sudah pernah di-backfill (dan, bila max_age diisi, tidak lebih lama dari max_age detik)."""
+        sql, params = "SELECT 1 FROM search_users WHERE user_id = ?", [user_id]
+        if max_age:
+            sql += " AND backfilled_at >= ?"
+            params.append((datetime.utcnow() - timedelta(seconds=max_age)).isoformat() + "Z")
+        with self._lock:
+            return self._db.execute(sql, params).fetchone() is not None
+
+    def mark_user_backfilled(self, user_id: str):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO search_users (user_id, backfilled_at) VALUES (?, ?)", (user_id, datetime.utcnow().isoformat() + "Z")
+            )
+            self._db.commit()
+
+    def build_query(self, q: str):
+        terms = _SEARCH_TERM.findall(q or "")
+        if not terms:
+            return None
+        # Semua kata harus ada; kata terakhir dicocokkan sebagai prefix (search-as-you-type)
+        parts = [self._phrase(t) for t in terms[:-1]] + [self._phrase(terms[-1]) + "*"]
+        return "(" + " AND ".join(parts) + ")"
+
+    def search(self, user_id: str, q: str, limit: int, offset: int = 0):
+        match = self.build_query(q)
+        if not match:
+            return []
+        match = f"owner : {self._phrase(user_id)} AND {match}"
+        with self._lock:
+            rows = self._db.execute(
+                """
+                SELECT doc_id, created_at,
+                       snippet(search_fts, 3, '**', '**', '…', 16),
+                       bm25(search_fts, 0.0, 0.0, 0.0, 1.0, 0.5) AS score
+                FROM search_fts
+                WHERE search_fts MATCH ?
+                ORDER BY score
+                LIMIT ? OFFSET ?
+                """,
+                (match, limit, offset),
+            ).fetchall()
+        return [
+            {"id": r[0], "created_at": r[1], "snippet": r[2], "score": round(-r[3], 4)}
+            for r in rows
+        ]
+
+    def stats(self):
+        with self._lock:
+            docs = self._db.execute("SELECT COUNT(*) FROM search_docs").fetchone()[0]
+            users = self._db.execute("SELECT COUNT(*) FROM search_users").fetchone()[0]
+        return {"documents": docs, "backfilled_users": users}
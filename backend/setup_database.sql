@@ -131,6 +131,25 @@ CREATE TRIGGER trg_notes_updated_at
 BEFORE UPDATE ON notes
 FOR EACH ROW EXECUTE FUNCTION set_updated_at();
 
+-- ============================================
+-- TABLE: documents (dipakai backend/api.py)
+-- Index untuk keyset pagination /api/history dan kolom preview ringan.
+-- ============================================
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = 'documents') THEN
+    CREATE INDEX IF NOT EXISTS documents_user_id_created_at_id_idx
+      ON documents(user_id, created_at DESC, id DESC);
+    IF NOT EXISTS (
+      SELECT 1 FROM information_schema.columns
+      WHERE table_name = 'documents' AND column_name = 'text_preview'
+    ) THEN
+      ALTER TABLE documents
+        ADD COLUMN text_preview TEXT GENERATED ALWAYS AS (LEFT(text, 200)) STORED;
+    END IF;
+  END IF;
+END$$;
+
 -- ============================================
 -- (Opsional) Data check
 -- ============================================
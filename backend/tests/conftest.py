@@ -0,0 +1,23 @@
+"""
+Fixture bersama untuk test backend. Jalankan dari root repo:
+
+    python -m pytest backend/tests
+
+api.py di-import dalam mode thread (tanpa eventlet monkey-patch) dengan semua database lokal diarahkan
+ke direktori sementara, tanpa Supabase dan tanpa Groq.
+"""
+import os
+import sys
+import tempfile
+
+_TMP = tempfile.mkdtemp(prefix="notaku-tests-")
+os.environ["SERVER_MODE"] = "asgi"
+for _name, _file in [("SAVE_OUTBOX_DB", "outbox.db"), ("SEARCH_INDEX_DB", "search_index.db"),
+                     ("SUMMARY_CACHE_DB", "summary_cache.db")]:
+    os.environ[_name] = os.path.join(_TMP, _file)
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_TMP, "share_tokens.db")
+for _name in ("SUPABASE_URL", "SUPABASE_KEY", "GROQ_API_KEY", "REDIS_URL", "DEV_BYPASS_AUTH"):
+    os.environ[_name] = ""
+os.environ["TRANSCRIBE_BACKEND"] = "local"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
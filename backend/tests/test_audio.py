@@ -0,0 +1,172 @@
+import math
+import threading
+import time
+from array import array
+
+import pytest
+
+import api
+import audio
+
+RATE = 16000
+
+
+def pcm(seconds: float, amplitude: int = 0, freq: float = 440.0) -> bytes:
+    n = int(seconds * RATE)
+    samples = array("h", (int(amplitude * math.sin(2 * math.pi * freq * i / RATE)) for i in range(n)))
+    return samples.tobytes()
+
+
+@pytest.fixture(autouse=True)
+def energy_vad(monkeypatch):
+    monkeypatch.setattr(audio, "VAD_BACKEND", "energy")
+
+
+def segment_audio(data: bytes, chunk: int = None):
+    segments = []
+    segmenter = audio.VoiceActivitySegmenter(RATE, segments.append)
+    chunk = chunk or len(data)
+    for i in range(0, len(data), chunk):
+        segmenter.feed(data[i:i + chunk])
+    segmenter.flush()
+    return segmenter, segments
+
+
+def test_segmenter_splits_on_silence():
+    data = pcm(0.5) + pcm(1.0, 8000) + pcm(1.0) + pcm(0.8, 8000) + pcm(1.0)
+    segmenter, segments = segment_audio(data)
+    assert [s.seq for s in segments] == [1, 2]
+    # Segmen dibuka setelah VAD_MIN_SPEECH_MS ucapan, mundur sepanjang pre-roll
+    onset = 0.5 + (audio.VAD_MIN_SPEECH_MS - audio.VAD_PREROLL_MS) / 1000
+    assert segments[0].start == pytest.approx(onset, abs=0.05)
+    assert 1.0 <= segments[0].duration <= 2.0
+    assert segmenter.seconds == pytest.approx(4.3, abs=0.05)
+
+
+def test_segmenter_same_result_for_any_chunk_size():
+    data = pcm(0.5) + pcm(1.0, 8000) + pcm(1.0)
+    _, whole = segment_audio(data)
+    _, chunked = segment_audio(data, chunk=777)
+    assert [(s.start, s.end, s.pcm) for s in whole] == [(s.start, s.end, s.pcm) for s in chunked]
+
+
+def test_segmenter_ignores_silence_and_short_clicks():
+    _, segments = segment_audio(pcm(1.0) + pcm(0.06, 8000) + pcm(1.0))
+    assert segments == []
+
+
+def test_segmenter_caps_segment_length(monkeypatch):
+    monkeypatch.setattr(audio, "VAD_MAX_SEGMENT_SECONDS", 1.0)
+    _, segments = segment_audio(pcm(0.3) + pcm(3.0, 8000))
+    assert len(segments) >= 3
+    assert all(s.duration <= 1.0 + audio.AUDIO_FRAME_MS / 1000 for s in segments)
+
+
+def test_segmenter_flush_emits_open_segment():
+    _, segments = segment_audio(pcm(0.3) + pcm(0.5, 8000))
+    assert len(segments) == 1
+
+
+def test_segmenter_rejects_zero_frame_size():
+    with pytest.raises(ValueError):
+        audio.VoiceActivitySegmenter(10, lambda segment: None)
+
+
+@pytest.mark.parametrize("value, expected", [
+    (16000, 16000), ("8000", 8000), (48000, 48000), (10, None), (96000, None), ("abc", None), (None, None),
+])
+def test_parse_sample_rate(value, expected):
+    assert audio.parse_sample_rate(value) == expected
+
+
+def test_wav_roundtrip():
+    data = pcm(0.1, 1000)
+    assert audio.wav_to_pcm16(audio.pcm16_to_wav(data, RATE)) == (data, RATE)
+
+
+def test_transcribe_rejects_invalid_sample_rate(monkeypatch):
+    monkeypatch.setenv("DEV_BYPASS_AUTH", "1")
+    client = api.app.test_client()
+    for query in ("sample_rate=10", "sample_rate=abc"):
+        resp = client.post(f"/api/audio/transcribe?{query}", data=pcm(0.1, 1000))
+        assert resp.status_code == 400
+        assert resp.get_json()["error"] == "invalid_sample_rate"
+    resp = client.post("/api/audio/transcribe", data=audio.pcm16_to_wav(pcm(0.1), 10))
+    assert resp.status_code == 400
+
+
+class BlockingTranscriber:
+    name = "blocking"
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = 0
+
+    def transcribe(self, segment):
+        self.calls += 1
+        self.release.wait(5)
+        return f"seg {segment.seq}"
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.time() + timeout
+    while not predicate():
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def test_pool_skips_cancelled_segments():
+    backend = BlockingTranscriber()
+    pool = audio.TranscriptionPool(backend, concurrency=1)
+    cancelled = threading.Event()
+    results = []
+    for seq in range(1, 5):
+        segment = audio.AudioSegment(seq, pcm(0.1), 0.0, 0.1, RATE)
+        pool.submit(segment, lambda seg, text, error: results.append((seg.seq, text, error)),
+                    cancelled=cancelled.is_set)
+    wait_for(lambda: pool.stats()["running"] == 1)
+    cancelled.set()
+    backend.release.set()
+    wait_for(lambda: len(results) == 4)
+    assert backend.calls == 1
+    stats = pool.stats()
+    assert (stats["queued"], stats["running"], stats["done"], stats["skipped"]) == (0, 0, 1, 3)
+    assert sorted(error for _, _, error in results if error) == ["cancelled"] * 3
+
+
+def test_pool_counters_consistent_under_concurrency():
+    pool = audio.TranscriptionPool(audio.LocalTranscriber(rtf=0.0), concurrency=8)
+    done = threading.Semaphore(0)
+    for seq in range(200):
+        pool.submit(audio.AudioSegment(seq, pcm(0.01), 0.0, 0.01, RATE), lambda *args: done.release())
+    for _ in range(200):
+        assert done.acquire(timeout=5)
+    wait_for(lambda: pool.stats()["running"] == 0)
+    stats = pool.stats()
+    assert (stats["queued"], stats["done"]) == (0, 200)
+
+
+def test_transcribe_timeout_skips_pending_segments(monkeypatch):
+    monkeypatch.setenv("DEV_BYPASS_AUTH", "1")
+    backend = BlockingTranscriber()
+    pool = audio.TranscriptionPool(backend, concurrency=1)
+    monkeypatch.setattr(api, "transcription_pool", pool)
+    monkeypatch.setattr(api, "TRANSCRIBE_HTTP_TIMEOUT", 0.2)
+    speech = pcm(0.5) + pcm(0.8, 8000) + pcm(1.0)
+    resp = api.app.test_client().post(f"/api/audio/transcribe?sample_rate={RATE}", data=speech * 3)
+    assert resp.status_code == 504
+    assert resp.get_json()["segments"] == 3
+    backend.release.set()
+    wait_for(lambda: pool.stats()["queued"] == 0 and pool.stats()["running"] == 0)
+    assert backend.calls == 1
+    assert pool.stats()["skipped"] == 2
+
+
+def test_create_transcriber():
+    assert isinstance(audio.create_transcriber("local"), audio.LocalTranscriber)
+    groq = audio.create_transcriber("groq", groq_client=None)
+    with pytest.raises(RuntimeError, match="groq_api_key_missing"):
+        groq.transcribe(audio.AudioSegment(1, pcm(0.1), 0.0, 0.1, RATE))
+    assert isinstance(audio.create_transcriber("audio:LocalTranscriber"), audio.LocalTranscriber)
+    with pytest.raises(ValueError):
+        audio.create_transcriber("whisper-lokal")
@@ -0,0 +1,79 @@
+import random
+
+import api
+
+VOCAB = ("rapat anggaran rilis jadwal budi ani tim server data laporan minggu depan target "
+         "progres keputusan tugas revisi klien desain uji biaya kontrak").split()
+
+
+def transcript(words: int, seed: int = 1) -> str:
+    rng = random.Random(seed)
+    return " ".join(rng.choice(VOCAB) for _ in range(words))
+
+
+def chunks(text):
+    return api.content_defined_chunks(text, min_chars=200, avg_chars=400, max_chars=800)
+
+
+def test_short_text_is_one_chunk():
+    assert chunks("halo semua") == ["halo semua"]
+    assert chunks("   ") == []
+
+
+def test_chunks_cover_text_within_bounds():
+    text = transcript(3000)
+    parts = chunks(text)
+    assert len(parts) > 5
+    assert " ".join(parts).split() == text.split()
+    # Batas dipotong di akhir kata yang melewati max_chars
+    longest_word = max(len(w) for w in VOCAB)
+    assert all(len(p) <= 800 + longest_word for p in parts)
+    assert all(len(p) >= 200 for p in parts[:-1])
+
+
+def test_edit_only_moves_nearby_boundaries():
+    text = transcript(3000)
+    words = text.split()
+    edited = " ".join(words[:50] + ["sisipan", "baru"] + words[50:])
+    before, after = chunks(text), chunks(edited)
+    # Hanya potongan di sekitar sisipan yang berubah; sisanya identik (dan bisa memakai cache)
+    assert len(set(before) - set(after)) <= 2
+    assert before[-3:] == after[-3:]
+
+
+def test_chunking_is_deterministic():
+    text = transcript(2000, seed=7)
+    assert chunks(text) == chunks(text)
+
+
+def test_reduce_groups_bounds():
+    partials = [f"notulensi parsial {i}" for i in range(40)]
+    groups = api.reduce_groups(partials, avg=3, max_chars=10_000)
+    assert [p for g in groups for p in g] == partials
+    assert all(2 <= len(g) <= 6 for g in groups[:-1])
+
+
+def test_reduce_groups_max_chars_splits_early():
+    partials = ["x" * 60 for _ in range(6)]
+    groups = api.reduce_groups(partials, avg=4, max_chars=100)
+    assert all(sum(len(p) for p in g) <= 100 for g in groups)
+    assert [p for g in groups for p in g] == partials
+
+
+def test_reduce_groups_stable_after_prepend():
+    partials = [f"notulensi parsial {i}" for i in range(40)]
+    before = api.reduce_groups(partials, avg=3, max_chars=10_000)
+    after = api.reduce_groups(["bagian baru"] + partials, avg=3, max_chars=10_000)
+    assert before[-3:] == after[-3:]
+
+
+def test_chunk_prompt_labels_part():
+    prompt = api.build_chunk_prompt("isi potongan", 2, 5)
+    assert "BAGIAN 2 dari 5" in prompt and "isi potongan" in prompt
+    assert "BAGIAN 3" in api.build_chunk_prompt("isi", 3)
+
+
+def test_reduce_prompt_numbers_partials():
+    prompt = api.build_reduce_prompt(["satu", "dua"])
+    assert "--- Notulensi parsial 1 ---\nsatu" in prompt
+    assert "--- Notulensi parsial 2 ---\ndua" in prompt
@@ -0,0 +1,70 @@
+import time
+
+import pytest
+
+import llm
+
+
+@pytest.fixture
+def gateway():
+    return llm.LLMGateway(max_concurrency=1, max_queue=10, queue_timeout=0)
+
+
+def test_round_robin_between_users(gateway):
+    assert gateway.enqueue("holder") is None
+    order = []
+    for user in ("a", "a", "a", "b", "c"):
+        gateway.enqueue(user, on_grant=lambda user=user: order.append(user))
+    for _ in range(5):
+        gateway.release()
+    # User "a" yang antri duluan tidak memonopoli slot
+    assert order == ["a", "b", "c", "a", "a"]
+    assert gateway.stats()["waiting"] == 0
+
+
+def test_position_updates(gateway):
+    positions = {}
+    gateway.enqueue("holder")
+    gateway.enqueue("a", on_position=lambda pos: positions.__setitem__("a1", pos))
+    gateway.enqueue("a", on_position=lambda pos: positions.__setitem__("a2", pos))
+    gateway.enqueue("b", on_position=lambda pos: positions.__setitem__("b", pos))
+    # b menyalip antrian kedua milik a
+    assert positions == {"a1": 1, "a2": 3, "b": 2}
+    gateway.release()
+    assert (positions["b"], positions["a2"]) == (1, 2)
+
+
+def test_queue_full_rejects():
+    gateway = llm.LLMGateway(max_concurrency=1, max_queue=1, queue_timeout=0)
+    gateway.enqueue("holder")
+    gateway.enqueue("a")
+    with pytest.raises(llm.LLMGatewayBusy):
+        gateway.enqueue("b")
+    assert gateway.stats()["rejected"] == 1
+
+
+def test_abandon_leaves_queue(gateway):
+    gateway.enqueue("holder")
+    waiter = gateway.enqueue("a")
+    assert gateway.abandon(waiter, stopped=True) is True
+    gateway.release()
+    assert not waiter.granted
+    stats = gateway.stats()
+    assert (stats["active"], stats["waiting"], stats["cancelled"]) == (0, 0, 1)
+
+
+def test_poll_times_out():
+    gateway = llm.LLMGateway(max_concurrency=1, max_queue=10, queue_timeout=0.5)
+    gateway.enqueue("holder")
+    waiter = gateway.enqueue("a")
+    assert gateway.poll(waiter, time.time()) is False
+    with pytest.raises(llm.LLMGatewayBusy, match="llm_queue_timeout"):
+        gateway.poll(waiter, time.time() - 1)
+    assert gateway.stats()["timeouts"] == 1
+
+
+def test_try_acquire_only_when_idle(gateway):
+    assert gateway.try_acquire() is True
+    assert gateway.try_acquire() is False
+    gateway.release()
+    assert gateway.stats()["active"] == 0
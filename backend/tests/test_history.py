@@ -0,0 +1,49 @@
+import base64
+import json
+
+import pytest
+
+import api
+
+DOC_ID = "7f0c4a52-3a4e-4a8e-9a57-0d6f0b9d3c11"
+
+
+def test_cursor_roundtrip():
+    row = {"created_at": "2026-01-01T10:00:00.123456+00:00", "id": DOC_ID}
+    cursor = api.encode_history_cursor(row)
+    assert "=" not in cursor
+    assert api.decode_history_cursor(cursor) == (row["created_at"], DOC_ID)
+
+
+@pytest.mark.parametrize("payload", [[1, 2], {"a": 1}, ["2026-01-01", None]])
+def test_decode_rejects_malformed(payload):
+    cursor = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+    with pytest.raises((ValueError, TypeError)):
+        api.decode_history_cursor(cursor)
+
+
+def test_decode_rejects_garbage():
+    with pytest.raises(ValueError):
+        api.decode_history_cursor("%%%bukan-cursor")
+
+
+def test_validate_normalizes():
+    created_at, doc_id = api.validate_history_cursor(("2026-01-01T10:00:00+00:00", DOC_ID.upper()))
+    assert created_at == "2026-01-01T10:00:00+00:00"
+    assert doc_id == DOC_ID
+
+
+@pytest.mark.parametrize("cursor", [
+    ("2026-01-01T10:00:00", "bukan-uuid"),
+    ('2026-01-01",id.gt."0', DOC_ID),
+    (None, DOC_ID),
+])
+def test_validate_rejects_injection(cursor):
+    with pytest.raises(ValueError):
+        api.validate_history_cursor(cursor)
+
+
+def test_keyset_filter():
+    flt = api.history_keyset_filter(("2026-01-01T10:00:00+00:00", DOC_ID))
+    assert flt == (f'created_at.lt."2026-01-01T10:00:00+00:00",'
+                   f'and(created_at.eq."2026-01-01T10:00:00+00:00",id.lt."{DOC_ID}")')
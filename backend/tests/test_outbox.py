@@ -0,0 +1,163 @@
+from types import SimpleNamespace as NS
+
+import pytest
+
+import api
+import outbox
+
+
+class FakeDocuments:
+    """Tabel documents palsu: upsert menyimpan per id, error opsional per baris atau per panggilan."""
+
+    def __init__(self):
+        self.rows = {}
+        self.calls = 0
+        self.down = False
+        self.reject_ids = set()
+
+    def table(self, name):
+        return self
+
+    def upsert(self, rows, **kwargs):
+        self._rows = rows
+        return self
+
+    def execute(self):
+        self.calls += 1
+        if self.down:
+            raise ConnectionError("connection refused")
+        bad = [r["id"] for r in self._rows if r["id"] in self.reject_ids]
+        if bad:
+            error = Exception(f"invalid row {bad[0]}")
+            error.code = "22P02"
+            raise error
+        for row in self._rows:
+            self.rows.setdefault(row["id"], row)
+        return NS(data=self._rows)
+
+
+@pytest.fixture
+def documents(monkeypatch):
+    fake = FakeDocuments()
+    monkeypatch.setattr(api, "supabase", fake)
+    monkeypatch.setattr(outbox, "OUTBOX_RETRY_BASE", 0)
+    return fake
+
+
+@pytest.fixture
+def save_outbox(tmp_path):
+    return outbox.SaveOutbox(str(tmp_path / "outbox.db"), lambda: api.supabase)
+
+
+def row(i, user="u1"):
+    return {"id": f"doc-{i}", "user_id": user, "text": "isi", "meta": {},
+            "created_at": f"2026-01-01T00:00:{i:02d}.000000Z"}
+
+
+def test_enqueue_same_id_after_flush_is_duplicate(save_outbox, documents):
+    assert save_outbox.enqueue(row(1)) is True
+    assert save_outbox.enqueue(row(1)) is False  # masih pending
+    assert save_outbox.flush_once() == 1
+    assert save_outbox.get("doc-1") is None
+    assert save_outbox.enqueue(row(1)) is False  # sudah terkirim: tetap duplikat
+
+
+def test_sent_ledger_expires(save_outbox, documents, monkeypatch):
+    save_outbox.enqueue(row(1))
+    save_outbox.flush_once()
+    monkeypatch.setattr(outbox, "OUTBOX_SENT_TTL", -1)
+    assert save_outbox.enqueue(row(1)) is True
+
+
+def test_merge_pending_history_orders_mixed_timestamp_formats(save_outbox, monkeypatch):
+    monkeypatch.setattr(api, "save_outbox", save_outbox)
+    # Pending (format /save, "Z") jatuh di antara dua baris Supabase ("+00:00", presisi berbeda)
+    save_outbox.enqueue({"id": "p1", "user_id": "u1", "text": "x", "meta": {},
+                    "created_at": "2026-01-01T10:00:00Z"})
+    page = {"history": [
+        {"id": "s1", "created_at": "2026-01-01T10:00:00.5+00:00"},
+        {"id": "s2", "created_at": "2026-01-01T09:59:59.123+00:00"},
+    ], "has_more": False}
+    merged = api.merge_pending_history(page, "u1")
+    assert [item["id"] for item in merged["history"]] == ["s1", "p1", "s2"]
+
+
+def test_merge_pending_history_respects_page_bounds(save_outbox, monkeypatch):
+    monkeypatch.setattr(api, "save_outbox", save_outbox)
+    save_outbox.enqueue({"id": "old", "user_id": "u1", "text": "x", "meta": {}, "created_at": "2026-01-01T09:00:00Z"})
+    save_outbox.enqueue({"id": "new", "user_id": "u1", "text": "x", "meta": {}, "created_at": "2026-01-01T12:00:00Z"})
+    page = {"history": [{"id": "s1", "created_at": "2026-01-01T10:00:00+00:00"}], "has_more": True}
+    # Halaman kedua (cursor jam 11): "new" milik halaman sebelumnya, "old" milik halaman berikutnya
+    merged = api.merge_pending_history(page, "u1", cursor=("2026-01-01T11:00:00.000000+00:00", "s0"))
+    assert [item["id"] for item in merged["history"]] == ["s1"]
+
+
+def test_parse_timestamp():
+    z = api.parse_timestamp("2026-01-01T10:00:00.5Z")
+    offset = api.parse_timestamp("2026-01-01T10:00:00.500000+00:00")
+    assert z == offset
+    assert api.parse_timestamp("2026-01-01T17:00:00+07:00") == api.parse_timestamp("2026-01-01T10:00:00")
+    assert api.parse_timestamp("bukan waktu") is None
+
+
+def test_outage_keeps_rows_for_retry(save_outbox, documents):
+    documents.down = True
+    for i in range(10):
+        save_outbox.enqueue(row(i))
+    assert save_outbox.flush_once() == 0
+    # Satu upsert batch + OUTBOX_OUTAGE_PROBE_ROWS percobaan per baris, sisanya langsung ditunda
+    assert documents.calls == 1 + outbox.OUTBOX_OUTAGE_PROBE_ROWS
+    stats = save_outbox.stats()
+    assert (stats["pending"], stats["retrying"], stats["dead"]) == (10, 10, 0)
+    documents.down = False
+    assert save_outbox.flush_once() == 10
+    assert save_outbox.stats()["pending"] == 0
+
+
+def test_rejected_row_does_not_block_batch(save_outbox, documents):
+    documents.reject_ids = {"doc-2"}
+    for i in range(1, 4):
+        save_outbox.enqueue(row(i))
+    assert save_outbox.flush_once() == 2
+    assert set(documents.rows) == {"doc-1", "doc-3"}
+    assert save_outbox.get("doc-2") is not None
+
+
+def test_repeated_rejection_moves_to_dead_letter(save_outbox, documents, monkeypatch):
+    monkeypatch.setattr(outbox, "OUTBOX_MAX_REJECTIONS", 3)
+    documents.reject_ids = {"doc-1"}
+    save_outbox.enqueue(row(1))
+    for _ in range(3):
+        save_outbox.flush_once()
+    stats = save_outbox.stats()
+    assert (stats["pending"], stats["dead"]) == (0, 1)
+    assert set(stats) >= {"dead", "oldest_dead"} and "dead_rows" not in stats
+    calls = documents.calls
+    assert save_outbox.flush_once() == 0  # baris dead tidak dicoba lagi
+    assert documents.calls == calls
+
+
+def test_backoff_delays_next_attempt(save_outbox, documents, monkeypatch):
+    monkeypatch.setattr(outbox, "OUTBOX_RETRY_BASE", 60)
+    documents.down = True
+    save_outbox.enqueue(row(1))
+    save_outbox.flush_once()
+    documents.down = False
+    assert save_outbox.flush_once() == 0  # belum jatuh tempo
+    assert save_outbox.stats()["retrying"] == 1
+
+
+def test_on_sent_receives_flushed_rows(tmp_path, documents):
+    sent = []
+    box = outbox.SaveOutbox(str(tmp_path / "hook.db"), lambda: api.supabase, on_sent=sent.extend)
+    box.enqueue(row(1))
+    box.enqueue(row(2))
+    box.flush_once()
+    assert sorted(r["id"] for r in sent) == ["doc-1", "doc-2"]
+
+
+def test_flush_waits_without_client(tmp_path):
+    box = outbox.SaveOutbox(str(tmp_path / "noclient.db"), lambda: None)
+    box.enqueue(row(1))
+    assert box.flush_once() == 0
+    assert box.stats()["retrying"] == 0  # tidak dihitung sebagai percobaan gagal
@@ -0,0 +1,74 @@
+import pytest
+
+import api
+
+
+def clean(text: str) -> str:
+    return api.preprocess_transcript(text).text
+
+
+@pytest.mark.parametrize("text", [
+    "Budi bayar 10 10 10 juta",
+    "angka 100 100 100",
+    "transfer 2,5 2,5 juta",
+])
+def test_dedupe_keeps_repeated_numbers(text):
+    assert clean(text) == text
+
+
+def test_dedupe_keeps_phrases_with_numbers():
+    text = "anggaran tahap satu 10 juta anggaran tahap satu 10 juta"
+    assert clean(text) == text
+
+
+def test_dedupe_keeps_short_repeated_phrase():
+    assert clean("satu dua tiga satu dua tiga empat") == "satu dua tiga satu dua tiga empat"
+
+
+def test_dedupe_drops_adjacent_restart():
+    text = ("Budi bilang progres sudah delapan puluh persen "
+            "Budi bilang progres sudah delapan puluh persen terus")
+    assert clean(text) == "Budi bilang progres sudah delapan puluh persen terus"
+
+
+def test_dedupe_keeps_phrase_repeated_later():
+    text = "jadwal rilis minggu depan lalu Ani bilang jadwal rilis minggu depan"
+    assert clean(text) == text
+
+
+def test_dedupe_stutter():
+    assert clean("jadi jadi jadi hari ini kita kita bahas") == "jadi hari ini kita bahas"
+    # Kata biasa boleh muncul dua kali berturut-turut, tidak lebih
+    assert clean("sangat sangat sangat penting") == "sangat sangat penting"
+
+
+@pytest.mark.parametrize("word", ["e", "mm"])
+def test_fillers_keep_meaningful_short_words(word):
+    assert api.strip_fillers(["tebal", "5", word]) == ["tebal", "5", word]
+
+
+@pytest.mark.parametrize("word", ["eh", "ehm", "emm", "eee", "hmm", "mmm", "uh", "um", "aah", "anu"])
+def test_fillers_removed(word):
+    assert api.strip_fillers(["kita", word, "mulai"]) == ["kita", "mulai"]
+
+
+def test_filler_sentence_end_moves_to_previous_word():
+    assert api.strip_fillers(["selesai", "hmm.", "Lanjut"]) == ["selesai.", "Lanjut"]
+
+
+def test_normalize_transcript():
+    assert api.normalize_transcript("halo  ,, dunia ... \n\n  baris") == "halo, dunia.\nbaris"
+
+
+def test_preprocess_report_counts_removed_words():
+    report = api.preprocess_transcript("eh jadi jadi kita mulai").report()
+    assert report["removed_words"] == {"fillers": 1, "dedupe": 1}
+    assert report["tokens_saved"] == report["tokens_before"] - report["tokens_after"] > 0
+
+
+def test_fit_token_budget_keeps_tail():
+    text = " ".join(f"kata{i}" for i in range(500))
+    tail = api.fit_token_budget(text, 50)
+    assert api.count_tokens(tail) <= 50
+    assert text.endswith(tail)
+    assert api.fit_token_budget("pendek saja", 50) == "pendek saja"
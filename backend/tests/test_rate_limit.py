@@ -0,0 +1,81 @@
+import pytest
+
+import llm
+
+
+def test_bucket_refills_continuously():
+    bucket = llm.TokenBucket(60)
+    now = bucket.updated
+    assert bucket.wait_time(1, now) == 0.0
+    bucket.take(60)
+    assert bucket.wait_time(1, now) == pytest.approx(1.0)
+    assert bucket.wait_time(1, now + 1.0) == pytest.approx(0.0)
+    # Refill tidak melewati kapasitas
+    bucket.wait_time(1, now + 600)
+    assert bucket.level == pytest.approx(60)
+
+
+def test_bucket_oversized_request_passes_when_full():
+    bucket = llm.TokenBucket(100)
+    assert bucket.wait_time(500, bucket.updated) == 0.0
+
+
+def test_bucket_unlimited():
+    bucket = llm.TokenBucket(0)
+    bucket.take(10_000)
+    assert bucket.wait_time(10_000, bucket.updated) == 0.0
+
+
+def test_bucket_resize_caps_level():
+    bucket = llm.TokenBucket(1000)
+    bucket.resize(100, bucket.updated)
+    assert (bucket.per_minute, bucket.level) == (100, pytest.approx(100))
+
+
+def test_limiter_applies_headroom():
+    limiter = llm.LLMRateLimiter("m", rpm=60, tpm=10_000, headroom=0.5)
+    assert (limiter.requests.per_minute, limiter.tokens.per_minute) == (30, 5000)
+
+
+def test_limiter_reserve_then_wait():
+    limiter = llm.LLMRateLimiter("m", rpm=60, tpm=1000, headroom=1.0)
+    assert limiter.reserve(1000) == 0.0
+    assert limiter.reserve(500) == pytest.approx(30.0, abs=0.1)
+
+
+def test_limiter_rejects_beyond_max_wait(monkeypatch):
+    monkeypatch.setattr(llm, "LLM_RATE_MAX_WAIT", 5)
+    limiter = llm.LLMRateLimiter("m", rpm=60, tpm=1000, headroom=1.0)
+    limiter.reserve(1000)
+    with pytest.raises(llm.LLMGatewayBusy):
+        limiter.reserve(500)
+    assert limiter.stats()["rejected"] == 1
+
+
+def test_limiter_settle_corrects_reservation():
+    limiter = llm.LLMRateLimiter("m", rpm=60, tpm=1000, headroom=1.0)
+    limiter.reserve(800)
+    limiter.settle(800, 200)
+    assert limiter.tokens.level == pytest.approx(800, abs=1)
+
+
+def test_limiter_follows_server_headers():
+    limiter = llm.LLMRateLimiter("m", rpm=0, tpm=0, headroom=0.8)
+    limiter.update({"x-ratelimit-limit-tokens": "1000", "x-ratelimit-remaining-tokens": "500"})
+    assert limiter.tokens.per_minute == pytest.approx(800)
+    # Sisa server 500 dikurangi cadangan 20% dari limit
+    assert limiter.tokens.level == pytest.approx(300, abs=1)
+
+
+def test_limiter_blocks_after_retry_after():
+    limiter = llm.LLMRateLimiter("m", rpm=60, tpm=0, headroom=1.0)
+    limiter.update({"retry-after": "2"})
+    assert limiter.blocked()
+    assert limiter.reserve(1) == pytest.approx(2.0, abs=0.1)
+
+
+def test_parse_reset_seconds():
+    assert llm._parse_reset_seconds("2m59.5s") == pytest.approx(179.5)
+    assert llm._parse_reset_seconds("120ms") == pytest.approx(0.12)
+    assert llm._parse_reset_seconds("7") == 7.0
+    assert llm._parse_reset_seconds("besok") is None
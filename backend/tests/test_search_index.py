@@ -0,0 +1,66 @@
+import pytest
+
+from search_index import SearchIndex
+
+
+def doc(doc_id, text, user="u1", created_at="2026-01-01T10:00:00Z", meta=None):
+    return {"id": doc_id, "user_id": user, "text": text, "meta": meta, "created_at": created_at}
+
+
+@pytest.fixture
+def index(tmp_path):
+    idx = SearchIndex(str(tmp_path / "search.db"))
+    idx.index_documents([
+        doc("d1", "Rapat anggaran kuartal tiga bersama tim keuangan"),
+        doc("d2", "Jadwal rilis aplikasi mundur ke minggu depan", meta={"title": "Rilis"}),
+        doc("d3", "Rapat anggaran milik user lain", user="u2"),
+    ])
+    return idx
+
+
+def ids(results):
+    return [r["id"] for r in results]
+
+
+def test_search_all_terms_and_owner_only(index):
+    assert ids(index.search("u1", "rapat anggaran", 10)) == ["d1"]
+    assert ids(index.search("u2", "rapat anggaran", 10)) == ["d3"]
+    assert index.search("u1", "rapat rilis", 10) == []
+
+
+def test_last_term_matches_prefix(index):
+    assert ids(index.search("u1", "angg", 10)) == ["d1"]
+    assert ids(index.search("u1", "jadwal ril", 10)) == ["d2"]
+
+
+def test_search_meta_and_snippet(index):
+    [hit] = index.search("u1", "Rilis", 10)
+    assert hit["id"] == "d2" and "**" in hit["snippet"]
+
+
+def test_query_syntax_is_escaped(index):
+    assert index.build_query('" OR owner : "u2') == '("OR" AND "owner" AND "u2"*)'
+    assert index.search("u1", "u2", 10) == []
+    assert index.build_query("!!!") is None
+
+
+def test_reindex_replaces_document(index):
+    index.index_documents([doc("d1", "Notulensi baru tentang kontrak")])
+    assert index.search("u1", "anggaran", 10) == []
+    assert ids(index.search("u1", "kontrak", 10)) == ["d1"]
+    assert index.stats()["documents"] == 3
+
+
+def test_prune_scoped_to_user_and_keep(index):
+    index.index_documents([doc("d4", "Draft belum terkirim anggaran")])
+    pruned = index.prune({"d2"}, user_id="u1", keep=lambda doc_id: doc_id == "d4")
+    assert pruned == 1  # d1 saja: d3 milik u2, d4 ditahan keep()
+    assert ids(index.search("u1", "anggaran", 10)) == ["d4"]
+    assert ids(index.search("u2", "anggaran", 10)) == ["d3"]
+
+
+def test_user_backfill_marker(index):
+    assert not index.is_user_backfilled("u1")
+    index.mark_user_backfilled("u1")
+    assert index.is_user_backfilled("u1")
+    assert index.is_user_backfilled("u1", max_age=60)
@@ -0,0 +1,56 @@
+import api
+
+
+def test_lru_evicts_least_recent():
+    cache = api.SummaryCache(2, ttl=60)
+    cache.put("a", "A")
+    cache.put("b", "B")
+    assert cache.get("a") == "A"  # a jadi paling baru
+    cache.put("c", "C")
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == ("A", "C")
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_expiry():
+    cache = api.SummaryCache(4, ttl=-1)
+    cache.put("a", "A")
+    assert cache.get("a") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_empty_summary_not_cached():
+    cache = api.SummaryCache(4, ttl=60)
+    cache.put("a", "")
+    assert cache.get("a") is None
+
+
+def test_get_any_counts_one_lookup():
+    cache = api.SummaryCache(4, ttl=60)
+    cache.put("model-b", "B")
+    assert cache.get_any(["model-a", "model-b"]) == "B"
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 0)
+
+
+def test_sqlite_survives_restart(tmp_path):
+    path = str(tmp_path / "cache.db")
+    api.SummaryCache(4, ttl=60, db_path=path).put("a", "A")
+    reopened = api.SummaryCache(4, ttl=60, db_path=path)
+    assert reopened.get("a") == "A"
+    assert reopened.stats()["persistent_hits"] == 1
+    assert reopened.get("a") == "A"  # sekarang dari LRU
+    assert reopened.stats()["persistent_hits"] == 1
+
+
+def test_sqlite_tables_are_separate(tmp_path):
+    path = str(tmp_path / "cache.db")
+    api.SummaryCache(4, ttl=60, db_path=path).put("k", "ringkasan")
+    chunks = api.SummaryCache(4, ttl=60, db_path=path, table="chunk_summary_cache")
+    assert chunks.get("k") is None
+
+
+def test_cache_key_normalizes_whitespace():
+    assert api.summary_cache_key("halo  dunia\n", "rapat", "m") == api.summary_cache_key("halo dunia", "RAPAT", "m")
+    assert api.summary_cache_key("halo dunia", "rapat", "m1") != api.summary_cache_key("halo dunia", "rapat", "m2")
+    assert api.chunk_summary_key("x", "rapat", model="m") != api.summary_cache_key("x", "rapat", "m")
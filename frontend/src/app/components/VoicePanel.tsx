@@ -363,6 +363,14 @@ export default function VoicePanel({ apiBase = "" }: Props) {
           return;
         }
 
+        // Transkrip panjang / antrian server: progres dikirim sebelum token pertama
+        if (data?.progress || data?.queue) {
+          if (firstTokenTimer.current) {
+            clearTimeout(firstTokenTimer.current);
+            firstTokenTimer.current = null;
+          }
+        }
+
         if (data?.token) {
           if (!gotFirstToken.current) {
             gotFirstToken.current = true;